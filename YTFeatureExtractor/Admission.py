@@ -0,0 +1,212 @@
+import os
+import threading
+from typing import Dict, Iterable, List
+
+# peak memory a task adds to its worker: a fixed part plus bytes per second of audio for
+# decoding and for each feature key (measured on float64 runs, melodia estimated)
+TASK_MEMORY_BASE = 64 * 1024 ** 2
+DECODE_MEMORY_PER_SECOND = 600 * 1024
+FEATURE_MEMORY_PER_SECOND = {
+    "cqt_20": 150 * 1024,
+    "cqt_ch": 700 * 1024,
+    "cens": 1600 * 1024,
+    "onset_env": 550 * 1024,
+    "melodia": 2048 * 1024,
+}
+
+# idle footprint of a warm worker until its RSS has been observed
+WORKER_MEMORY = 300 * 1024 ** 2
+
+# duration of tracks that cannot be probed (eg. not downloaded yet) until others are seen
+DEFAULT_DURATION = 300.0
+
+
+def set_memory_budget(budget: str):
+    """Configure the memory budget of the extraction workers for this process and the workers it
+    spawns.
+    Args:
+        budget (str): gigabytes, "auto" (90% of the available memory) or None to keep the
+            environment configuration
+    """
+    if budget:
+        if budget != "auto":
+            float(budget)
+        os.environ["YTFE_MEMORY_BUDGET"] = str(budget)
+
+
+def get_memory_budget():
+    """Memory budget in bytes configured by YTFE_MEMORY_BUDGET, None if not set."""
+    budget = os.environ.get("YTFE_MEMORY_BUDGET")
+    if not budget:
+        return None
+    if budget == "auto":
+        available = _meminfo("MemAvailable")
+        return int(0.9 * available) if available else None
+    return int(float(budget) * 1024 ** 3)
+
+
+def _meminfo(key: str):
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith(key + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _proc_status(key: str):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(key + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Reset the peak RSS of this process (Linux), so peak_rss measures from here on.
+    Returns:
+        int: current RSS in bytes, None if unknown
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+    return _proc_status("VmRSS")
+
+
+def peak_rss():
+    """Peak RSS of this process in bytes since the last reset_peak_rss (Linux), else since start."""
+    peak = _proc_status("VmHWM")
+    if peak is None:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return peak
+
+
+def _probe_duration(path: str):
+    # duration from the file header (or the PCM cache), None if not on disk
+    from YTFeatureExtractor.Audio import find_audio, get_duration, get_pcm_cache
+    audio_path = find_audio(path)
+    return get_duration(audio_path, get_pcm_cache()) if audio_path else None
+
+
+class AdmissionController(object):
+    """Admits tasks to the workers while the idle worker footprints plus the estimated peaks of the
+    running tasks stay within a memory budget. A task that exceeds the budget on its own runs
+    when nothing else does. Estimates come from the track duration and the feature keys, scaled
+    by a correction factor learned from the measured peaks (see TaskResult.memory): it follows
+    underestimates at once and overestimates slowly.
+    Args:
+        budget (int): memory budget in bytes
+        workers (int): worker processes
+        smoothing (float, optional): weight of a new measurement when lowering the factor. Defaults to 0.2.
+    """
+    def __init__(self, budget: int, workers: int, smoothing: float = 0.2) -> None:
+        self.budget = budget
+        self.workers = workers
+        self.smoothing = smoothing
+        self.factor = 1.0
+        self.worker_rss = {}
+        self._durations = {}
+        self._in_flight = {}
+        self._lock = threading.Condition()
+
+    def model(self, input_path: str, feat_keys: List[str]):
+        """Estimated peak bytes of a task before correction."""
+        duration = self._duration(input_path)
+        per_second = DECODE_MEMORY_PER_SECOND + sum(FEATURE_MEMORY_PER_SECOND.get(k, 0) for k in feat_keys)
+        return TASK_MEMORY_BASE + duration * per_second
+
+    def estimate(self, item):
+        """Estimated peak bytes of a task, or a chunk of tasks run one after the other."""
+        tasks = self._tasks(item)
+        return max(self.factor * self.model(task.input_path, task.feat_keys) for task in tasks) if tasks else 0
+
+    def try_acquire(self, item):
+        """Admit a task (or chunk) if it fits the budget.
+        Returns:
+            bool: whether it was admitted
+        """
+        self._probe(task.input_path for task in self._tasks(item))
+        with self._lock:
+            return self._admit(item)
+
+    def acquire(self, item):
+        """Block until a task (or chunk) fits the budget and admit it."""
+        self._probe(task.input_path for task in self._tasks(item))
+        with self._lock:
+            self._lock.wait_for(lambda: self._admit(item))
+
+    def release(self, item, results: List = ()):
+        """Release an admitted task (or chunk) and learn from the memory its results report.
+        Args:
+            item (Task | List[Task]): admitted task or chunk
+            results (List[TaskResult], optional): results of the tasks. Defaults to ().
+        """
+        # probe again, the files may have been downloaded by the tasks
+        durations = {result.input_path: _probe_duration(result.input_path) for result in results if result.success}
+        with self._lock:
+            self._durations.update(durations)
+            self._in_flight.pop(id(item), None)
+            for result in results:
+                self._observe(result)
+            self._lock.notify_all()
+
+    def _admit(self, item):
+        estimate = self.estimate(item)
+        used = sum(self._in_flight.values()) + self._idle_workers_rss()
+        if self._in_flight and used + estimate > self.budget:
+            return False
+        self._in_flight[id(item)] = estimate
+        return True
+
+    def _idle_workers_rss(self):
+        known = list(self.worker_rss.values())
+        return sum(known) + max(0, self.workers - len(known)) * WORKER_MEMORY
+
+    def _observe(self, result):
+        memory = result.memory
+        if not memory or memory.get("peak") is None or memory.get("rss") is None:
+            return
+        self.worker_rss.pop(memory["pid"], None)
+        self.worker_rss[memory["pid"]] = memory["rss"]
+        # keep the footprints of the most recent workers (maxtasksperchild replaces them)
+        while len(self.worker_rss) > self.workers:
+            self.worker_rss.pop(next(iter(self.worker_rss)))
+        if not result.success:
+            return
+        model = self.model(result.input_path, result.feat_keys)
+        ratio = max(0, memory["peak"] - memory["rss"]) / model
+        self.factor = max(ratio, (1 - self.smoothing) * self.factor + self.smoothing * ratio)
+
+    @staticmethod
+    def _tasks(item):
+        return item if isinstance(item, list) else [item]
+
+    def _probe(self, paths: Iterable[str]):
+        # file headers are read without holding the lock, which release needs
+        durations = {path: _probe_duration(path) for path in paths if path not in self._durations}
+        with self._lock:
+            for path, duration in durations.items():
+                self._durations.setdefault(path, duration)
+
+    def _duration(self, path: str):
+        if path not in self._durations:
+            self._durations[path] = _probe_duration(path)
+        duration = self._durations[path]
+        if duration is None:
+            known = [d for d in self._durations.values() if d is not None]
+            duration = sorted(known)[len(known) // 2] if known else DEFAULT_DURATION
+        return duration
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"budget": self.budget, "factor": self.factor, "in_flight": sum(self._in_flight.values()),
+                    "worker_rss": dict(self.worker_rss)}
+
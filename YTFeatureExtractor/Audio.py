@@ -0,0 +1,450 @@
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import librosa
+import numpy as np
+from typing import Iterable, Iterator
+from YTFeatureExtractor.Metrics import stage
+
+
+class PCMCache(object):
+    """Persistent cache of decoded float32 PCM as memory-mappable files.
+    Files are sharded like the mp3 directory (key[:2]/key.pcm) and start with a header
+    holding magic, sampling rate and number of samples. A file is only valid if its
+    size matches the header, and it is written to a temporary file and renamed into
+    place, so a partial write is never read as audio. When the total size exceeds
+    max_bytes, the least recently used files are evicted. The total is counted once by
+    scanning the directory and then kept up to date with this instance's writes; as other
+    processes write to the cache too, it is rescanned after each RESCAN_FRACTION of
+    max_bytes written.
+    Args:
+        cache_dir (str): cache root directory
+        max_bytes (int, optional): size limit of the cache. Defaults to None (unbounded).
+    """
+    MAGIC = b"YTPCM001"
+    HEADER = struct.Struct("<8sIQ")
+    RESCAN_FRACTION = 0.1
+
+    def __init__(self, cache_dir: str, max_bytes: int = None) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._size = None
+        self._written = 0
+
+    def get_path(self, key: str):
+        return os.path.join(self.cache_dir, key[:2], key + ".pcm")
+
+    def get(self, key: str, sr: int):
+        """Memory-map cached audio.
+        Args:
+            key (str): track key (eg. youtube identifier)
+            sr (int): expected sampling rate
+        Returns:
+            np.memmap: waveform or None if missing or invalid
+        """
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as f:
+                magic, file_sr, length = self.HEADER.unpack(f.read(self.HEADER.size))
+            if magic != self.MAGIC or os.path.getsize(path) != self.HEADER.size + 4 * length:
+                logging.warning(f"Invalid PCM cache file {path}")
+                self._remove(path)
+                return None
+            if file_sr != sr:
+                return None
+            os.utime(path)
+            if length == 0:
+                return np.zeros(0, dtype=np.float32)
+            return np.memmap(path, dtype=np.float32, mode="r", offset=self.HEADER.size, shape=(length,))
+        except (OSError, struct.error):
+            return None
+
+    def put(self, key: str, y: np.array, sr: int):
+        """Store audio atomically and evict old files if the cache is too large.
+        Args:
+            key (str): track key (eg. youtube identifier)
+            y (np.array): waveform
+            sr (int): sampling rate
+        """
+        self.put_blocks(key, [y], sr)
+
+    def put_blocks(self, key: str, blocks: Iterable[np.array], sr: int):
+        """Store audio arriving in blocks (see stream_decode) without holding it in memory.
+        Args:
+            key (str): track key (eg. youtube identifier)
+            blocks (Iterable[np.array]): consecutive waveform blocks
+            sr (int): sampling rate
+        Returns:
+            bool: audio stored
+        """
+        path = self.get_path(key)
+        tmp_path = None
+        length = 0
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.HEADER.pack(self.MAGIC, sr, 0))
+                for y in blocks:
+                    y = np.ascontiguousarray(y, dtype=np.float32)
+                    f.write(y.tobytes())
+                    length += len(y)
+                f.seek(0)
+                f.write(self.HEADER.pack(self.MAGIC, sr, length))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not cache PCM for {key}: {e}")
+            if tmp_path:
+                self._remove(tmp_path)
+            return False
+        if self._size is not None:
+            self._size += self.HEADER.size + 4 * length
+            self._written += self.HEADER.size + 4 * length
+        self.evict()
+        return True
+
+    def evict(self):
+        """Remove least recently used files until the cache fits into max_bytes."""
+        if self.max_bytes is None:
+            return
+        if (self._size is not None and self._size <= self.max_bytes and
+                self._written <= self.RESCAN_FRACTION * self.max_bytes):
+            return
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith(".pcm"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+        self._size = sum(size for _, size, _ in files)
+        self._written = 0
+        for _, size, path in sorted(files):
+            if self._size <= self.max_bytes:
+                break
+            self._remove(path)
+            self._size -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# audio files looked up for a nominal input path (<yt_id>.mp3), eg. kept in their native
+# container by the native download mode (see Download.set_audio_format)
+AUDIO_EXTENSIONS = [".mp3", ".opus", ".ogg", ".webm", ".m4a", ".aac", ".flac", ".wav"]
+
+
+def find_audio(path: str):
+    """Actual audio file of a nominal input path: the path itself or the same name with
+    another audio extension.
+    Returns:
+        str: existing audio file or None
+    """
+    if os.path.isfile(path):
+        return path
+    base = os.path.splitext(path)[0]
+    for extension in AUDIO_EXTENSIONS:
+        if os.path.isfile(base + extension):
+            return base + extension
+    return None
+
+
+def set_pcm_cache(cache_dir: str, max_bytes: int = None):
+    """Configure the PCM cache for this process and the workers it spawns.
+    Args:
+        cache_dir (str): cache root directory, None keeps the environment configuration
+        max_bytes (int, optional): size limit of the cache. Defaults to None (unbounded).
+    """
+    if cache_dir:
+        os.environ["YTFE_PCM_CACHE_DIR"] = cache_dir
+        os.environ.pop("YTFE_PCM_CACHE_MAX_BYTES", None)
+        if max_bytes:
+            os.environ["YTFE_PCM_CACHE_MAX_BYTES"] = str(int(max_bytes))
+
+
+_pcm_cache = None
+_pcm_cache_pid = None
+
+
+def get_pcm_cache():
+    """PCMCache configured by YTFE_PCM_CACHE_DIR and YTFE_PCM_CACHE_MAX_BYTES, if any. The
+    cache is shared within a process (so its size is only counted once) until the
+    configuration changes.
+    Returns:
+        PCMCache: cache or None
+    """
+    global _pcm_cache, _pcm_cache_pid
+    cache_dir = os.environ.get("YTFE_PCM_CACHE_DIR")
+    if not cache_dir:
+        return None
+    max_bytes = os.environ.get("YTFE_PCM_CACHE_MAX_BYTES")
+    max_bytes = int(max_bytes) if max_bytes else None
+    if (_pcm_cache is None or _pcm_cache_pid != os.getpid() or _pcm_cache.cache_dir != cache_dir or
+            _pcm_cache.max_bytes != max_bytes):
+        _pcm_cache, _pcm_cache_pid = PCMCache(cache_dir, max_bytes), os.getpid()
+    return _pcm_cache
+
+
+class AudioProvider(object):
+    """Decodes an audio file once and serves it at any requested sampling rate.
+    The file is decoded lazily at the canonical rate sr, other rates are resampled
+    from the decoded signal and cached per rate.
+    Args:
+        path (str, optional): audio file path (eg. mp3). Defaults to None.
+        sr (int, optional): canonical sampling rate. Defaults to 22050.
+        y (np.array, optional): already decoded waveform at rate sr. Defaults to None.
+        cache (PCMCache, optional): decoded audio cache, keyed by file name. Defaults to None.
+    """
+    def __init__(self, path: str = None, sr: int = 22050, y: np.array = None, cache: PCMCache = None) -> None:
+        if path is None and y is None:
+            raise ValueError("Either path or y is required")
+        self.path = path
+        self.sr = sr
+        self.cache = cache
+        self._signals = {}
+        if y is not None:
+            self._signals[sr] = y
+
+    def load(self):
+        """Decode the file at the canonical rate (if not done yet).
+        Returns:
+            Tuple[np.array, int]: waveform and canonical sampling rate
+        """
+        if self.sr not in self._signals:
+            key = os.path.splitext(os.path.basename(self.path))[0]
+            y = self.cache.get(key, self.sr) if self.cache else None
+            if y is None:
+                y, _ = librosa.load(self.path, sr=self.sr)
+                if self.cache:
+                    self.cache.put(key, y, self.sr)
+            self._signals[self.sr] = y
+        return self._signals[self.sr], self.sr
+
+    def get(self, sr: int = None, cache: bool = True):
+        """Get the waveform at sampling rate sr.
+        Args:
+            sr (int, optional): sampling rate. Defaults to the canonical rate.
+            cache (bool, optional): keep a resampled signal for later calls. Defaults to True.
+        Returns:
+            np.array: waveform
+        """
+        sr = sr or self.sr
+        if sr in self._signals:
+            return self._signals[sr]
+        y, _ = self.load()
+        if sr == self.sr:
+            return y
+        with stage("resample", sr=sr):
+            y = librosa.resample(y, orig_sr=self.sr, target_sr=sr)
+        if cache:
+            self._signals[sr] = y
+        return y
+
+    def release(self, sr: int = None):
+        """Drop cached signals; the canonical one only if sr is given explicitly.
+        Args:
+            sr (int, optional): rate to drop. Defaults to all non-canonical rates.
+        """
+        if sr is not None:
+            self._signals.pop(sr, None)
+        else:
+            self._signals = {rate: y for rate, y in self._signals.items() if rate == self.sr}
+
+
+class StreamedAudio(object):
+    """AudioProvider counterpart for tracks too long to hold in memory: the file is decoded
+    block by block into PCM files (the PCM cache if given, else a scratch directory) and
+    signals are served as np.memmap, resampled block by block as well. Call close() to
+    remove the scratch files; signals must not be used afterwards.
+    Args:
+        path (str): audio file path (eg. mp3)
+        sr (int, optional): canonical sampling rate. Defaults to 22050.
+        cache (PCMCache, optional): decoded audio cache, keyed by file name. Defaults to None.
+    """
+    def __init__(self, path: str, sr: int = 22050, cache: PCMCache = None) -> None:
+        self.path = path
+        self.sr = sr
+        self.cache = cache
+        self.key = os.path.splitext(os.path.basename(path))[0]
+        self._scratch = None
+        self._signals = {}
+
+    def _store(self, key: str, blocks: Iterable[np.array], sr: int):
+        # the shared cache may be read-only or evict the file right away, the scratch directory may not
+        if self.cache is not None and sr == self.sr:
+            y = self.cache.get(key, sr)
+            if y is None and self.cache.put_blocks(key, blocks, sr):
+                y = self.cache.get(key, sr)
+            if y is not None:
+                return y
+            blocks = stream_decode(self.path, sr)
+        if self._scratch is None:
+            self._scratch = PCMCache(tempfile.mkdtemp(prefix="ytfe_pcm_"))
+        if not self._scratch.put_blocks(f"{key}.{sr}", blocks, sr):
+            raise OSError(f"Could not write decoded audio to {self._scratch.cache_dir}")
+        return self._scratch.get(f"{key}.{sr}", sr)
+
+    def load(self):
+        """Decode the file at the canonical rate (if not done yet).
+        Returns:
+            Tuple[np.memmap, int]: waveform and canonical sampling rate
+        """
+        if self.sr not in self._signals:
+            self._signals[self.sr] = self._store(self.key, stream_decode(self.path, self.sr), self.sr)
+        return self._signals[self.sr], self.sr
+
+    def get(self, sr: int = None, cache: bool = True):
+        """Get the waveform at sampling rate sr (cache is accepted for AudioProvider compatibility)."""
+        sr = sr or self.sr
+        if sr not in self._signals:
+            y, _ = self.load()
+            blocks = (y[i:i + 2 ** 18] for i in range(0, len(y), 2 ** 18))
+            with stage("resample", sr=sr, streamed=True):
+                self._signals[sr] = self._store(self.key, resample_blocks(blocks, self.sr, sr), sr)
+        return self._signals[sr]
+
+    def release(self, sr: int = None):
+        if sr is not None:
+            self._signals.pop(sr, None)
+
+    def close(self):
+        self._signals = {}
+        if self._scratch is not None:
+            shutil.rmtree(self._scratch.cache_dir, ignore_errors=True)
+            self._scratch = None
+
+
+def set_streaming(min_seconds: float):
+    """Decode and extract tracks longer than min_seconds in blocks with bounded memory
+    (see StreamedAudio), in this process and the workers it spawns."""
+    if min_seconds is not None:
+        os.environ["YTFE_STREAM_SECONDS"] = str(min_seconds)
+
+
+def use_streaming(path: str, cache: PCMCache = None):
+    """Whether the track at path is longer than YTFE_STREAM_SECONDS (never if unset)."""
+    min_seconds = os.environ.get("YTFE_STREAM_SECONDS")
+    if not min_seconds:
+        return False
+    duration = get_duration(path, cache)
+    return duration is not None and duration > float(min_seconds)
+
+
+def get_duration(path: str, cache: PCMCache = None):
+    """Duration in seconds from the PCM cache header or the file header, without decoding.
+    Returns:
+        float: duration or None if unknown
+    """
+    if cache is not None:
+        try:
+            with open(cache.get_path(os.path.splitext(os.path.basename(path))[0]), "rb") as f:
+                magic, sr, length = cache.HEADER.unpack(f.read(cache.HEADER.size))
+            if magic == cache.MAGIC and sr:
+                return length / sr
+        except (OSError, struct.error):
+            pass
+    import audioread
+    import soundfile as sf
+    try:
+        return sf.info(path).duration
+    except RuntimeError:
+        pass
+    try:
+        with audioread.audio_open(path) as f:
+            return f.duration
+    except Exception:
+        return None
+
+
+def decode_bytes(data: bytes, sr: int = 22050):
+    """Decode encoded audio (eg. mp3, wav, flac, ogg) from memory, downmixed to mono and
+    resampled to sr like librosa.load. Formats libsndfile cannot read are piped through ffmpeg,
+    which resamples itself (results differ slightly from librosa.load for those).
+    Args:
+        data (bytes): encoded audio
+        sr (int, optional): target sampling rate. Defaults to 22050.
+    Returns:
+        np.array: float32 waveform
+    """
+    import io
+    import soundfile as sf
+    try:
+        y, native_sr = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    except RuntimeError:
+        import subprocess
+        out = subprocess.run(["ffmpeg", "-v", "error", "-i", "pipe:0", "-f", "f32le", "-ac", "1", "-ar", str(sr),
+                              "pipe:1"], input=data, capture_output=True, check=True)
+        return np.frombuffer(out.stdout, dtype=np.float32).copy()
+    y = y.mean(axis=1)
+    if native_sr != sr:
+        y = librosa.resample(y, orig_sr=native_sr, target_sr=sr)
+    return y
+
+
+def stream_decode(path: str, sr: int = 22050, block_size: int = 2 ** 18) -> Iterator[np.array]:
+    """Decode an audio file block by block, downmixed to mono and resampled to sr like
+    librosa.load (soundfile, else audioread, and soxr_hq resampling), in bounded memory.
+    Args:
+        path (str): audio file path (eg. mp3)
+        sr (int, optional): target sampling rate. Defaults to 22050.
+        block_size (int, optional): native samples decoded at once. Defaults to 2 ** 18.
+    Yields:
+        np.array: consecutive float32 waveform blocks
+    """
+    import audioread
+    import soundfile as sf
+    try:
+        f = sf.SoundFile(path)
+    except RuntimeError:
+        f = None
+    if f is not None:
+        with f:
+            native_sr = f.samplerate
+            blocks = (block.mean(axis=1) for block in f.blocks(block_size, dtype="float32", always_2d=True))
+            yield from resample_blocks(blocks, native_sr, sr)
+        return
+    # formats libsndfile cannot read, as librosa.load falls back to audioread
+    with audioread.audio_open(path) as f:
+        channels = f.channels
+        blocks = (librosa.util.buf_to_float(buf, dtype=np.float32).reshape(-1, channels).mean(axis=1)
+                  for buf in f)
+        yield from resample_blocks(blocks, f.samplerate, sr)
+
+
+def resample_blocks(blocks: Iterable[np.array], orig_sr: int, target_sr: int) -> Iterator[np.array]:
+    """Resample a block stream with a streaming soxr resampler (continuous across blocks),
+    fixing the total length to ceil(n * target_sr / orig_sr) like librosa.resample.
+    Args:
+        blocks (Iterable[np.array]): consecutive waveform blocks at orig_sr
+        orig_sr (int): input sampling rate
+        target_sr (int): output sampling rate
+    Yields:
+        np.array: consecutive float32 waveform blocks at target_sr
+    """
+    if orig_sr == target_sr:
+        yield from (np.asarray(block, dtype=np.float32) for block in blocks)
+        return
+    import soxr
+    resampler = soxr.ResampleStream(orig_sr, target_sr, 1, dtype="float32", quality="soxr_hq")
+    n_in, n_out = 0, 0
+    for block in blocks:
+        n_in += len(block)
+        out = resampler.resample_chunk(np.asarray(block, dtype=np.float32))
+        n_out += len(out)
+        if len(out):
+            yield out
+    expected = int(np.ceil(n_in * target_sr / orig_sr))
+    out = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+    out = out[:max(0, expected - n_out)]
+    yield np.pad(out, (0, max(0, expected - n_out - len(out))))
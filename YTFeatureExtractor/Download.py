@@ -1,26 +1,63 @@
 
 import logging
-import yt_dlp
+import os
+import shutil
+
+AUDIO_FORMATS = ["mp3", "native"]
+
+
+def set_audio_format(audio_format: str):
+    """Configure how downloads are stored, in this process and the workers it spawns: "mp3"
+    (transcoded to 192 kbps) or "native" (the downloaded stream in its own container, eg. opus
+    or m4a, found by Audio.find_audio and decoded directly).
+    Args:
+        audio_format (str): audio format, None keeps the environment configuration
+    """
+    if audio_format:
+        if audio_format not in AUDIO_FORMATS:
+            raise ValueError(f"Unknown audio format {audio_format}, expected one of {AUDIO_FORMATS}")
+        os.environ["YTFE_AUDIO_FORMAT"] = audio_format
+
+
+def get_audio_format():
+    """Audio format configured by YTFE_AUDIO_FORMAT, "mp3" if not set."""
+    return os.environ.get("YTFE_AUDIO_FORMAT") or "mp3"
 
 
 def download(yt_id: str, outpath: str):
-    """Downloads video identified by yt_id into output path.
+    """Downloads video identified by yt_id into output path. In the native audio format (see
+    set_audio_format) the audio stream is only remuxed, and the file gets its actual extension
+    instead of the one of outpath.
     Args:
         yt_id (str): youtube identifier
         outpath (str): output path
     Returns:
         bool: flag indicating successful download
     """
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'outtmpl': outpath.replace(".mp3", ""),
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192'
-
-        }],
-    }
+    # imported on first download, extraction-only workers never pay for it
+    import yt_dlp
+    base = os.path.splitext(outpath)[0]
+    if get_audio_format() == "native":
+        # "best" copies the stream out of the video container (webm holding opus becomes .opus)
+        ydl_opts = {
+            'format': 'bestaudio/best',
+            'outtmpl': base + '.%(ext)s',
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'best',
+            }],
+        }
+    else:
+        ydl_opts = {
+            'format': 'bestaudio/best',
+            'outtmpl': base,
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'mp3',
+                'preferredquality': '192'
+
+            }],
+        }
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             return ydl.download([f'https://www.youtube.com/watch?v={yt_id}'])
@@ -28,3 +65,34 @@ def download(yt_id: str, outpath: str):
 
         logging.error(f'{yt_id} could not be downloaded')
         return False
+
+
+class LocalDownloader(object):
+    """Stand-in for download that copies audio from a local directory, eg. for tests and
+    benchmarks without network access. Files are looked up as <yt_id><ext> or
+    <yt_id[:2]>/<yt_id><ext> in source_dir, with the extension of the output path first and
+    then any of Audio.AUDIO_EXTENSIONS, which the copy keeps like a native download.
+    Args:
+        source_dir (str): directory with audio files
+    """
+    def __init__(self, source_dir: str) -> None:
+        self.source_dir = source_dir
+
+    def __call__(self, yt_id: str, outpath: str):
+        """Copy audio identified by yt_id into output path.
+        Args:
+            yt_id (str): youtube identifier
+            outpath (str): output path
+        Returns:
+            bool: flag indicating successful download
+        """
+        from YTFeatureExtractor.Audio import AUDIO_EXTENSIONS
+        base, extension = os.path.splitext(os.path.basename(outpath))
+        for ext in [extension] + [e for e in AUDIO_EXTENSIONS if e != extension]:
+            for path in [os.path.join(self.source_dir, base + ext), os.path.join(self.source_dir, yt_id[:2], base + ext)]:
+                if os.path.isfile(path):
+                    os.makedirs(os.path.dirname(outpath) or ".", exist_ok=True)
+                    shutil.copyfile(path, os.path.splitext(outpath)[0] + ext)
+                    return True
+        logging.error(f'{yt_id} could not be downloaded')
+        return False
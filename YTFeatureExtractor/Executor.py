@@ -0,0 +1,449 @@
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import traceback
+from itertools import islice
+from multiprocessing import Pipe, cpu_count
+from multiprocessing.connection import wait as connection_wait
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from YTFeatureExtractor.Admission import AdmissionController, get_memory_budget, peak_rss, reset_peak_rss
+from YTFeatureExtractor.Audio import find_audio
+from YTFeatureExtractor.Download import download
+from YTFeatureExtractor.Helper import (ExtractionError, extract_file, fetch_file, get_yt_id, import_requirements,
+                                       outstanding_features)
+from YTFeatureExtractor.Metrics import emit
+from YTFeatureExtractor.Writer import WriterHandle, get_writer_handle, set_writer_handle, start_writer, worker_jobs
+
+# sampling rate of the PyCqt kernel used by a feature key
+WARM_KERNELS = {"cqt_ch": 16000}
+
+# seconds past its time limit after which the worker of a task is killed (see WorkerPool)
+KILL_GRACE = 5.0
+
+
+class Task(NamedTuple):
+    """Extraction of one track."""
+    input_path: str
+    output_path: str
+    feat_keys: List[str]
+    force: bool = False
+    downloader: Callable = download
+
+
+class TaskResult(NamedTuple):
+    """Outcome of a Task. reason is None on success, else an ExtractionError reason,
+    "timeout" or "exception". timings hold seconds per stage (fetch, extract, total),
+    failed_keys the failed feature keys for reason feature_error, memory the worker's pid,
+    its RSS at the start of the task and its peak RSS during the task in bytes, audio_path
+    the actual audio file (eg. <yt_id>.opus for native downloads), None if not on disk,
+    write_job the id of the features handed to the writer process (see AsyncWriter), if any, or
+    for a task whose worker died whichever that worker handed over (see worker_jobs)."""
+    input_path: str
+    output_path: str
+    success: bool
+    reason: Optional[str]
+    message: str
+    timings: Dict[str, float]
+    feat_keys: Tuple[str, ...] = ()
+    failed_keys: Tuple[str, ...] = ()
+    memory: Optional[Dict[str, int]] = None
+    audio_path: Optional[str] = None
+    write_job: Optional[str] = None
+
+    @property
+    def yt_id(self):
+        return get_yt_id(self.input_path)
+
+
+class TaskTimeout(BaseException):
+    """Raised inside a task exceeding its time limit. Derives from BaseException so the
+    per-feature error handling does not swallow it."""
+
+
+_timeout = None
+
+
+def init_worker(feat_keys: List[str] = None, timeout: float = None, writer: WriterHandle = None):
+    """Pool initializer: imports the libraries the requested features need and builds the CQT
+    kernels once per worker.
+    Args:
+        feat_keys (List[str], optional): feature keys to warm up for. Defaults to None (all).
+        timeout (float, optional): per-task time limit in seconds. Defaults to None.
+        writer (WriterHandle, optional): writer process for the features. Defaults to None (inline writes).
+    """
+    global _timeout
+    _timeout = timeout
+    set_writer_handle(writer)
+    import_requirements(feat_keys)
+    for feat_key, sample_rate in WARM_KERNELS.items():
+        if feat_keys is None or feat_key in feat_keys:
+            from YTFeatureExtractor.PyCQT import get_cqt_kernel
+            get_cqt_kernel(sample_rate)
+
+
+def _raise_timeout(signum, frame):
+    raise TaskTimeout()
+
+
+def run_task(task: Task, timeout: float = None, fetch: bool = True, extract: bool = True):
+    """Download (if needed) and extract one track, never raising. Tracks whose features are all
+    present and up to date are neither downloaded nor decoded.
+    The time limit is enforced with SIGALRM, so it needs the main thread of the process and
+    interrupts native library calls only once they return to Python; run_tasks kills workers
+    stuck past it (see WorkerPool).
+    Args:
+        task (Task): task to run
+        timeout (float, optional): time limit in seconds. Defaults to the worker setting.
+        fetch (bool, optional): run the download stage. Defaults to True.
+        extract (bool, optional): run the extraction stage. Defaults to True.
+    Returns:
+        TaskResult: structured result
+    """
+    timeout = timeout if timeout is not None else _timeout
+    timings = {}
+    reason, message, failed_keys, cause = None, "", [], None
+    use_alarm = bool(timeout) and threading.current_thread() is threading.main_thread()
+    rss = reset_peak_rss()
+    start = time.perf_counter()
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        # no download if every feature in the output is present and up to date
+        if fetch and not task.force and not outstanding_features(task.output_path, get_yt_id(task.input_path),
+                                                                 task.feat_keys):
+            fetch = False
+        if fetch:
+            fetch_file(task.input_path, task.force, task.downloader, strict=True)
+            timings["fetch"] = time.perf_counter() - start
+        if extract:
+            extract_file(task.input_path, task.output_path, task.feat_keys, task.force, strict=True)
+            timings["extract"] = time.perf_counter() - start - timings.get("fetch", 0.0)
+    except ExtractionError as e:
+        reason, message, failed_keys, cause = e.reason, str(e), e.feat_keys, e.__cause__
+    except TaskTimeout:
+        reason, message = "timeout", f"Exceeded {timeout}s"
+    except Exception as e:
+        reason, message = "exception", "".join(traceback.format_exception_only(type(e), e)).strip()
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+        write_job = get_writer_handle().take() if get_writer_handle() is not None else None
+    timings["total"] = time.perf_counter() - start
+    if reason is not None:
+        logging.error(f"{get_yt_id(task.input_path)} failed ({reason}): {message}", exc_info=cause)
+    memory = {"pid": os.getpid(), "rss": rss, "peak": peak_rss()}
+    return TaskResult(task.input_path, task.output_path, reason is None, reason, message, timings,
+                      tuple(task.feat_keys), tuple(failed_keys), memory, find_audio(task.input_path), write_job)
+
+
+def run_tasks(tasks: Iterable[Task], workers: int = None, chunksize: int = 1, maxtasksperchild: int = None,
+              timeout: float = None, feat_keys: List[str] = None, packed: bool = False) -> Iterator[TaskResult]:
+    """Run tasks in a WorkerPool (or in this process for workers=1 without a time limit).
+    Args:
+        tasks (Iterable[Task]): tasks to run
+        workers (int, optional): worker processes. Defaults to cpu_count().
+        chunksize (int, optional): tasks sent to a worker at once. Defaults to 1.
+        maxtasksperchild (int, optional): tasks after which a worker is replaced, contains leaks in
+            native libraries. Defaults to None (never).
+        timeout (float, optional): per-task time limit in seconds, a worker still busy KILL_GRACE
+            seconds later is killed and replaced. Defaults to None.
+        feat_keys (List[str], optional): feature keys to warm the workers up for. Defaults to None (all).
+        packed (bool, optional): tasks are lists of Tasks, each sent to a worker at once. Defaults to False.
+    Yields:
+        TaskResult: results in completion order
+    Tasks are admitted to the workers within the memory budget (see set_memory_budget) if one is set.
+    With an asynchronous writer (see set_async_writer) results are yielded once their features are written.
+    """
+    writer = start_writer()
+    if writer is None:
+        yield from _run_pool(tasks, workers, chunksize, maxtasksperchild, timeout, feat_keys, packed, None)
+        return
+    with writer:
+        yield from writer.merge(_run_pool(tasks, workers, chunksize, maxtasksperchild, timeout, feat_keys, packed,
+                                          writer.handle))
+
+
+def _run_pool(tasks: Iterable, workers: int, chunksize: int, maxtasksperchild: int, timeout: float,
+              feat_keys: List[str], packed: bool, writer: WriterHandle):
+    workers = workers or cpu_count()
+    if workers == 1 and not timeout:
+        init_worker(feat_keys, timeout, writer)
+        try:
+            for task in tasks:
+                for t in (task if packed else [task]):
+                    yield run_task(t, timeout)
+        finally:
+            set_writer_handle(None)
+        return
+    budget = get_memory_budget()
+    admission = AdmissionController(budget, workers) if budget else None
+    if not packed and not admission and chunksize > 1:
+        tasks = _chunks(tasks, chunksize)
+    with WorkerPool(workers, (feat_keys, timeout, writer), maxtasksperchild, timeout) as pool:
+        # submit tasks (or chunks) one by one, each once a worker is free and its memory estimate fits the budget
+        for item in tasks:
+            while not pool.idle() or (admission is not None and not admission.try_acquire(item)):
+                yield from _collect(pool, admission)
+            pool.submit(item)
+        while pool.busy():
+            yield from _collect(pool, admission)
+
+
+def _chunks(tasks: Iterable[Task], chunksize: int):
+    tasks = iter(tasks)
+    while True:
+        chunk = list(islice(tasks, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _collect(pool: "WorkerPool", admission: AdmissionController = None):
+    results, finished = pool.wait()
+    if admission is not None:
+        for item, item_results in finished:
+            admission.release(item, item_results)
+    return results
+
+
+class _Worker(object):
+    # a worker process of a WorkerPool and the item it runs
+    def __init__(self, initargs: Tuple, run_kwargs: Dict, context=None) -> None:
+        self.conn, child = Pipe()
+        self.process = (context or multiprocessing).Process(target=_worker_main, args=(child, initargs, run_kwargs),
+                                                            daemon=True)
+        self.process.start()
+        child.close()
+        self.item = None
+        self.tasks = []
+        self.results = []
+        self.started = None
+        self.deadline = None
+        self.count = 0
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+def _worker_main(conn, initargs: Tuple, run_kwargs: Dict):
+    # runs the items the parent sends, reporting the start and the result of each task
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    init_worker(*initargs)
+    while True:
+        tasks = conn.recv()
+        if tasks is None:
+            break
+        for task in tasks:
+            conn.send(("start", time.time()))
+            conn.send(("result", run_task(task, **run_kwargs)))
+    conn.close()
+
+
+class WorkerPool(object):
+    """Worker processes whose per-task time limits are enforced by the parent. run_task stops a
+    task at its time limit with SIGALRM, which interrupts Python code only; a worker stuck in a
+    native call (essentia, numba, a decoder) is killed KILL_GRACE seconds later, its task fails
+    with reason "timeout", and a new worker takes its place and runs the rest of its chunk. A
+    worker that dies (eg. of a segfault) fails its task with reason "exception" likewise.
+    Workers exit once their items are done, so the features they handed to a writer process
+    (see AsyncWriter) are flushed.
+    Args:
+        workers (int): worker processes
+        initargs (Tuple, optional): init_worker arguments (feature keys, time limit, writer). Defaults to ().
+        maxtasksperchild (int, optional): tasks after which a worker is replaced. Defaults to None (never).
+        timeout (float, optional): per-task time limit in seconds. Defaults to None.
+        run_kwargs (Dict, optional): further run_task arguments (fetch, extract). Defaults to None.
+        context (optional): multiprocessing context starting the workers, eg. spawn when other threads
+            may hold locks at a fork. Defaults to None (the default start method).
+    """
+    def __init__(self, workers: int, initargs: Tuple = (), maxtasksperchild: int = None,
+                 timeout: float = None, run_kwargs: Dict = None, context=None) -> None:
+        self.workers = workers
+        self.initargs = initargs
+        self.maxtasksperchild = maxtasksperchild
+        self.timeout = timeout
+        self.run_kwargs = run_kwargs or {}
+        self.context = context
+        self._workers = []
+
+    def __enter__(self):
+        self._workers = [self._start() for _ in range(self.workers)]
+        return self
+
+    def __exit__(self, exc_type, *args):
+        for worker in self._workers:
+            if exc_type is None:
+                worker.stop()
+                worker.process.join()
+                worker.conn.close()
+            else:
+                worker.kill()
+        self._workers = []
+
+    def idle(self):
+        """Whether a worker is free for another item."""
+        return any(worker.item is None for worker in self._workers)
+
+    def busy(self):
+        """Whether any item is still running."""
+        return any(worker.item is not None for worker in self._workers)
+
+    def submit(self, item):
+        """Hand a task (or a list of tasks, run one after the other) to a free worker."""
+        worker = next(worker for worker in self._workers if worker.item is None)
+        if not worker.process.is_alive():
+            worker.kill()
+            worker = self._replace(worker)
+        worker.item = item
+        worker.tasks = list(item) if isinstance(item, list) else [item]
+        worker.results = []
+        worker.conn.send(worker.tasks)
+
+    def wait(self, timeout: float = None):
+        """Block until results arrive or a worker is killed at its deadline.
+        Args:
+            timeout (float, optional): seconds after which to return without results. Defaults to None.
+        Returns:
+            Tuple[List[TaskResult], List[Tuple]]: new results, and finished items with all their results
+        """
+        until = time.time() + timeout if timeout is not None else None
+        while True:
+            busy = [worker for worker in self._workers if worker.item is not None]
+            deadlines = [worker.deadline for worker in busy if worker.deadline is not None]
+            deadlines += [until] if until is not None else []
+            wait_for = max(0.0, min(deadlines) - time.time()) if deadlines else None
+            ready = set(connection_wait([worker.conn for worker in busy] +
+                                        [worker.process.sentinel for worker in busy], wait_for))
+            results, finished = [], []
+            for worker in busy:
+                try:
+                    while worker.conn in ready and worker.conn.poll():
+                        kind, value = worker.conn.recv()
+                        if kind == "start":
+                            worker.started = value
+                            worker.deadline = value + self.timeout + KILL_GRACE if self.timeout else None
+                        else:
+                            self._record(worker, value, results, finished)
+                except (EOFError, OSError):
+                    pass
+                if worker.item is None:
+                    continue
+                if worker.process.sentinel in ready and not worker.process.is_alive():
+                    code = worker.process.exitcode
+                    self._fail(worker, "exception", f"Worker {worker.process.pid} died with exit code {code}",
+                               results, finished)
+                elif worker.deadline is not None and time.time() >= worker.deadline:
+                    self._fail(worker, "timeout", f"Exceeded {self.timeout}s, worker {worker.process.pid} killed",
+                               results, finished)
+            if results or (until is not None and time.time() >= until):
+                return results, finished
+
+    def _record(self, worker: _Worker, result: TaskResult, results: List, finished: List):
+        worker.results.append(result)
+        worker.deadline = None
+        worker.count += 1
+        results.append(result)
+        if len(worker.results) == len(worker.tasks):
+            finished.append((worker.item, worker.results))
+            worker.item = None
+            if self.maxtasksperchild and worker.count >= self.maxtasksperchild:
+                worker.stop()
+                worker.process.join()
+                worker.conn.close()
+                self._replace(worker)
+
+    def _fail(self, worker: _Worker, reason: str, message: str, results: List, finished: List):
+        task = worker.tasks[len(worker.results)]
+        logging.error(f"{get_yt_id(task.input_path)} failed ({reason}): {message}")
+        elapsed = time.time() - worker.started if worker.started is not None else 0.0
+        # the worker may have handed the features of the task to a writer before it was killed
+        writer = self.initargs[2] if len(self.initargs) > 2 else None
+        result = TaskResult(task.input_path, task.output_path, False, reason, message, {"total": elapsed},
+                            tuple(task.feat_keys), write_job=worker_jobs(worker.process.pid) if writer else None)
+        worker.kill()
+        replacement = self._replace(worker)
+        replacement.item, replacement.tasks, replacement.results = worker.item, worker.tasks, worker.results
+        self._record(replacement, result, results, finished)
+        # the rest of the chunk runs on the new worker
+        if replacement.item is not None:
+            replacement.conn.send(replacement.tasks[len(replacement.results):])
+
+    def _start(self):
+        return _Worker(self.initargs, self.run_kwargs, self.context)
+
+    def _replace(self, worker: _Worker):
+        replacement = self._start()
+        self._workers[self._workers.index(worker)] = replacement
+        return replacement
+
+
+def add_executor_args(parser):
+    """Add the executor options to an argparse parser."""
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes with --parallel (default: all cores).')
+    parser.add_argument('--chunksize', type=int, default=1,
+                        help='Tasks handed to a worker at once.')
+    parser.add_argument('--maxtasksperchild', type=int, default=None,
+                        help='Replace a worker after this many tasks.')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Time limit per track in seconds.')
+    parser.add_argument('--schedule', type=str, default='input', choices=['input', 'longest'],
+                        help='Task order: as listed or longest tracks first (durations probed from file headers).')
+    parser.add_argument('--pack', action="store_true",
+                        help='Hand tasks to workers in chunks of about equal estimated cost instead of --chunksize.')
+    parser.add_argument('--memory_budget', type=str, default=None,
+                        help='Memory budget of the workers in GB or "auto" (90%% of the available memory).')
+    parser.add_argument('--results', type=str, default=None,
+                        help='Write per-track results as JSON lines to this file.')
+    parser.add_argument('--metrics', type=str, default=None,
+                        help='Write per-stage timing events and a Prometheus textfile summary to this directory.')
+    parser.add_argument('--metrics_interval', type=float, default=60,
+                        help='Seconds between metrics summaries.')
+    parser.add_argument('--async_writer', type=int, default=None,
+                        help='Write features in a dedicated process, with this many tracks queued for it.')
+    parser.add_argument('--fsync', type=str, default=None, choices=["none", "file", "batch"],
+                        help='fsync outputs once written: per file, per writer batch or not at all (default).')
+    return parser
+
+
+def summarize(results: Iterable[TaskResult], results_path: str = None, append: bool = False):
+    """Log a summary of task results and optionally write them as JSON lines. Each result is
+    recorded as track event for the metrics (see Metrics.MetricsReporter).
+    Args:
+        results (Iterable[TaskResult]): task results
+        results_path (str, optional): JSON lines output file. Defaults to None.
+        append (bool, optional): append to the output file instead of replacing it. Defaults to False.
+    Returns:
+        Dict[str, int]: number of results per outcome ("success" or failure reason)
+    """
+    counts = {}
+    out = open(results_path, "a" if append else "w") if results_path else None
+    try:
+        for result in results:
+            key = "success" if result.success else result.reason
+            counts[key] = counts.get(key, 0) + 1
+            emit("track", yt_id=result.yt_id, success=result.success, reason=result.reason,
+                 seconds=result.timings.get("total"))
+            if out is not None:
+                record = result._asdict()
+                record["yt_id"] = result.yt_id
+                out.write(json.dumps(record) + "\n")
+    finally:
+        if out is not None:
+            out.close()
+    logging.info(f"Results: {counts}")
+    return counts
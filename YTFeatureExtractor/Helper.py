@@ -1,58 +1,178 @@
-import h5py
+import hashlib
+import importlib
+import json
 import os
 import logging
+# librosa loads its submodules lazily; PyCqt (scipy), SBBC (essentia), h5py and the
+# sharded store are imported where first needed, so importing Helper stays cheap
 import librosa
 import numpy as np
-from YTFeatureExtractor.PyCQT import PyCqt
-from YTFeatureExtractor.SBBC import SBBC
+from YTFeatureExtractor.Audio import (AudioProvider, StreamedAudio, decode_bytes, find_audio, get_pcm_cache,
+                                      use_streaming)
 from YTFeatureExtractor.Download import download
+from YTFeatureExtractor.Metrics import stage
+from YTFeatureExtractor.Planner import FeaturePlan, Node
+from YTFeatureExtractor.Precision import cast, get_precision, real_dtype
+from YTFeatureExtractor.Storage import format_policy, get_storage_policy, write_feature
+from YTFeatureExtractor.Writer import WriterHandle, get_fsync, get_writer_handle, sync_output
 from typing import List
 
 FEAT_KEYS = ["cqt_ch", "cqt_20", "cens", "onset_env", "melodia"]
+# bump a version when the output of its feature changes, so reruns and manifests recompute it
+FEAT_VERSIONS = {feat_key: "1" for feat_key in FEAT_KEYS}
+# extractor parameters recorded with each dataset, together with precision and codec
+FEAT_PARAMS = {
+    "cqt_ch": {"sr": 16000, "hop": 0.04, "bins_per_octave": 12, "fmin": 32},
+    "cqt_20": {"sr": 22050, "hop": 512, "bins": 84, "bins_per_octave": 12, "mean_size": 20},
+    "cens": {"sr": 22050, "hop": 512, "bins": 252, "bins_per_octave": 36},
+    "onset_env": {"sr": 22050, "hop": 512, "n_fft": 2048, "n_mels": 128},
+    # segment stitching depends on the track, it is recorded per dataset (see dataset_attrs)
+    "melodia": {"sr": 22050, "hop": 512},
+}
 
 
-def process_file(input_file: str, output_file: str, feat_keys: List[str], force=False):
+def process_file(input_file: str, output_file: str, feat_keys: List[str], force=False, downloader=download):
     """Get features for audio file at input_file path and write into output file. If the input_file is not
     on disk, it gets downloaded and extracted afterwards.
     Args:
-        input_file (str): input file path (mp3)
+        input_file (str): input file path (<yt_id>.mp3, or the same name with the extension of a native download)
         output_file (str): output file path with extracted features (h5)
         feat_keys (List[str]): feature type keys (eg. cqt_20, cqt_ch)
         force (bool, optional): Whether to force redownload. Defaults to False.
+        downloader (Callable, optional): download function (yt_id, outpath). Defaults to download.
 
     Returns:
         bool: successful extraction
     """
-    yt_id = os.path.basename(input_file).replace(".mp3", "")
+    print(f"Processing: {get_yt_id(input_file)}")
+    if not force and not outstanding_features(output_file, get_yt_id(input_file), feat_keys):
+        print("All features up to date.")
+        return True
+    if not fetch_file(input_file, force, downloader):
+        return False
+    return extract_file(input_file, output_file, feat_keys, force)
+
+
+def get_yt_id(input_file: str):
+    return os.path.splitext(os.path.basename(input_file))[0]
+
+
+class ExtractionError(Exception):
+    """Failure to process a track. The reason is one of FAILURE_REASONS.
+    Args:
+        reason (str): failure reason
+        message (str, optional): details. Defaults to "".
+        feat_keys (List[str], optional): failed feature keys for reason feature_error. Defaults to None.
+    """
+    def __init__(self, reason: str, message: str = "", feat_keys: List[str] = None) -> None:
+        super().__init__(f"{reason}: {message}" if message else reason)
+        self.reason = reason
+        self.message = message
+        self.feat_keys = feat_keys or []
 
-    print(f"Processing: {yt_id}")
 
-    # if mp3 file not on disk, download it
-    if not os.path.isfile(input_file) or force:
+FAILURE_REASONS = ["unavailable", "download_error", "decode_error", "hdf_error", "feature_error"]
+
+
+def __fail(reason: str, message: str, strict: bool, feat_keys: List[str] = None, cause: Exception = None):
+    # the cause is chained (strict) or logged with its traceback, not only its message
+    if strict:
+        raise ExtractionError(reason, message, feat_keys) from cause
+    logging.error(message, exc_info=cause)
+    return False
+
+
+def fetch_file(input_file: str, force=False, downloader=download, strict: bool = False):
+    """Make sure the audio for input_file is available, downloading it if needed (I/O bound stage).
+    Args:
+        input_file (str): input file path (mp3, see find_audio for other containers)
+        force (bool, optional): Whether to force redownload. Defaults to False.
+        downloader (Callable, optional): download function (yt_id, outpath). Defaults to download.
+        strict (bool, optional): Raise ExtractionError instead of returning False. Defaults to False.
+    Returns:
+        bool: audio available
+    """
+    yt_id = get_yt_id(input_file)
+    pcm_cache = get_pcm_cache()
+
+    # if mp3 file not on disk (nor decoded in the PCM cache), download it
+    cached = pcm_cache is not None and os.path.isfile(pcm_cache.get_path(yt_id))
+    if (find_audio(input_file) is None and not cached) or force:
         try:
-            download(yt_id, input_file)
-            if not os.path.isfile(input_file):
-                logging.error(f"Video {yt_id} unavailable!")
-                return False
+            with stage("download", yt_id=yt_id):
+                downloader(yt_id, input_file)
         except Exception as e:
-            logging.exception(f"Video {yt_id} could not be downloaded!", str(e))
-            return False
-    
-    # load mp3
-    try:
-        y, sr = librosa.load(input_file, sr=22050)
-    except Exception as e:
-        logging.exception(f"MP3 {yt_id}.mp3 could not be loaded with Librosa!", str(e))
-        return False
-    
-    # extract features
+            return __fail("download_error", f"Video {yt_id} could not be downloaded! {e}", strict, cause=e)
+        if find_audio(input_file) is None:
+            return __fail("unavailable", f"Video {yt_id} unavailable!", strict)
+    return True
+
+
+def extract_file(input_file: str, output_file: str, feat_keys: List[str], force=False, strict: bool = False):
+    """Extract features of an available audio file into output file (CPU bound stage).
+    Args:
+        input_file (str): input file path (mp3, see find_audio for other containers)
+        output_file (str): output file path with extracted features (h5)
+        feat_keys (List[str]): feature type keys (eg. cqt_20, cqt_ch)
+        force (bool, optional): Whether to force re-extraction. Defaults to False.
+        strict (bool, optional): Raise ExtractionError instead of returning False. Defaults to False.
+    Returns:
+        bool: successful extraction of all feature types
+    """
+    yt_id = get_yt_id(input_file)
+    if not force and not outstanding_features(output_file, yt_id, feat_keys):
+        return True
+
+    # load audio once, other sampling rates are derived from it; long tracks are decoded block by block.
+    # native downloads (opus, m4a) are decoded directly, only the PCM cache may hold the audio instead
+    audio_file = find_audio(input_file) or input_file
+    pcm_cache = get_pcm_cache()
+    if use_streaming(audio_file, pcm_cache):
+        audio = StreamedAudio(audio_file, sr=22050, cache=pcm_cache)
+    else:
+        audio = AudioProvider(audio_file, sr=22050, cache=pcm_cache)
     try:
-        with h5py.File(output_file, "a") as file_out:
-            
-            for feat_key in feat_keys:
-                extract_feature(y, sr, input_file, feat_key, file_out, force)
-    except:
-        logging.error(f"HDF file error {yt_id}")
+        try:
+            with stage("decode", yt_id=yt_id):
+                audio.load()
+        except Exception as e:
+            return __fail("decode_error", f"Audio {os.path.basename(audio_file)} could not be loaded with Librosa! {e}", strict, cause=e)
+
+        # extract features, handing them to the writer process if there is one (block-wise streamed
+        # tracks are written as they go)
+        writer = get_writer_handle()
+        if writer is not None and not isinstance(audio, StreamedAudio):
+            failed = submit_features(audio, feat_keys, output_file, yt_id, force, writer)
+        else:
+            try:
+                with open_output(output_file, yt_id) as file_out:
+                    failed = extract_features(audio, feat_keys, file_out, force)
+                if get_fsync() != "none":
+                    sync_output(output_file)
+            except Exception as e:
+                return __fail("hdf_error", f"HDF file error {yt_id}: {e}", strict, cause=e)
+    finally:
+        if isinstance(audio, StreamedAudio):
+            audio.close()
+    if failed:
+        return __fail("feature_error", f"Features {', '.join(failed)} failed for {yt_id}", strict, failed)
+    return True
+
+
+def open_output(output_file: str, yt_id: str):
+    """Open the feature output of a track: the configured sharded store or else its own h5 file.
+    Args:
+        output_file (str): output file path (h5)
+        yt_id (str): youtube identifier
+    Returns:
+        h5py.File: file (or file-like TrackView of the store) to use as context manager
+    """
+    if os.environ.get("YTFE_FEATURE_STORE"):
+        from YTFeatureExtractor.Store import get_feature_store
+        return get_feature_store().track(yt_id)
+    import h5py
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    return h5py.File(output_file, "a")
 
 
 def extract_cqt_20(y: np.array, sr: int = 22_050):
@@ -63,17 +183,25 @@ def extract_cqt_20(y: np.array, sr: int = 22_050):
     Returns:
         np.array: cqt spectogram of type cqt_20
     """
-
-    def downsampling(cqt: np.array, mean_size: int = 20):
-        cqt = np.abs(cqt)
-        height, length = cqt.shape
-        new_cqt = np.zeros((height, int(length / mean_size)), dtype=np.float64)
-        for i in range(int(length / mean_size)):
-            new_cqt[:, i] = cqt[:, i * mean_size:(i + 1) * mean_size].mean(axis=1)
-        return new_cqt
     return downsampling(librosa.cqt(y=y, sr=sr))
 
 
+def downsampling(cqt: np.array, mean_size: int = 20):
+    """Average cqt magnitudes over non-overlapping blocks of mean_size frames.
+    Args:
+        cqt (np.array): cqt spectogram
+        mean_size (int, optional): frames per block. Defaults to 20.
+    Returns:
+        np.array: downsampled magnitude spectogram
+    """
+    cqt = np.abs(cqt)
+    height, length = cqt.shape
+    new_cqt = np.zeros((height, int(length / mean_size)), dtype=real_dtype())
+    for i in range(int(length / mean_size)):
+        new_cqt[:, i] = cqt[:, i * mean_size:(i + 1) * mean_size].mean(axis=1)
+    return new_cqt
+
+
 def extract_cqt_ch(y: np.array, sr: int = 16_000, hop_size: float = 0.04):
     """Extract cqt features as used by CoverHunter.
     Args:
@@ -83,67 +211,290 @@ def extract_cqt_ch(y: np.array, sr: int = 16_000, hop_size: float = 0.04):
     Returns:
         bool: cqt spectogram of type cqt_ch
     """
+    from YTFeatureExtractor.PyCQT import PyCqt
     y = y / max(0.001, np.max(np.abs(y))) * 0.999
     py_cqt = PyCqt(sample_rate=sr, hop_size=hop_size)
     cqt = py_cqt.compute_cqt(signal_float=y, feat_dim_first=False)
     return cqt
 
-def extract_feature(y: np.array, sr: int, mp3_path: str, feat_key: str, file_out: str, force: bool = False):
-    """_summary_
+# Shared intermediates: the STFT magnitude feeds the tuning estimation of the chroma
+# CQT and the mel spectrogram. Inputs are the AudioProvider audio and its canonical y, sr.
+INTERMEDIATES = [
+    Node("y_16k", ["audio"], lambda audio: audio.get(16000, cache=False), ["soxr"]),
+    Node("stft_mag", ["y"], lambda y: np.abs(librosa.stft(y=y, n_fft=2048, hop_length=512)), ["librosa.core"]),
+    Node("tuning_36", ["stft_mag", "sr"],
+         lambda S, sr: librosa.estimate_tuning(S=S, sr=sr, bins_per_octave=36), ["librosa.core"]),
+    Node("cqt_mag", ["y", "sr"], lambda y, sr: np.abs(librosa.cqt(y=y, sr=sr)), ["librosa.core"]),
+    Node("cqt_chroma", ["y", "sr", "tuning_36"],
+         lambda y, sr, tuning: np.abs(librosa.cqt(y=y, sr=sr, hop_length=512, n_bins=7 * 36,
+                                                  bins_per_octave=36, tuning=tuning)), ["librosa.core"]),
+    Node("mel_db", ["stft_mag", "sr"],
+         lambda S, sr: librosa.power_to_db(librosa.feature.melspectrogram(S=S ** 2, sr=sr)), ["librosa.feature"]),
+]
+
+# registry of feature extractors: requires lists the modules each one imports lazily
+FEATURES = [
+    Node("cqt_20", ["cqt_mag"], downsampling),
+    Node("cqt_ch", ["y_16k"], lambda y: extract_cqt_ch(y), ["YTFeatureExtractor.PyCQT"]),
+    Node("cens", ["cqt_chroma", "sr"],
+         lambda C, sr: librosa.feature.chroma_cens(C=C, sr=sr, hop_length=512), ["librosa.feature"]),
+    Node("onset_env", ["mel_db", "sr"], lambda S, sr: librosa.onset.onset_strength(S=S, sr=sr), ["librosa.onset"]),
+    Node("melodia", ["y", "sr"], lambda y, sr: __extract_melody(y, sr, "melodia"),
+         ["YTFeatureExtractor.SBBC", "essentia.standard"]),
+]
+
+NODES = {node.name: node for node in INTERMEDIATES + FEATURES}
+
+
+def register_feature(node: Node, version: str = "1", params: dict = None):
+    """Add a feature extractor (or replace one) in the registry.
     Args:
-        y (np.array): audio signal waveform
-        sr (int): sampling rate
-        mp3_path (str): path to mp3
-        feat_key (str): feature type key (eg. cqt_20, cqt_ch,...)
-        file_out (str): output filepath
-        force (bool, optional): Whether to force redownload. Defaults to False.
+        node (Node): extractor, its name is the feature key
+        version (str, optional): feature version for manifests. Defaults to "1".
+        params (dict, optional): extractor parameters recorded with the datasets. Defaults to None.
+    """
+    NODES[node.name] = node
+    if node.name not in FEAT_KEYS:
+        FEAT_KEYS.append(node.name)
+    FEAT_VERSIONS[node.name] = version
+    FEAT_PARAMS[node.name] = dict(params or {})
+
+
+def feature_attrs(feat_key: str):
+    """Dataset attributes identifying how a feature is computed: the extractor version and its
+    parameters with the configured precision and codec. A stored feature whose attributes differ
+    is stale.
+    Returns:
+        Dict[str, str]: version and params (JSON) attributes
+    """
+    params = dict(FEAT_PARAMS.get(feat_key, {}), precision=get_precision(),
+                  codec=format_policy(get_storage_policy(feat_key)))
+    return {"version": str(FEAT_VERSIONS.get(feat_key)), "params": json.dumps(params, sort_keys=True)}
+
+
+def dataset_attrs(feat_key: str):
+    """Attributes to write with a feature just computed in this thread: feature_attrs and, for
+    melodia, the segmentation of the track (see SBBC.last_segmentation), which is not compared
+    by is_stale.
+    Returns:
+        Dict[str, str]: dataset attributes
+    """
+    attrs = feature_attrs(feat_key)
+    if feat_key == "melodia":
+        from YTFeatureExtractor.SBBC import last_segmentation
+        segmentation = last_segmentation()
+        if segmentation is not None:
+            attrs["segmentation"] = segmentation
+    return attrs
+
+
+def feature_version(feat_key: str):
+    """Version of a feature for manifests: its extractor version and a digest of its parameters."""
+    attrs = feature_attrs(feat_key)
+    return f"{attrs['version']}-{hashlib.sha1(attrs['params'].encode()).hexdigest()[:8]}"
+
+
+def is_stale(file_out: "h5py.File", feat_key: str):
+    """Whether a stored feature was computed by another extractor version or with other
+    parameters. Features written before versions were recorded count as stale."""
+    attrs = file_out[feat_key].attrs
+    return any(attrs.get(name) != value for name, value in feature_attrs(feat_key).items())
+
+
+def outstanding_features(output_file: str, yt_id: str, feat_keys: List[str]):
+    """Feature keys missing or stale in the output of a track, read without decoding any audio.
+    Args:
+        output_file (str): output file path (h5)
+        yt_id (str): youtube identifier
+        feat_keys (List[str]): feature type keys
+    Returns:
+        List[str]: feature type keys to extract
     """
-    if force and feat_key in file_out.keys():
-        del file_out[feat_key]
-        print(f"Deleted {feat_key}")
+    if os.environ.get("YTFE_FEATURE_STORE"):
+        file_out = open_output(output_file, yt_id)
+        return [k for k in feat_keys if k not in file_out or is_stale(file_out, k)]
+    if not os.path.isfile(output_file):
+        return list(feat_keys)
+    import h5py
+    try:
+        with h5py.File(output_file, "r") as file_out:
+            return [k for k in feat_keys if k not in file_out or is_stale(file_out, k)]
+    except OSError:
+        return list(feat_keys)
+
 
-    if not feat_key in file_out.keys():
-        
+def import_requirements(feat_keys: List[str] = None):
+    """Import the modules needed by feature keys ahead of time, eg. in pool initializers.
+    Args:
+        feat_keys (List[str], optional): feature type keys. Defaults to all.
+    Returns:
+        List[str]: modules that could not be imported
+    """
+    missing = []
+    for module in FeaturePlan(FEAT_KEYS if feat_keys is None else feat_keys, NODES).requires():
         try:
-            if feat_key not in ["melodia", "crepe"]:
-                feature = __extract(y, sr, feat_key)
-            else:
-                feature = __extract_path(mp3_path, feat_key)
-            file_out.create_dataset(feat_key, data=feature, compression='gzip')
-        except Exception as e:
-            logging.error(f"Exception {e} for {feat_key}")
+            importlib.import_module(module)
+        except ImportError as e:
+            logging.warning(f"{module} not available: {e}")
+            missing.append(module)
+    return missing
+
+
+def extract_features(audio: AudioProvider, feat_keys: List[str], file_out: "h5py.File", force: bool = False):
+    """Extract all missing feature types into file_out, sharing intermediates between them.
+    Args:
+        audio (AudioProvider): decoded audio, or StreamedAudio to extract block by block
+        feat_keys (List[str]): feature type keys (eg. cqt_20, cqt_ch,...)
+        file_out (h5py.File): output file
+        force (bool, optional): Whether to force re-extraction. Defaults to False.
+    Returns:
+        List[str]: feature type keys that failed
+    """
+    if isinstance(audio, StreamedAudio):
+        from YTFeatureExtractor.Streaming import extract_features_streaming
+        return extract_features_streaming(audio, feat_keys, file_out, force)
+    pending, failed = pending_features(feat_keys, file_out, force)
+    for feat_key, feature, error in compute_features(audio, pending):
+        if error is None:
+            try:
+                with stage("write", feat_key=feat_key):
+                    write_feature(file_out, feat_key, feature, attrs=dataset_attrs(feat_key))
+            except Exception as e:
+                logging.error(f"Exception {e} for {feat_key}")
+                error = e
+        if error is not None:
+            failed.append(feat_key)
+        print(f"Extracted {feat_key} feature")
+    return failed
 
+
+def submit_features(audio: AudioProvider, feat_keys: List[str], output_file: str, yt_id: str, force: bool,
+                    writer: WriterHandle):
+    """Compute the missing (or stale) feature types and hand them to the writer process, which
+    replaces existing datasets. Write failures are reported with the task result (see AsyncWriter).
+    Returns:
+        List[str]: feature type keys that failed to compute
+    """
+    pending = list(feat_keys) if force else outstanding_features(output_file, yt_id, feat_keys)
+    failed = [feat_key for feat_key in pending if feat_key not in NODES]
+    for feat_key in failed:
+        logging.error(f"Unknown feature key {feat_key}")
+    features, attrs = {}, {}
+    for feat_key, feature, error in compute_features(audio, [k for k in pending if k in NODES]):
+        if error is None:
+            features[feat_key] = feature
+            attrs[feat_key] = dataset_attrs(feat_key)
+        else:
+            failed.append(feat_key)
         print(f"Extracted {feat_key} feature")
+    if features:
+        writer.submit(yt_id, output_file, features, attrs, failed)
+    return failed
 
-    else:
-        print(f"{feat_key} feature already in file.")
 
-def __extract_path(mp3_path: str, feat_key: List[str]):
-    """Extract SBBC features.
+def compute_features(audio: AudioProvider, feat_keys: List[str]):
+    """Compute feature types in memory, sharing intermediates between them.
     Args:
-        mp3_path (str): mp3 file path
-        feat_key (List[str]): list of feature keys
+        audio (AudioProvider): decoded audio
+        feat_keys (List[str]): known feature type keys (see NODES)
+    Yields:
+        Tuple[str, np.array, Exception]: feature key, feature (None on failure), exception (None on success)
+    """
+    y, sr = audio.load()
+    for feat_key, feature, error in FeaturePlan(feat_keys, NODES).run(audio=audio, y=y, sr=sr):
+        yield feat_key, None if error is not None else cast(feature), error
+
+
+def extract_array(y: np.array, sr: int, feat_keys: List[str], strict: bool = True):
+    """Extract features from a waveform in memory, without any file I/O.
+    Args:
+        y (np.array): mono waveform
+        sr (int): sampling rate of y, resampled to 22050 if different
+        feat_keys (List[str]): feature type keys (eg. cqt_20, cqt_ch)
+        strict (bool, optional): Raise ExtractionError (feature_error) if a feature fails, else
+            leave it out. Defaults to True.
     Returns:
-        np.array: Extracted features.
+        Dict[str, np.array]: features by feature key
+    """
+    y = np.asarray(y, dtype=np.float32)
+    if sr != 22050:
+        y = librosa.resample(y, orig_sr=sr, target_sr=22050)
+    unknown = [feat_key for feat_key in feat_keys if feat_key not in NODES]
+    features, failed = {}, list(unknown)
+    for feat_key, feature, error in compute_features(AudioProvider(sr=22050, y=y),
+                                                     [k for k in feat_keys if k in NODES]):
+        if error is None:
+            features[feat_key] = feature
+        else:
+            failed.append(feat_key)
+    if failed:
+        __fail("feature_error", f"Features {', '.join(failed)} failed", strict, failed)
+    return features
+
+
+def extract_bytes(data: bytes, feat_keys: List[str], strict: bool = True):
+    """Extract features from encoded audio (eg. the bytes of an mp3) in memory.
+    Args:
+        data (bytes): encoded audio
+        feat_keys (List[str]): feature type keys (eg. cqt_20, cqt_ch)
+        strict (bool, optional): Raise ExtractionError if decoding or a feature fails. Defaults to True.
+    Returns:
+        Dict[str, np.array]: features by feature key
+    """
+    try:
+        y = decode_bytes(data, 22050)
+    except Exception as e:
+        if strict:
+            raise ExtractionError("decode_error", str(e)) from e
+        logging.error(f"Audio could not be decoded! {e}")
+        return {}
+    return extract_array(y, 22050, feat_keys, strict)
+
+
+def pending_features(feat_keys: List[str], file_out: "h5py.File", force: bool = False):
+    """Select the feature types to extract, deleting existing ones if forced or stale.
+    Args:
+        feat_keys (List[str]): feature type keys (eg. cqt_20, cqt_ch,...)
+        file_out (h5py.File): output file
+        force (bool, optional): Whether to force re-extraction. Defaults to False.
+    Returns:
+        Tuple[List[str], List[str]]: feature type keys to extract and unknown ones
+    """
+    pending = []
+    failed = []
+    for feat_key in feat_keys:
+        if feat_key in file_out.keys() and (force or is_stale(file_out, feat_key)):
+            del file_out[feat_key]
+            print(f"Deleted {'stale ' if not force else ''}{feat_key}")
+        if feat_key in file_out.keys():
+            print(f"{feat_key} feature already in file.")
+        elif feat_key not in NODES:
+            logging.error(f"Unknown feature key {feat_key}")
+            failed.append(feat_key)
+        else:
+            pending.append(feat_key)
+    return pending, failed
+
+
+def extract_feature(audio: AudioProvider, feat_key: str, file_out: "h5py.File", force: bool = False):
+    """Extract a single feature type into file_out.
+    Args:
+        audio (AudioProvider): decoded audio
+        feat_key (str): feature type key (eg. cqt_20, cqt_ch,...)
+        file_out (h5py.File): output file
+        force (bool, optional): Whether to force re-extraction. Defaults to False.
     """
-    extractor = SBBC(melodia_algo=feat_key)
-    return extractor(mp3_path)
+    extract_features(audio, [feat_key], file_out, force)
 
-def __extract(y: np.array, sr: int, feat_key: str):
-    """_summary_
+def __extract_melody(y: np.array, sr: int, feat_key: str):
+    """Extract SBBC features.
     Args:
         y (np.array): audio signal waveform
         sr (int): sampling rate
-        feat_key (str): feature type key
-    Returns:
-        np.array: extracted features
-    """
-    if feat_key == "cqt_20":
-        return extract_cqt_20(y)
-    elif feat_key == "cqt_ch":
-        y = librosa.resample(y, orig_sr=sr, target_sr=16000)
-        return extract_cqt_ch(y)
-    elif feat_key == "cens":
-        return librosa.feature.chroma_cens(y=y, sr=sr, hop_length=512)
-    elif feat_key == "onset_env":
-        return librosa.onset.onset_strength(y=y, sr=sr)
+        feat_key (str): melody feature key (eg. melodia)
+    Returns:
+        np.array: Extracted features.
+    """
+    from YTFeatureExtractor.SBBC import SBBC, get_melodia_workers
+    extractor = SBBC(melodia_algo=feat_key, sr=sr, workers=get_melodia_workers())
+    return extractor(y)
@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# failures that are not retried unless asked for
+PERMANENT_REASONS = ["unavailable"]
+
+
+class Manifest(object):
+    """SQLite job manifest with one row per (yt_id, feat_key), recording status ("done" or
+    "failed"), feature version, output path and failure reason. It allows planning the
+    outstanding work of huge ID lists without opening any output file.
+    Writes are buffered and committed in batches of batch_size rows. The database uses
+    SQLite's rollback journal (WAL needs shared memory, see Sharding.WorkQueue), so it may sit
+    on shared storage next to the outputs.
+    Args:
+        path (str): database file path
+        batch_size (int, optional): rows per write transaction. Defaults to 1000.
+    """
+    # SQLite limits the number of host parameters per statement
+    QUERY_BATCH = 900
+
+    def __init__(self, path: str, batch_size: int = 1000) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.RLock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # shared with pipeline callback threads, access is serialized by _lock
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        # also reverts databases created in WAL mode
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "yt_id TEXT NOT NULL, feat_key TEXT NOT NULL, status TEXT NOT NULL, version TEXT, "
+            "output_path TEXT, reason TEXT, updated REAL, PRIMARY KEY (yt_id, feat_key))")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def outstanding(self, yt_ids: Iterable[str], feat_versions: Dict[str, str],
+                    retry_failed: bool = False) -> Iterator[Tuple[str, List[str]]]:
+        """Plan the work left for yt_ids.
+        Args:
+            yt_ids (Iterable[str]): youtube identifiers
+            feat_versions (Dict[str, str]): requested feature keys and their current version
+            retry_failed (bool, optional): also retry permanent failures (eg. unavailable). Defaults to False.
+        Yields:
+            Tuple[str, List[str]]: youtube identifier and the feature keys still to extract
+        """
+        batch = []
+        for yt_id in yt_ids:
+            batch.append(yt_id)
+            if len(batch) == self.QUERY_BATCH:
+                yield from self._outstanding(batch, feat_versions, retry_failed)
+                batch = []
+        if batch:
+            yield from self._outstanding(batch, feat_versions, retry_failed)
+
+    def _outstanding(self, yt_ids: List[str], feat_versions: Dict[str, str], retry_failed: bool):
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT yt_id, feat_key, status, version, reason FROM jobs "
+                f"WHERE yt_id IN ({','.join('?' * len(yt_ids))})", yt_ids).fetchall()
+        finished = set()
+        for yt_id, feat_key, status, version, reason in rows:
+            if feat_key not in feat_versions:
+                continue
+            if status == "done" and version == str(feat_versions[feat_key]):
+                finished.add((yt_id, feat_key))
+            elif status == "failed" and reason in PERMANENT_REASONS and not retry_failed:
+                finished.add((yt_id, feat_key))
+        for yt_id in yt_ids:
+            keys = [feat_key for feat_key in feat_versions if (yt_id, feat_key) not in finished]
+            if keys:
+                yield yt_id, keys
+
+    def record(self, yt_id: str, feat_key: str, status: str, version: str = None,
+               output_path: str = None, reason: str = None):
+        """Buffer a status update, committed with the next batch."""
+        with self._lock:
+            self._pending.append((yt_id, feat_key, status, None if version is None else str(version),
+                                  output_path, reason, time.time()))
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def record_result(self, yt_id: str, result, feat_versions: Dict[str, str]):
+        """Buffer the per-feature outcome of a TaskResult.
+        Args:
+            yt_id (str): youtube identifier
+            result (TaskResult): task result
+            feat_versions (Dict[str, str]): feature keys of the task and their version
+        """
+        for feat_key in result.feat_keys:
+            if result.success or (result.reason == "feature_error" and feat_key not in result.failed_keys):
+                self.record(yt_id, feat_key, "done", feat_versions.get(feat_key), result.output_path)
+            else:
+                self.record(yt_id, feat_key, "failed", feat_versions.get(feat_key), result.output_path,
+                            result.reason)
+
+    def flush(self):
+        """Commit buffered updates in one transaction."""
+        with self._lock:
+            if not self._pending:
+                return
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO jobs (yt_id, feat_key, status, version, output_path, reason, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", self._pending)
+            self._pending = []
+
+    def counts(self):
+        """Number of rows per (status, reason)."""
+        return {(status, reason): count for status, reason, count in self.conn.execute(
+            "SELECT status, reason, COUNT(*) FROM jobs GROUP BY status, reason")}
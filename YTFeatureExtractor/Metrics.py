@@ -0,0 +1,215 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# durations kept per stage for the quantiles of the summary
+QUANTILE_WINDOW = 10000
+
+
+def set_metrics(directory: str):
+    """Configure the metrics directory for this process and the workers it spawns. Every process
+    appends its events to events-<pid>.jsonl in it (see MetricsReporter for the summary).
+    Args:
+        directory (str): metrics directory, None keeps the environment configuration
+    """
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        os.environ["YTFE_METRICS_DIR"] = directory
+
+
+def get_metrics():
+    """Metrics directory configured by YTFE_METRICS_DIR, None if instrumentation is disabled."""
+    return os.environ.get("YTFE_METRICS_DIR") or None
+
+
+class _Sink(object):
+    # per-process event file, reopened after a fork
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.file = open(os.path.join(directory, f"events-{self.pid}.jsonl"), "a", buffering=1)
+
+    def write(self, event: dict):
+        line = json.dumps(event) + "\n"
+        with self.lock:
+            self.file.write(line)
+
+
+_sink = None
+
+
+def _get_sink():
+    global _sink
+    directory = os.environ.get("YTFE_METRICS_DIR")
+    if not directory:
+        return None
+    if _sink is None or _sink.pid != os.getpid() or _sink.directory != directory:
+        _sink = _Sink(directory)
+    return _sink
+
+
+def emit(event: str, **fields):
+    """Append an event (eg. "failure" with a reason) if instrumentation is enabled."""
+    sink = _get_sink()
+    if sink is not None:
+        sink.write(dict(event=event, time=time.time(), pid=os.getpid(), **fields))
+
+
+@contextmanager
+def _timed(sink: _Sink, name: str, fields: dict):
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        sink.write(dict(event="stage", stage=name, seconds=time.perf_counter() - start, ok=ok, time=time.time(),
+                        pid=os.getpid(), **fields))
+
+
+class _NullStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name: str, **fields):
+    """Time a stage (download, decode, resample, feature, write, ...) as context manager. Without
+    a metrics directory this returns a shared no-op context.
+    Args:
+        name (str): stage name
+        **fields: further event fields (eg. yt_id, feat_key)
+    """
+    sink = _get_sink()
+    if sink is None:
+        return _NULL_STAGE
+    return _timed(sink, name, fields)
+
+
+class MetricsReporter(object):
+    """Aggregates the events of all processes in a metrics directory and periodically writes a
+    summary: metrics.prom in the Prometheus textfile format (stage duration quantiles, sums and
+    counts, tracks and failures by reason, throughput) and a log line.
+    Args:
+        directory (str): metrics directory
+        interval (float, optional): seconds between summaries. Defaults to 60.
+    """
+    def __init__(self, directory: str, interval: float = 60.0) -> None:
+        self.directory = directory
+        self.interval = interval
+        self.start = time.time()
+        self._offsets = {}
+        self._durations = defaultdict(lambda: deque(maxlen=QUANTILE_WINDOW))
+        self._sums = defaultdict(float)
+        self._counts = defaultdict(int)
+        self._stage_failures = defaultdict(int)
+        self._failures = defaultdict(int)
+        self._tracks = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.report()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.report()
+            except Exception as e:
+                logging.error(f"Metrics summary failed: {e}")
+
+    def collect(self):
+        """Read the events appended since the last call."""
+        for path in glob.glob(os.path.join(self.directory, "events-*.jsonl")):
+            with open(path) as f:
+                f.seek(self._offsets.get(path, 0))
+                for line in iter(f.readline, ""):
+                    if not line.endswith("\n"):
+                        # partially written, read again next time
+                        f.seek(f.tell() - len(line))
+                        break
+                    self._add(json.loads(line))
+                self._offsets[path] = f.tell()
+
+    def _add(self, event: dict):
+        # the directory may hold the events of earlier runs
+        if event["time"] < self.start:
+            return
+        if event["event"] == "stage":
+            key = (event["stage"], event.get("feat_key", ""))
+            self._durations[key].append(event["seconds"])
+            self._sums[key] += event["seconds"]
+            self._counts[key] += 1
+            if not event["ok"]:
+                self._stage_failures[key] += 1
+        elif event["event"] == "track":
+            self._tracks["success" if event["success"] else "failure"] += 1
+            if not event["success"]:
+                self._failures[event["reason"]] += 1
+
+    def summary(self):
+        """Aggregated metrics: per stage count, failed count, total seconds, p50 and p95; tracks,
+        failures and throughput."""
+        stages = {}
+        for key, durations in self._durations.items():
+            ordered = sorted(durations)
+            stages[key] = {"count": self._counts[key], "failed": self._stage_failures[key], "seconds": self._sums[key],
+                           "p50": ordered[int(0.5 * (len(ordered) - 1))], "p95": ordered[int(0.95 * (len(ordered) - 1))]}
+        elapsed = time.time() - self.start
+        tracks = sum(self._tracks.values())
+        return {"stages": stages, "tracks": dict(self._tracks), "failures": dict(self._failures),
+                "throughput": tracks / elapsed if elapsed > 0 else 0.0, "elapsed": elapsed}
+
+    def report(self):
+        """Collect new events, write metrics.prom atomically and log the summary."""
+        self.collect()
+        s = self.summary()
+        lines = ["# HELP ytfe_stage_seconds Duration of extraction stages.", "# TYPE ytfe_stage_seconds summary"]
+        failed = ["# HELP ytfe_stage_failures_total Stages that raised.", "# TYPE ytfe_stage_failures_total counter"]
+        for (name, feat_key), stats in sorted(s["stages"].items()):
+            labels = f'stage="{name}"' + (f',feat_key="{feat_key}"' if feat_key else "")
+            lines.append(f'ytfe_stage_seconds{{{labels},quantile="0.5"}} {stats["p50"]:.6f}')
+            lines.append(f'ytfe_stage_seconds{{{labels},quantile="0.95"}} {stats["p95"]:.6f}')
+            lines.append(f'ytfe_stage_seconds_sum{{{labels}}} {stats["seconds"]:.6f}')
+            lines.append(f'ytfe_stage_seconds_count{{{labels}}} {stats["count"]}')
+            failed.append(f'ytfe_stage_failures_total{{{labels}}} {stats["failed"]}')
+        lines += failed
+        lines += ["# HELP ytfe_tracks_total Processed tracks by outcome.", "# TYPE ytfe_tracks_total counter"]
+        lines += [f'ytfe_tracks_total{{status="{status}"}} {count}' for status, count in sorted(s["tracks"].items())]
+        lines += ["# HELP ytfe_failures_total Failed tracks by reason.", "# TYPE ytfe_failures_total counter"]
+        lines += [f'ytfe_failures_total{{reason="{reason}"}} {count}' for reason, count in sorted(s["failures"].items())]
+        lines += ["# HELP ytfe_throughput_tracks_per_second Processed tracks per second since the start.",
+                  "# TYPE ytfe_throughput_tracks_per_second gauge",
+                  f'ytfe_throughput_tracks_per_second {s["throughput"]:.6f}']
+        path = os.path.join(self.directory, "metrics.prom")
+        with open(path + ".tmp", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
+        stages = ", ".join(f"{name}{'/' + key if key else ''} p50 {v['p50']:.2f}s p95 {v['p95']:.2f}s"
+                           for (name, key), v in sorted(s["stages"].items()))
+        logging.info(f"Metrics: {s['tracks']} tracks ({s['throughput']:.3f}/s), failures {s['failures']}; {stages}")
+        return s
+
+
+def start_reporter(interval: float = 60.0):
+    """MetricsReporter for the configured directory, or a no-op context if instrumentation is disabled."""
+    directory = get_metrics()
+    return MetricsReporter(directory, interval) if directory else _NULL_STAGE
@@ -0,0 +1,140 @@
+import multiprocessing
+import queue
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+from typing import Callable, Iterable, List
+from YTFeatureExtractor.Admission import AdmissionController, get_memory_budget
+from YTFeatureExtractor.Executor import Task, TaskResult, WorkerPool, run_task
+from YTFeatureExtractor.Writer import start_writer
+
+_DONE = object()
+
+# seconds between checks for downloaded files while extraction processes are busy
+POLL_INTERVAL = 0.1
+
+
+def run_pipeline(tasks: Iterable[Task], download_workers: int = 4, extract_workers: int = None,
+                 queue_size: int = 16, callback: Callable = None, feat_keys: List[str] = None,
+                 timeout: float = None, maxtasksperchild: int = None):
+    """Download and extract in two stages: a thread pool fetches audio (I/O bound) and hands
+    finished files through a bounded queue to a WorkerPool extracting features (CPU bound),
+    which replaces workers that die or overrun the time limit. Downloads block when the queue is full, so they never run further ahead of extraction
+    than queue_size files. With a memory budget (see set_memory_budget) extractions are admitted
+    by an AdmissionController. With an asynchronous writer (see set_async_writer) a task is
+    finished once its features are written.
+    Args:
+        tasks (Iterable[Task]): tasks to run, each with its own downloader
+        download_workers (int, optional): concurrent downloads. Defaults to 4.
+        extract_workers (int, optional): extraction processes. Defaults to cpu_count().
+        queue_size (int, optional): downloaded files waiting for extraction. Defaults to 16.
+        callback (Callable, optional): called with the TaskResult of each finished task. Defaults to None.
+        feat_keys (List[str], optional): feature keys to warm the workers up for. Defaults to None (all).
+        timeout (float, optional): time limit per extraction in seconds (see WorkerPool). Defaults to None.
+        maxtasksperchild (int, optional): tasks after which a worker is replaced. Defaults to None (never).
+    Returns:
+        List[TaskResult]: results in completion order
+    """
+    extract_workers = extract_workers or cpu_count()
+    ready = queue.Queue(maxsize=max(1, queue_size))
+    stopped = threading.Event()
+    results = []
+    lock = threading.Lock()
+
+    def finish(result: TaskResult):
+        with lock:
+            results.append(result)
+        if callback is not None:
+            callback(result)
+
+    def fetch(task: Task):
+        if stopped.is_set():
+            return
+        result = run_task(task, fetch=True, extract=False)
+        if result.success:
+            ready.put((task, result.timings))
+        else:
+            finish(result)
+
+    def download_stage():
+        # bound the submitted downloads so the task iterable is consumed lazily
+        slots = threading.BoundedSemaphore(download_workers)
+
+        def run(task):
+            try:
+                fetch(task)
+            finally:
+                slots.release()
+
+        try:
+            with ThreadPoolExecutor(download_workers) as pool:
+                for task in tasks:
+                    slots.acquire()
+                    if stopped.is_set():
+                        break
+                    pool.submit(run, task)
+        finally:
+            ready.put(_DONE)
+
+    budget = get_memory_budget()
+    admission = AdmissionController(budget, extract_workers) if budget else None
+    fetch_timings = {}
+
+    def extracted(result: TaskResult):
+        timings = dict(fetch_timings.pop(result.input_path))
+        timings["extract"] = result.timings.get("extract", result.timings["total"])
+        timings["total"] += result.timings["total"]
+        result = result._replace(timings=timings)
+        if writer is not None:
+            writer.when_written(result, finish)
+        else:
+            finish(result)
+
+    # workers are spawned: the download threads check the outputs (SQLite, h5py, lazy imports), and
+    # a worker forked (or replaced) while a thread holds one of their locks would deadlock
+    writer = start_writer()
+    handle = writer.handle if writer is not None else None
+    downloader_thread = threading.Thread(target=download_stage, daemon=True)
+    try:
+        with writer if writer is not None else nullcontext(), \
+                WorkerPool(extract_workers, (feat_keys, timeout, handle), maxtasksperchild, timeout,
+                           dict(fetch=False), multiprocessing.get_context("spawn")) as pool:
+            downloader_thread.start()
+            job, downloading = None, True
+            while True:
+                # hand downloaded files to idle workers, waiting for one only if nothing is running
+                while pool.idle():
+                    if job is None and downloading:
+                        try:
+                            job = ready.get(block=not pool.busy())
+                        except queue.Empty:
+                            break
+                        if job is _DONE:
+                            job, downloading = None, False
+                    if job is None or (admission is not None and not admission.try_acquire(job[0])):
+                        break
+                    task, fetch_timings[job[0].input_path] = job
+                    pool.submit(task._replace(downloader=None))
+                    job = None
+                if not pool.busy():
+                    if job is None and not downloading:
+                        break
+                    continue
+                waiting = pool.idle() and job is None and downloading
+                done, finished = pool.wait(POLL_INTERVAL if waiting else None)
+                if admission is not None:
+                    for item, item_results in finished:
+                        admission.release(item, item_results)
+                for result in done:
+                    extracted(result)
+    finally:
+        # let blocked downloads finish (a failed run leaves files in the queue) and stop the others
+        stopped.set()
+        while downloader_thread.is_alive():
+            try:
+                ready.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        downloader_thread.join()
+    return results
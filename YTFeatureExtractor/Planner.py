@@ -0,0 +1,92 @@
+import logging
+from typing import Callable, Dict, Iterator, List, Tuple
+from YTFeatureExtractor.Metrics import stage
+
+
+class Node(object):
+    """Step in the feature dependency graph.
+    Args:
+        name (str): key of the computed value (intermediate or feature key)
+        deps (List[str]): keys of the values passed to func, in order
+        func (Callable): computes the value from its dependencies
+        requires (List[str], optional): modules func imports on first use, for warm-up. Defaults to ().
+    """
+    def __init__(self, name: str, deps: List[str], func: Callable, requires: List[str] = ()) -> None:
+        self.name = name
+        self.deps = list(deps)
+        self.func = func
+        self.requires = list(requires)
+
+
+class FeaturePlan(object):
+    """Computes a set of feature keys over a graph of shared intermediates.
+    Every intermediate (eg. resampled signal, STFT, CQT) is computed at most once
+    per track and released as soon as its last consumer has run.
+    Args:
+        feat_keys (List[str]): requested feature keys, computed in this order
+        nodes (Dict[str, Node]): all known intermediates and features by name
+    """
+    def __init__(self, feat_keys: List[str], nodes: Dict[str, Node]) -> None:
+        self.feat_keys = [key for key in dict.fromkeys(feat_keys)]
+        self.nodes = nodes
+        self.order = []
+        for feat_key in self.feat_keys:
+            self._visit(feat_key, set())
+        # number of planned nodes consuming each value
+        self.consumers = {}
+        for name in self.order:
+            for dep in self.nodes[name].deps if name in self.nodes else []:
+                self.consumers[dep] = self.consumers.get(dep, 0) + 1
+
+    def _visit(self, name: str, path: set):
+        if name in self.order:
+            return
+        if name in path:
+            raise ValueError(f"Cyclic feature dependency at {name}")
+        if name in self.nodes:
+            for dep in self.nodes[name].deps:
+                self._visit(dep, path | {name})
+        self.order.append(name)
+
+    def intermediates(self) -> List[str]:
+        """Names of the planned values that are neither inputs nor requested features."""
+        return [name for name in self.order if name in self.nodes and name not in self.feat_keys]
+
+    def requires(self) -> List[str]:
+        """Modules needed by the planned nodes, in plan order."""
+        return list(dict.fromkeys(module for name in self.order if name in self.nodes
+                                  for module in self.nodes[name].requires))
+
+    def run(self, **inputs) -> Iterator[Tuple[str, object, Exception]]:
+        """Compute the planned features from the given inputs (eg. y, sr, mp3_path).
+        Yields:
+            Tuple[str, object, Exception]: feature key, feature (None on failure), exception (None on success)
+        """
+        values = dict(inputs)
+        errors = {}
+        remaining = dict(self.consumers)
+        for name in self.order:
+            node = self.nodes.get(name)
+            if node is None:
+                if name not in values:
+                    errors[name] = KeyError(f"Missing input {name}")
+            else:
+                failed = [dep for dep in node.deps if dep in errors]
+                if failed:
+                    errors[name] = errors[failed[0]]
+                else:
+                    try:
+                        with stage("feature" if name in self.feat_keys else "intermediate", feat_key=name):
+                            values[name] = node.func(*[values[dep] for dep in node.deps])
+                    except Exception as e:
+                        logging.error(f"Exception {e} for {name}")
+                        errors[name] = e
+                # release dependencies without further consumers
+                for dep in node.deps:
+                    remaining[dep] -= 1
+                    if remaining[dep] == 0:
+                        values.pop(dep, None)
+            if name in self.feat_keys:
+                yield name, values.get(name), errors.get(name)
+                if not remaining.get(name):
+                    values.pop(name, None)
@@ -0,0 +1,77 @@
+import os
+import numpy as np
+
+# real and complex dtypes of kernels, spectrograms and stored features per precision;
+# float64 keeps the library defaults (the reference), float32 halves memory and bandwidth
+PRECISIONS = {
+    "float64": (np.float64, np.complex128),
+    "float32": (np.float32, np.complex64),
+}
+
+DEFAULT_PRECISION = "float64"
+
+# maximum deviation of float32 features from the float64 reference (see deviation), checked by
+# tests/test_precision.py and benchmarks/precision.py
+TOLERANCES = {
+    # dB values: float32 rounding dominates close to the -140 dB floor (~0.15 dB at -130 dB);
+    # deviations of 6e-4 to 1.1e-3 were measured on music and synthetic tracks
+    "cqt_ch": 2e-3,
+    # librosa keeps float32 input in float32, so these match the reference unless extractors change
+    "cqt_20": 1e-4,
+    "cens": 1e-3,
+    "onset_env": 1e-4,
+    "melodia": 1e-3,
+}
+
+
+def set_precision(precision: str):
+    """Configure the numeric precision for this process and the workers it spawns.
+    Args:
+        precision (str): one of PRECISIONS, None keeps the environment configuration
+    """
+    if precision:
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision}, expected one of {list(PRECISIONS)}")
+        os.environ["YTFE_PRECISION"] = precision
+
+
+def get_precision():
+    """Precision configured by YTFE_PRECISION."""
+    return os.environ.get("YTFE_PRECISION") or DEFAULT_PRECISION
+
+
+def real_dtype(precision: str = None):
+    return np.dtype(PRECISIONS[precision or get_precision()][0])
+
+
+def complex_dtype(precision: str = None):
+    return np.dtype(PRECISIONS[precision or get_precision()][1])
+
+
+def cast(data: np.array, precision: str = None):
+    """Cast a floating point feature to the configured precision. The reference precision
+    leaves features as the extractors return them.
+    Args:
+        data (np.array): feature
+        precision (str, optional): one of PRECISIONS. Defaults to the configured one.
+    Returns:
+        np.array: feature
+    """
+    precision = precision or get_precision()
+    data = np.asarray(data)
+    if precision == DEFAULT_PRECISION:
+        return data
+    if np.issubdtype(data.dtype, np.complexfloating):
+        return data.astype(complex_dtype(precision), copy=False)
+    if np.issubdtype(data.dtype, np.floating):
+        return data.astype(real_dtype(precision), copy=False)
+    return data
+
+
+def deviation(reference: np.array, feature: np.array):
+    """Maximum absolute deviation of a feature from its reference, relative to the value range
+    of the reference (inf if the shapes differ)."""
+    if reference.shape != feature.shape:
+        return np.inf
+    value_range = float(np.max(reference) - np.min(reference)) or 1.0
+    return float(np.max(np.abs(np.asarray(feature, dtype=np.float64) - reference))) / value_range
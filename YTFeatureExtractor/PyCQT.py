@@ -1,6 +1,143 @@
 import logging
+import os
+import shutil
+import tempfile
+import threading
 import numpy as np
 import scipy
+import scipy.fft
+from collections import OrderedDict
+from YTFeatureExtractor.Precision import complex_dtype, real_dtype
+
+# number of kernels kept in memory per process
+KERNEL_CACHE_SIZE = 8
+# optional directory shared by workers/nodes to persist kernels
+KERNEL_CACHE_DIR = os.environ.get("YTFE_KERNEL_CACHE_DIR")
+
+_kernel_cache = OrderedDict()
+_kernel_lock = threading.Lock()
+
+
+def get_cqt_kernel(sample_rate, octave_resolution=12, min_freq=32,
+                   max_freq=None, cache_dir=None, dtype=None):
+  """Get a CQT kernel, built at most once per process.
+
+  Kernels are memoized in an LRU of size KERNEL_CACHE_SIZE keyed by
+  (sample_rate, octave_resolution, min_freq, max_freq, dtype). If cache_dir (or
+  KERNEL_CACHE_DIR) is set, the CSR arrays are also persisted there as
+  .npy files and memory-mapped by other processes instead of rebuilt.
+  Kernels are always built and persisted in complex128 and cast on use.
+  Args:
+      sample_rate (int): sampling frequency in Hz
+      octave_resolution (int, optional): bins per octave. Defaults to 12.
+      min_freq (float, optional): minimum frequency in Hz. Defaults to 32.
+      max_freq (float, optional): maximum frequency in Hz. Defaults to
+        sample_rate // 2.
+      cache_dir (str, optional): on-disk cache directory. Defaults to
+        KERNEL_CACHE_DIR.
+      dtype (np.dtype, optional): complex dtype of the kernel. Defaults to
+        the configured precision (see Precision.py).
+  Returns:
+      scipy.sparse.csr_matrix: CQT kernel (number_frequencies, fft_length)
+  """
+  if not max_freq:
+    max_freq = sample_rate // 2
+  dtype = np.dtype(dtype or complex_dtype())
+  key = (sample_rate, octave_resolution, min_freq, max_freq)
+  with _kernel_lock:
+    if key + (dtype.str,) in _kernel_cache:
+      _kernel_cache.move_to_end(key + (dtype.str,))
+      return _kernel_cache[key + (dtype.str,)]
+  cache_dir = cache_dir or KERNEL_CACHE_DIR
+  kernel = _load_kernel(cache_dir, key) if cache_dir else None
+  if kernel is None:
+    kernel = PyCqt._compute_cqt_kernel(*key)
+    if cache_dir:
+      _save_kernel(cache_dir, key, kernel)
+  if kernel.dtype != dtype:
+    kernel = kernel.astype(dtype)
+  _remember(key + (dtype.str,), kernel)
+  return kernel
+
+
+def get_split_kernel(sample_rate, octave_resolution=12, min_freq=32,
+                     max_freq=None, cache_dir=None, dtype=None):
+  """Get a CQT kernel split for real FFTs (see PyCqt._split_kernel), built at
+  most once per process.
+
+  The split is memoized in the kernel LRU next to the kernel it comes from.
+  Args:
+      same as get_cqt_kernel
+  Returns:
+      Tuple[scipy.sparse.csr_matrix, scipy.sparse.csr_matrix]: positive and
+        folded negative kernel (None if empty)
+  """
+  if not max_freq:
+    max_freq = sample_rate // 2
+  dtype = np.dtype(dtype or complex_dtype())
+  key = (sample_rate, octave_resolution, min_freq, max_freq, dtype.str, "split")
+  with _kernel_lock:
+    if key in _kernel_cache:
+      _kernel_cache.move_to_end(key)
+      return _kernel_cache[key]
+  split_kernel = PyCqt._split_kernel(get_cqt_kernel(
+    sample_rate, octave_resolution, min_freq, max_freq, cache_dir, dtype))
+  _remember(key, split_kernel)
+  return split_kernel
+
+
+def _remember(key, value):
+  with _kernel_lock:
+    _kernel_cache[key] = value
+    _kernel_cache.move_to_end(key)
+    while len(_kernel_cache) > max(1, KERNEL_CACHE_SIZE):
+      _kernel_cache.popitem(last=False)
+
+
+def clear_kernel_cache():
+  """Drop all in-memory kernels (the on-disk cache is left untouched)."""
+  with _kernel_lock:
+    _kernel_cache.clear()
+
+
+def _kernel_dir(cache_dir, key):
+  return os.path.join(cache_dir, "cqt_{}_{}_{}_{}".format(*key))
+
+
+def _load_kernel(cache_dir, key):
+  path = _kernel_dir(cache_dir, key)
+  if not os.path.isdir(path):
+    return None
+  try:
+    shape = tuple(np.load(os.path.join(path, "shape.npy")))
+    data, indices, indptr = (
+      np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+      for name in ("data", "indices", "indptr"))
+    return scipy.sparse.csr_matrix((data, indices, indptr), shape=shape,
+                                   copy=False)
+  except (OSError, ValueError) as e:
+    logging.warning("cqt kernel cache {} unreadable: {}".format(path, e))
+    return None
+
+
+def _save_kernel(cache_dir, key, kernel):
+  # write into a temporary dir and rename, so readers never see partial files
+  path = _kernel_dir(cache_dir, key)
+  tmp_path = None
+  try:
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=cache_dir, prefix=".tmp_")
+    np.save(os.path.join(tmp_path, "data.npy"), kernel.data)
+    np.save(os.path.join(tmp_path, "indices.npy"), kernel.indices)
+    np.save(os.path.join(tmp_path, "indptr.npy"), kernel.indptr)
+    np.save(os.path.join(tmp_path, "shape.npy"), np.array(kernel.shape))
+    os.rename(tmp_path, path)
+  except OSError as e:
+    # another worker won the race or the directory is read-only
+    logging.info("cqt kernel not cached at {}: {}".format(path, e))
+    if tmp_path:
+      shutil.rmtree(tmp_path, ignore_errors=True)
+
 
 class PyCqt:
   """just wrapper for cqt extractor,
@@ -9,13 +146,18 @@ class PyCqt:
   """
 
   def __init__(self, sample_rate, hop_size, octave_resolution=12, min_freq=32,
-               max_freq=None):
+               max_freq=None, block_size=256, dtype=None):
     self._hop_size = hop_size
+    # real dtype of the spectrogram, the kernel has the matching complex dtype
+    self._dtype = np.dtype(dtype or real_dtype())
+    self._block_size = block_size
     self._sample_rate = sample_rate
-    if not max_freq:
-      max_freq = sample_rate // 2
-    self._kernel = self._compute_cqt_kernel(sample_rate, octave_resolution,
-                                            min_freq, max_freq)
+    self._kernel = get_cqt_kernel(
+      sample_rate, octave_resolution, min_freq, max_freq,
+      dtype=np.result_type(self._dtype, np.complex64))
+    self._split = get_split_kernel(
+      sample_rate, octave_resolution, min_freq, max_freq,
+      dtype=np.result_type(self._dtype, np.complex64))
     logging.info("cqt kernal: {}".format(np.shape(self._kernel)))
     return
 
@@ -100,14 +242,26 @@ class PyCqt:
 
   @staticmethod
   def _compute_cqt_spec(audio_signal, sampling_frequency, time_resolution,
-                        cqt_kernel):
+                        cqt_kernel, block_size=256, split_kernel=None):
     """
     Compute the constant-Q transform (CQT) spectrogram using a CQT kernel.
+
+    Frames are taken as a strided view of the padded signal (no copy) and
+    processed in blocks of block_size frames: one real FFT per block and one
+    sparse x dense product per block. Because the signal is real, the
+    negative-frequency part of the kernel is folded onto the conjugated
+    half-spectrum, so the result equals the full complex FFT version up to
+    floating point rounding (max abs deviation below 1e-9 times the largest
+    magnitude). The computation runs in the precision of the kernel: a
+    complex64 kernel gives float32 frames, FFTs and spectrogram.
     Inputs:
         audio_signal: audio signal (number_samples,)
         sampling_frequency: sampling frequency in Hz
         time_resolution: number of time frames per second
         cqt_kernel: CQT kernel (number_frequencies, fft_length)
+        block_size: number of frames transformed at once (bounds peak memory)
+        split_kernel: cqt_kernel split by _split_kernel (eg. from
+          get_split_kernel), split here if None
     Output:
         cqt_spectrogram: CQT spectrogram (number_frequencies, number_times)
     """
@@ -121,6 +275,10 @@ class PyCqt:
     # Get th number of frequency channels and the FFT length
     number_frequencies, fft_length = np.shape(cqt_kernel)
 
+    # Real dtype matching the kernel (float64 for complex128, float32 for complex64)
+    dtype = np.finfo(cqt_kernel.dtype).dtype
+    audio_signal = np.asarray(audio_signal, dtype=dtype)
+
     # Zero-pad the signal to center the CQT
     audio_signal = np.pad(
       audio_signal,
@@ -132,21 +290,60 @@ class PyCqt:
       constant_values=(0, 0),
     )
 
-    cqt_spectrogram = np.zeros((number_frequencies, number_times))
-    i = 0
-    for j in range(number_times):
-      # Compute the magnitude CQT using the kernel
-      cqt_spectrogram[:, j] = np.absolute(
-        cqt_kernel * np.fft.fft(audio_signal[i: i + fft_length])
-      )
-      i = i + step_length
+    cqt_spectrogram = np.zeros((number_frequencies, number_times), dtype=dtype)
+    if number_times == 0:
+      # shorter than one step: the padded signal may not hold a single frame
+      return cqt_spectrogram
+
+    # Frame the signal without copying: (number_times, fft_length)
+    frames = np.lib.stride_tricks.sliding_window_view(
+      audio_signal, fft_length)[::step_length][:number_times]
+
+    positive_kernel, negative_kernel = (
+      split_kernel or PyCqt._split_kernel(cqt_kernel))
+
+    block_size = max(1, int(block_size))
+    for start in range(0, number_times, block_size):
+      stop = min(start + block_size, number_times)
+      # scipy keeps float32 input in single precision, numpy always upcasts
+      spectrum = scipy.fft.rfft(frames[start:stop], axis=1).T
+      block = positive_kernel @ spectrum
+      if negative_kernel is not None:
+        block = block + negative_kernel @ np.conjugate(spectrum)
+      cqt_spectrogram[:, start:stop] = np.absolute(block)
     return cqt_spectrogram
 
+  @staticmethod
+  def _split_kernel(cqt_kernel):
+    """
+    Split a full-spectrum CQT kernel for use with a real FFT.
+    Inputs:
+        cqt_kernel: CQT kernel (number_frequencies, fft_length)
+    Output:
+        positive_kernel: kernel columns 0..fft_length/2
+        negative_kernel: remaining columns mapped onto the conjugate
+          half-spectrum (column k -> fft_length - k), None if all zero
+    """
+    cqt_kernel = scipy.sparse.csr_matrix(cqt_kernel)
+    number_frequencies, fft_length = cqt_kernel.shape
+    half_length = fft_length // 2 + 1
+    positive_kernel = cqt_kernel[:, :half_length].tocsr()
+    negative_kernel = cqt_kernel[:, half_length:].tocoo()
+    if negative_kernel.nnz == 0:
+      return positive_kernel, None
+    negative_kernel = scipy.sparse.csr_matrix(
+      (negative_kernel.data,
+       (negative_kernel.row, fft_length - (negative_kernel.col + half_length))),
+      shape=(number_frequencies, half_length))
+    return positive_kernel, negative_kernel
+
   def compute_cqt(self, signal_float=None, feat_dim_first=True):
     y = signal_float
     time_resolution = int(1 / self._hop_size)
     cqt_spectrogram = self._compute_cqt_spec(y, self._sample_rate,
-                                             time_resolution, self._kernel)
+                                             time_resolution, self._kernel,
+                                             block_size=self._block_size,
+                                             split_kernel=self._split)
     cqt_spectrogram = cqt_spectrogram + 1e-9
     ref_value = np.max(cqt_spectrogram)
     cqt_spectrogram = 20 * np.log10(cqt_spectrogram) - 20 * np.log10(ref_value)
@@ -1,37 +1,135 @@
-import essentia
-import essentia.standard
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
 import numpy as np
-from math import log2
-from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# segmentation of long tracks for segment-parallel melody estimation
+SEGMENT_SECONDS = 120
+OVERLAP_SECONDS = 10
+# segment pool of this process, reused across tracks: (pid, workers, ProcessPoolExecutor)
+_POOL = None
+# segmentation of the last melody estimated by each thread (see last_segmentation)
+_LAST = threading.local()
 
 
 class SBBC(object):
     """Based on https://github.com/u201212551u201611810/PerfectMelody/tree/master
     "Query by Humming for Song Identification Using Voice Isolation" Edwin Alfaro-Paredes, 
     Leonardo Alfaro-Carrasco, Willy Ugarte (2021)
+
+    With workers > 1 (or segmented), tracks longer than two segments are split into overlapping
+    segments whose melodies are estimated in parallel processes (or one after the other, which
+    bounds the memory for very long tracks) and stitched (see _stitch). Melodia
+    selects contours and voicing with track-level statistics, so segmented results are close
+    to, but not identical with, a single pass. Daemonic processes (multiprocessing.Pool
+    workers) cannot start processes; there workers > 1 falls back to a single pass unless
+    segmented is set (see parallel_workers). How each track was estimated is recorded with
+    its dataset (see last_segmentation).
     Args:
-        object (_type_): _description_
+        melodia_algo (str): melody feature key (eg. melodia) or essentia algorithm
+        sr (int, optional): sampling rate of the audio passed in. Defaults to 22050.
+        hop_size (int, optional): hop size of the pitch tracker. Defaults to 512.
+        workers (int, optional): processes for segment-parallel estimation. Defaults to 1.
+        segment_seconds (float, optional): segment length. Defaults to 120.
+        overlap_seconds (float, optional): overlap of consecutive segments. Defaults to 10.
+        segmented (bool, optional): split long tracks even with a single worker. Defaults to False.
     """
-    def __init__(self, melodia_algo: str, sr: int = 22050, hop_size: int =512) -> None:
+    def __init__(self, melodia_algo: str, sr: int = 22050, hop_size: int =512, workers: int = 1,
+                 segment_seconds: float = SEGMENT_SECONDS, overlap_seconds: float = OVERLAP_SECONDS,
+                 segmented: bool = False) -> None:
         self.sr = sr
         self.hop_size = hop_size
+        self.workers = workers
+        self.segment_seconds = segment_seconds
+        self.overlap_seconds = overlap_seconds
+        self.segmented = segmented
+        self.melodia_key = melodia_algo if isinstance(melodia_algo, str) else None
+        if isinstance(melodia_algo, str):
+            melodia_algo = self._get_melodia_algorithm(melodia_algo)
         self.melodia_algo= melodia_algo
     
-    def __call__(self, mp3_path):
-        pitch_values = self._estimate_melody(mp3_path)
+    def __call__(self, y):
+        pitch_values = self._estimate_melody(y)
         chroma_descriptor = self._compute_descriptor(pitch_values)
         return chroma_descriptor
         
-    def _estimate_melody(self, mp3_path):
-        loader = essentia.standard.EasyLoader(filename=mp3_path, sampleRate=self.sr)
-        audio = loader()
+    def _estimate_melody(self, y):
+        # essentia expects mono float32 at self.sr (eg. from AudioProvider)
+        segments = self._segments(len(y))
+        parallel = parallel_workers(self.workers) > 1 and self.melodia_key is not None
+        if (parallel or self.segmented) and len(segments) > 2:
+            # segments are converted one at a time, y may be a memory-mapped file
+            if parallel:
+                contours = _map_segments(self.melodia_key, self.sr, self.hop_size, y, segments,
+                                         min(self.workers, len(segments)))
+            else:
+                contours = [_estimate_segment(self.melodia_algo, self.sr, self.hop_size,
+                                              np.asarray(y[start:stop], dtype=np.float32))
+                            for start, stop in segments]
+            _LAST.segmentation = {"stitched": True, "segments": len(segments),
+                                  "segment_seconds": self.segment_seconds, "overlap_seconds": self.overlap_seconds}
+            return self._stitch(contours, [start // self.hop_size for start, _ in segments])
+        import essentia
+        audio = essentia.array(np.asarray(y, dtype=np.float32))
         pitch_extractor = self.melodia_algo(frameSize=self.sr, hopSize=self.hop_size)
         pitch_values, _ = pitch_extractor(audio)
-        return pitch_values  
+        _LAST.segmentation = {"stitched": False}
+        return pitch_values
+
+    def _segments(self, n_samples: int):
+        """Overlapping (start, stop) sample ranges, starts aligned to the hop size."""
+        segment = max(1, int(self.segment_seconds * self.sr / self.hop_size)) * self.hop_size
+        overlap = int(self.overlap_seconds * self.sr / self.hop_size) * self.hop_size
+        step = max(self.hop_size, segment - overlap)
+        segments = [(0, min(segment, n_samples))]
+        while segments[-1][1] < n_samples:
+            start = segments[-1][0] + step
+            segments.append((start, min(start + segment, n_samples)))
+        return segments
+
+    @staticmethod
+    def _stitch(contours, offsets, tolerance_cents: float = 50):
+        """Join segment pitch contours into one contour.
+        In each overlap the contours are cut at the frame nearest to the middle of the overlap,
+        within its central half, where both agree (both unvoiced, or voiced within
+        tolerance_cents). Without agreement the cut is at the middle. Frames near segment edges,
+        where the tracker lacks context, are thus never used.
+        Args:
+            contours (List[np.array]): pitch contours (Hz, 0 for unvoiced) per segment
+            offsets (List[int]): global frame index of the first frame of each contour
+            tolerance_cents (float, optional): maximum pitch difference to agree. Defaults to 50.
+        Returns:
+            np.array: stitched contour
+        """
+        result = np.asarray(contours[0], dtype=np.float32)
+        for contour, offset in zip(contours[1:], offsets[1:]):
+            contour = np.asarray(contour, dtype=np.float32)
+            overlap = min(len(result) - offset, len(contour))
+            if overlap <= 0:
+                result = np.concatenate([result, np.zeros(offset - len(result), dtype=np.float32), contour])
+                continue
+            previous, following = result[offset:offset + overlap], contour[:overlap]
+            voiced = (previous > 0) & (following > 0)
+            cents = np.zeros(overlap)
+            cents[voiced] = np.abs(1200 * np.log2(previous[voiced] / following[voiced]))
+            agree = ((previous <= 0) & (following <= 0)) | (voiced & (cents <= tolerance_cents))
+            middle = overlap // 2
+            candidates = np.flatnonzero(agree)
+            candidates = candidates[(candidates >= overlap // 4) & (candidates <= overlap - overlap // 4)]
+            cut = candidates[np.argmin(np.abs(candidates - middle))] if len(candidates) else middle
+            result = np.concatenate([result[:offset + cut], contour[cut:]])
+        return result
     
     @staticmethod
     def _get_melodia_algorithm(feat_key):
         if feat_key == "melodia":
+            # essentia is imported on first use, setting up SBBC options does not need it
+            import essentia.standard
             return essentia.standard.PredominantPitchMelodia
         elif feat_key == "crepe":
             raise NotImplementedError("CREPE not yet implemented!")
@@ -39,57 +137,122 @@ class SBBC(object):
     @staticmethod
     def _compute_descriptor(melody):
         def to_cents(song):
-            cents = []
-            for i, f in enumerate(song):
-                if song[i] > 0:
-                    cents.append(1200 * log2(song[i] / 55))
-                else:
-                    cents.append(0)
-            return np.array(cents)
+            song = np.asarray(song, dtype=np.float64)
+            cents = np.zeros(len(song))
+            voiced = song > 0
+            cents[voiced] = 1200 * np.log2(song[voiced] / 55)
+            return cents
 
         def to_semitones(cents):
-            semitones = []
-            for i, f in enumerate(cents):
-                semitones.append(cents[i] // 100)
-            return np.array(semitones)
+            return cents // 100
 
         def map_into_single_octave(semitones):
-            mapped = []
             min_n = 1
             max_n = 12
             min_d = np.min(semitones[np.nonzero(semitones)])
-            max_d = max(semitones)
-            for i, f in enumerate(semitones):
-                if semitones[i] > 0:
-                    mapped.append(((semitones[i] - min_d) * (max_n - min_n)) // (max_d - min_d) + min_n)
-                else:
-                    mapped.append(0)
-            return np.array(mapped)
+            max_d = np.max(semitones)
+            mapped = ((semitones - min_d) * (max_n - min_n)) // (max_d - min_d) + min_n
+            return np.where(semitones > 0, mapped, 0)
 
         def get_histogram(pitch_class, hop_size=2):
-            limitator = 0
-            histogram = []
-            while limitator < len(pitch_class):
-                frame = []
-                ini = limitator
-                fin = ini + hop_size - 1
-                if fin > len(pitch_class) - 1:
-                    fin = len(pitch_class) - 1
-                counter = Counter(pitch_class[ini:fin])
-                for i in range(12):
-                    frame.append(counter[i + 1])
-                for x in range(len(frame)):
-                    if frame[x] == 0:
-                        continue
-                    num = frame[x] - min(frame)
-                    denom = max(frame) - min(frame)
-                    frame[x] = num / denom
-                histogram.append(frame)
-                limitator += hop_size
-            return np.array(histogram, dtype=np.single)
+            # window w counts frames w * hop_size .. w * hop_size + hop_size - 2; the last frame
+            # of the track is never counted (as in the reference implementation)
+            n_frames = len(pitch_class)
+            n_windows = -(-n_frames // hop_size)
+            index = np.arange(n_frames)
+            counted = (index % hop_size < hop_size - 1) & (index < n_frames - 1)
+            pitch_bin = pitch_class - 1
+            counted &= (pitch_bin >= 0) & (pitch_bin < 12) & (pitch_bin == np.floor(pitch_bin))
+            histogram = np.bincount(index[counted] // hop_size * 12 + pitch_bin[counted].astype(np.int64),
+                                    minlength=n_windows * 12).reshape(n_windows, 12).astype(np.float64)
+            # min/max normalization, updating bins in order like the reference implementation does
+            for x in range(12):
+                nonzero = histogram[:, x] != 0
+                low = histogram[nonzero].min(axis=1)
+                high = histogram[nonzero].max(axis=1)
+                histogram[nonzero, x] = (histogram[nonzero, x] - low) / (high - low)
+            return histogram.astype(np.single)
 
         cents = to_cents(melody)
         semitones = to_semitones(cents)
         mapped = map_into_single_octave(semitones)
         chroma = get_histogram(mapped)
         return chroma.T
+
+
+def _estimate_segment(melodia_algo, sr: int, hop_size: int, audio: np.array):
+    """Melody of one segment, in a worker process (melodia_algo may be a feature key)."""
+    import essentia
+    if isinstance(melodia_algo, str):
+        melodia_algo = SBBC._get_melodia_algorithm(melodia_algo)
+    pitch_values, _ = melodia_algo(frameSize=sr, hopSize=hop_size)(essentia.array(audio))
+    return pitch_values
+
+
+def parallel_workers(workers: int):
+    """Processes usable for segment-parallel melody estimation: workers, or 1 in a daemonic
+    process (eg. a multiprocessing.Pool worker), which cannot start processes."""
+    if workers > 1 and multiprocessing.current_process().daemon:
+        logging.debug("Segment-parallel melody estimation unavailable in daemonic process")
+        return 1
+    return workers
+
+
+def last_segmentation():
+    """How the last melody of this thread was estimated: stitched from segments (with their
+    number, length and overlap) or in a single pass. Recorded with the melodia dataset of the
+    track; it depends on the track length and the configuration, so it does not make the
+    stored feature stale (see Helper.dataset_attrs).
+    Returns:
+        str: JSON segmentation, None if no melody was estimated
+    """
+    segmentation = getattr(_LAST, "segmentation", None)
+    return None if segmentation is None else json.dumps(segmentation, sort_keys=True)
+
+
+def _segment_pool(workers: int):
+    """Process pool for segment-parallel estimation, created once per process and worker count."""
+    global _POOL
+    if _POOL is not None and _POOL[:2] != (os.getpid(), workers):
+        if _POOL[0] == os.getpid():
+            _POOL[2].shutdown(wait=False)
+        _POOL = None
+    if _POOL is None:
+        _POOL = (os.getpid(), workers, ProcessPoolExecutor(workers))
+    return _POOL[2]
+
+
+def _map_segments(melodia_key: str, sr: int, hop_size: int, y: np.array, segments, workers: int):
+    """Melodies of the segments of y on the segment pool, in order. At most workers segments
+    are in flight, so only those are converted and held in memory."""
+    global _POOL
+    pool = _segment_pool(workers)
+    pending = deque()
+    contours = []
+    try:
+        for start, stop in segments:
+            if len(pending) == workers:
+                contours.append(pending.popleft().result())
+            pending.append(pool.submit(_estimate_segment, melodia_key, sr, hop_size,
+                                       np.asarray(y[start:stop], dtype=np.float32)))
+        while pending:
+            contours.append(pending.popleft().result())
+    except BrokenProcessPool:
+        # a segment worker died: start a new pool for the next track
+        _POOL = None
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+    return contours
+
+
+def set_melodia_workers(workers: int):
+    """Configure segment-parallel melody estimation for this process and the workers it spawns."""
+    if workers:
+        os.environ["YTFE_MELODIA_WORKERS"] = str(workers)
+
+
+def get_melodia_workers():
+    """Melody estimation processes per track as configured by YTFE_MELODIA_WORKERS (default 1)."""
+    return int(os.environ.get("YTFE_MELODIA_WORKERS", 1))
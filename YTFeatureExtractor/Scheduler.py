@@ -0,0 +1,194 @@
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+from typing import Iterable, Iterator, List, Optional
+import numpy as np
+from YTFeatureExtractor.Audio import find_audio, get_duration, get_pcm_cache
+from YTFeatureExtractor.Executor import Task, TaskResult, run_tasks
+
+SCHEDULES = ["input", "longest"]
+
+# audio seconds equivalent of the fixed cost of a track (file I/O, decoder setup, output file)
+TASK_OVERHEAD = 5.0
+
+
+def probe_durations(paths: List[str], threads: int = 8):
+    """Durations in seconds from container headers (or the PCM cache), without decoding.
+    Args:
+        paths (List[str]): audio files
+        threads (int, optional): concurrent probes, probing is I/O bound. Defaults to 8.
+    Returns:
+        List[Optional[float]]: durations, None for missing or unreadable files
+    """
+    cache = get_pcm_cache()
+
+    def probe(path):
+        path = find_audio(path)
+        return get_duration(path, cache) if path is not None else None
+
+    with ThreadPoolExecutor(max(1, threads)) as pool:
+        return list(pool.map(probe, paths))
+
+
+def task_costs(tasks: List[Task], durations: List[Optional[float]]):
+    """Estimated cost of each task in audio seconds times feature keys. Tasks of unknown
+    duration (eg. not downloaded yet) are assumed to have the median known duration.
+    Args:
+        tasks (List[Task]): tasks
+        durations (List[Optional[float]]): durations in seconds (see probe_durations)
+    Returns:
+        List[float]: costs
+    """
+    known = [d for d in durations if d is not None]
+    default = float(np.median(known)) if known else 0.0
+    return [(TASK_OVERHEAD + (default if d is None else d)) * max(1, len(task.feat_keys))
+            for task, d in zip(tasks, durations)]
+
+
+def longest_first(tasks: List[Task], costs: List[float]):
+    """Order tasks by decreasing cost (LPT), so the long ones do not end up in the tail of a batch.
+    Returns:
+        Tuple[List[Task], List[float]]: ordered tasks and their costs
+    """
+    order = sorted(range(len(tasks)), key=lambda i: -costs[i])
+    return [tasks[i] for i in order], [costs[i] for i in order]
+
+
+def pack_tasks(tasks: List[Task], costs: List[float], workers: int, chunks_per_worker: int = 4):
+    """Pack tasks, in the given order, into chunks of about equal cost: long tracks go alone,
+    short ones are batched to save pool round trips. With longest first order the chunks
+    come out in decreasing cost too.
+    Args:
+        tasks (List[Task]): tasks
+        costs (List[float]): task costs
+        workers (int): worker processes
+        chunks_per_worker (int, optional): chunks per worker, more balances better. Defaults to 4.
+    Returns:
+        Tuple[List[List[Task]], List[float]]: chunks and their costs
+    """
+    target = sum(costs) / max(1, workers * chunks_per_worker)
+    chunks, chunk_costs = [], []
+    for task, cost in zip(tasks, costs):
+        if not chunks or chunk_costs[-1] + cost > target:
+            chunks.append([])
+            chunk_costs.append(0.0)
+        chunks[-1].append(task)
+        chunk_costs[-1] += cost
+    return chunks, chunk_costs
+
+
+def estimate_makespan(costs: List[float], workers: int):
+    """Makespan of list scheduling: each item, in order, goes to the first idle worker.
+    Args:
+        costs (List[float]): item costs in dispatch order
+        workers (int): workers
+    Returns:
+        float: makespan in cost units
+    """
+    finish = [0.0] * max(1, min(workers, len(costs)))
+    for cost in costs:
+        heapq.heappush(finish, heapq.heappop(finish) + cost)
+    return max(finish)
+
+
+class MakespanReport(object):
+    """Estimated and actual makespan of a scheduled batch. Estimates are computed in cost units
+    and converted to seconds with the measured task seconds per cost unit, plus the measured
+    startup of the workers (imports and CQT kernels, see Executor.init_worker): the time from
+    the start of the batch to the first result of a worker, less that task's own seconds."""
+    def __init__(self) -> None:
+        self.workers = 1
+        self.schedule = None
+        self.estimate = 0.0
+        self.input_estimate = 0.0
+        self.total_cost = 0.0
+        self._costs = {}
+        self._task_seconds = 0.0
+        self._done_cost = 0.0
+        self._startup = {}
+        self._start = None
+        self._end = None
+
+    def plan(self, tasks: List[Task], costs: List[float], dispatch_costs: List[float], input_costs: List[float],
+             workers: int, schedule: str):
+        self.workers = workers
+        self.schedule = schedule
+        self._costs = {task.input_path: cost for task, cost in zip(tasks, costs)}
+        self.total_cost = sum(costs)
+        self.estimate = estimate_makespan(dispatch_costs, workers)
+        self.input_estimate = estimate_makespan(input_costs, workers)
+        self._start = time.perf_counter()
+
+    def observe(self, result: TaskResult):
+        self._task_seconds += result.timings.get("total", 0.0)
+        self._done_cost += self._costs.get(result.input_path, 0.0)
+        self._end = time.perf_counter()
+        pid = (result.memory or {}).get("pid")
+        # workers replacing others (maxtasksperchild, timeouts) start late, only the first ones count
+        if pid is not None and pid not in self._startup and len(self._startup) < self.workers:
+            self._startup[pid] = max(0.0, self._end - self._start - result.timings.get("total", 0.0))
+
+    def summary(self):
+        """Makespans in seconds: estimated for the schedule and the input order, the lower bound
+        (total work spread evenly) and the actual wall-clock time, the estimates including the
+        mean worker startup."""
+        rate = self._task_seconds / self._done_cost if self._done_cost else 0.0
+        startup = float(np.mean(list(self._startup.values()))) if self._startup else 0.0
+        return {
+            "schedule": self.schedule,
+            "workers": self.workers,
+            "startup": startup,
+            "estimated": startup + self.estimate * rate,
+            "estimated_input_order": startup + self.input_estimate * rate,
+            "lower_bound": startup + self.total_cost / max(1, self.workers) * rate,
+            "actual": (self._end - self._start) if self._start is not None and self._end is not None else 0.0,
+        }
+
+    def __str__(self) -> str:
+        s = self.summary()
+        return (f"Makespan ({s['schedule']}, {s['workers']} workers): estimated {s['estimated']:.1f}s "
+                f"(input order {s['estimated_input_order']:.1f}s, lower bound {s['lower_bound']:.1f}s, "
+                f"each with {s['startup']:.1f}s worker startup), actual {s['actual']:.1f}s")
+
+
+def run_scheduled(tasks: Iterable[Task], workers: int = None, schedule: str = "input", pack: bool = False,
+                  chunksize: int = 1, report: MakespanReport = None, **kwargs) -> Iterator[TaskResult]:
+    """Run tasks like run_tasks, ordered by their estimated cost.
+    Args:
+        tasks (Iterable[Task]): tasks to run
+        workers (int, optional): worker processes. Defaults to cpu_count().
+        schedule (str, optional): "input" (given order) or "longest" (longest first). Defaults to "input".
+        pack (bool, optional): pack tasks into chunks of about equal cost instead of chunksize. Defaults to False.
+        chunksize (int, optional): tasks sent to a worker at once without pack. Defaults to 1.
+        report (MakespanReport, optional): filled with the estimated and actual makespan. Defaults to None.
+        **kwargs: further run_tasks arguments (maxtasksperchild, timeout, feat_keys)
+    Yields:
+        TaskResult: results in completion order
+    """
+    if schedule not in SCHEDULES:
+        raise ValueError(f"Unknown schedule {schedule}, expected one of {SCHEDULES}")
+    workers = workers or cpu_count()
+    pack = pack and workers > 1
+    tasks = list(tasks)
+    costs = task_costs(tasks, probe_durations([task.input_path for task in tasks]))
+
+    def dispatch(tasks, costs):
+        # items handed to the pool and their costs
+        if pack:
+            return pack_tasks(tasks, costs, workers)
+        if workers > 1 and chunksize > 1:
+            # imap hands out consecutive chunks of chunksize tasks
+            return tasks, [sum(costs[i:i + chunksize]) for i in range(0, len(costs), chunksize)]
+        return tasks, costs
+
+    input_costs = dispatch(tasks, costs)[1]
+    if schedule == "longest":
+        tasks, costs = longest_first(tasks, costs)
+    items, dispatch_costs = dispatch(tasks, costs)
+    report = report if report is not None else MakespanReport()
+    report.plan(tasks, costs, dispatch_costs, input_costs, workers, schedule)
+    for result in run_tasks(items, workers=workers, chunksize=1 if pack else chunksize, packed=pack,
+                            **kwargs):
+        report.observe(result)
+        yield result
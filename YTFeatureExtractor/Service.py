@@ -0,0 +1,258 @@
+import http.client
+import http.server
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+from YTFeatureExtractor.Audio import decode_bytes
+from YTFeatureExtractor.Executor import init_worker
+from YTFeatureExtractor.Helper import FEAT_KEYS, ExtractionError, extract_array
+
+
+def _check_pcm(data: bytes, sr: int = None):
+    # raw PCM must be whole float32 samples
+    if sr and len(data) % 4:
+        raise ValueError(f"Raw PCM of {len(data)} bytes is not a whole number of float32 samples")
+
+
+def _extract_request(data: bytes, feat_keys: List[str], sr: int = None):
+    # runs in a warm worker: raw float32 PCM if sr is given, else encoded audio
+    start = time.time()
+    timings = {}
+    try:
+        if sr:
+            features = extract_array(np.frombuffer(data, dtype="<f4"), sr, feat_keys)
+        else:
+            decode_start = time.perf_counter()
+            try:
+                y = decode_bytes(data, 22050)
+            except Exception as e:
+                raise ExtractionError("decode_error", str(e))
+            timings["decode"] = time.perf_counter() - decode_start
+            features = extract_array(y, 22050, feat_keys)
+        error = None
+    except ExtractionError as e:
+        features, error = {}, (e.reason, e.message, list(e.feat_keys))
+    timings["extract"] = time.time() - start - timings.get("decode", 0.0)
+    return features, error, timings, start
+
+
+class ExtractionService(object):
+    """Keeps imports, CQT kernels and worker processes warm between extraction requests.
+    Args:
+        feat_keys (List[str], optional): feature keys to warm up for. Defaults to all.
+        workers (int, optional): worker processes, 0 extracts in the calling thread. Defaults to 1.
+        history (int, optional): requests kept for the latency statistics. Defaults to 1000.
+    """
+    def __init__(self, feat_keys: List[str] = None, workers: int = 1, history: int = 1000) -> None:
+        self.feat_keys = list(feat_keys or FEAT_KEYS)
+        self.workers = workers
+        self._latencies = deque(maxlen=history)
+        self._requests = 0
+        self._errors = 0
+        self._lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+        if workers > 0:
+            self._pool = self._start_pool()
+        else:
+            self._pool = None
+            init_worker(self.feat_keys)
+
+    def _start_pool(self):
+        pool = ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(self.feat_keys,))
+        # start and warm up all workers before the first request
+        list(pool.map(time.sleep, [0.0] * self.workers))
+        return pool
+
+    def _replace_pool(self, pool: ProcessPoolExecutor):
+        # a worker died (eg. killed by the OOM killer) and the pool refuses all work: start a new one
+        with self._pool_lock:
+            if self._pool is pool:
+                logging.error("Worker process died, restarting the worker pool")
+                pool.shutdown(wait=False)
+                self._pool = self._start_pool()
+
+    def extract(self, data: bytes, feat_keys: List[str] = None, sr: int = None):
+        """Extract features from encoded audio (or raw float32 PCM at rate sr).
+        Args:
+            data (bytes): encoded audio or raw little-endian float32 samples
+            feat_keys (List[str], optional): feature type keys. Defaults to the warmed up ones.
+            sr (int, optional): sampling rate of raw PCM data. Defaults to None (encoded audio).
+        Returns:
+            Tuple[Dict[str, np.array], Dict[str, float]]: features and timings (queue, decode, extract, total)
+        Raises:
+            ValueError: if raw PCM data is not a whole number of samples
+            ExtractionError: if decoding or a feature fails, or the worker died (reason "exception")
+        """
+        _check_pcm(data, sr)
+        feat_keys = list(feat_keys or self.feat_keys)
+        submitted = time.time()
+        start = time.perf_counter()
+        if self._pool is not None:
+            pool = self._pool
+            try:
+                features, error, timings, started = pool.submit(_extract_request, data, feat_keys, sr).result()
+            except BrokenProcessPool as e:
+                self._replace_pool(pool)
+                features, error, timings, started = {}, ("exception", f"Worker process died: {e}", []), {}, submitted
+        else:
+            features, error, timings, started = _extract_request(data, feat_keys, sr)
+        timings["queue"] = max(0.0, started - submitted)
+        timings["total"] = time.perf_counter() - start
+        with self._lock:
+            self._requests += 1
+            self._errors += error is not None
+            self._latencies.append(timings["total"])
+        if error is not None:
+            raise ExtractionError(error[0], error[1], error[2])
+        return features, timings
+
+    def stats(self):
+        """Request counts and latency percentiles (seconds) over the recent requests."""
+        with self._lock:
+            latencies = np.array(self._latencies)
+            stats = {"requests": self._requests, "errors": self._errors, "workers": self.workers}
+        if len(latencies):
+            stats["latency"] = {"mean": float(latencies.mean()), "p50": float(np.percentile(latencies, 50)),
+                                "p95": float(np.percentile(latencies, 95)), "max": float(latencies.max())}
+        return stats
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """POST /extract?feat_keys=cqt_20,cens[&sr=22050] with encoded audio (or raw float32 PCM if sr
+    is given) as body answers with the features as .npz and the timings in X-Timings.
+    GET /health and GET /stats answer with JSON."""
+    protocol_version = "HTTP/1.1"
+    service = None
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._json(200, {"status": "ok", "feat_keys": self.service.feat_keys})
+        elif path == "/stats":
+            self._json(200, self.service.stats())
+        else:
+            self._json(404, {"message": f"Unknown path {path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/extract":
+            self._json(404, {"message": f"Unknown path {url.path}"})
+            return
+        query = parse_qs(url.query)
+        feat_keys = [key for value in query.get("feat_keys", []) for key in value.split(",") if key] or None
+        try:
+            sr = int(query["sr"][0]) if "sr" in query else None
+            data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            _check_pcm(data, sr)
+        except ValueError as e:
+            self._json(400, {"message": str(e)})
+            return
+        try:
+            features, timings = self.service.extract(data, feat_keys, sr)
+        except ExtractionError as e:
+            self._json(422, {"reason": e.reason, "message": e.message, "failed_keys": e.feat_keys})
+            return
+        buffer = io.BytesIO()
+        np.savez(buffer, **features)
+        body = buffer.getvalue()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Timings", json.dumps(timings))
+        self.end_headers()
+        self.wfile.write(body)
+        logging.info(f"extract {','.join(features)} ({len(data)} bytes) in {timings['total'] * 1000:.1f} ms "
+                     f"({', '.join(f'{k} {v * 1000:.1f}' for k, v in timings.items() if k != 'total')})")
+
+    def _json(self, status: int, payload: Dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # client_address is empty on Unix sockets
+        logging.debug(format % args)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service: ExtractionService, host: str = "127.0.0.1", port: int = 8765, socket_path: str = None):
+    """HTTP server for the service, on a Unix socket if socket_path is given, else on host:port.
+    Returns:
+        socketserver.BaseServer: server, call serve_forever()
+    """
+    handler = type("Handler", (_Handler,), {"service": service})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return _UnixHTTPServer(socket_path, handler)
+    return http.server.ThreadingHTTPServer((host, port), handler)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float = None) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request_features(address: str, data: bytes, feat_keys: List[str] = None, sr: int = None, timeout: float = None):
+    """Client of a running service.
+    Args:
+        address (str): "host:port" or the path of a Unix socket
+        data (bytes): encoded audio, or raw float32 PCM if sr is given
+        feat_keys (List[str], optional): feature type keys. Defaults to the ones of the service.
+        sr (int, optional): sampling rate of raw PCM data. Defaults to None.
+        timeout (float, optional): socket timeout in seconds. Defaults to None.
+    Returns:
+        Tuple[Dict[str, np.array], Dict[str, float]]: features and server side timings
+    Raises:
+        ExtractionError: if the service could not extract the features
+    """
+    if os.path.sep in address or ":" not in address:
+        conn = _UnixHTTPConnection(address, timeout)
+    else:
+        host, port = address.rsplit(":", 1)
+        conn = http.client.HTTPConnection(host, int(port), timeout=timeout)
+    query = []
+    if feat_keys:
+        query.append("feat_keys=" + ",".join(feat_keys))
+    if sr:
+        query.append(f"sr={sr}")
+    try:
+        conn.request("POST", "/extract" + ("?" + "&".join(query) if query else ""), body=data)
+        response = conn.getresponse()
+        body = response.read()
+    finally:
+        conn.close()
+    if response.status != 200:
+        error = json.loads(body or b"{}")
+        raise ExtractionError(error.get("reason", "service_error"), error.get("message", f"HTTP {response.status}"),
+                              error.get("failed_keys"))
+    with np.load(io.BytesIO(body)) as npz:
+        features = {key: npz[key] for key in npz.files}
+    return features, json.loads(response.getheader("X-Timings", "{}"))
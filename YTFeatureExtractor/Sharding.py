@@ -0,0 +1,209 @@
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    """Parse a shard specification "i/N" (0 <= i < N).
+    Returns:
+        Tuple[int, int]: shard index and number of shards
+    """
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard {shard}, expected i/N")
+    if not 0 <= index < count:
+        raise ValueError(f"Invalid shard {shard}, expected 0 <= i < N")
+    return index, count
+
+
+def shard_of(yt_id: str, count: int):
+    """Shard of a youtube identifier, stable across machines and Python versions."""
+    return int(hashlib.sha1(yt_id.encode()).hexdigest()[:8], 16) % count
+
+
+def select_shard(yt_ids: Iterable[str], index: int, count: int) -> List[str]:
+    """Youtube identifiers of shard index out of count, in their given order."""
+    return [yt_id for yt_id in yt_ids if shard_of(yt_id, count) == index]
+
+
+class WorkQueue(object):
+    """Work queue of youtube identifiers in a SQLite file on shared storage, from which several
+    nodes claim batches. A claim is a lease: a node renews the leases of its batch while working
+    on it (see heartbeat), and leases of a crashed node expire after lease seconds so another
+    node takes the work over. Identifiers whose lease expired max_attempts times are given up
+    as failed ("lease_expired"), so a track that crashes nodes does not crash them all.
+    Claims are serialized by SQLite's file lock (rollback journal, WAL needs shared memory), so
+    the shared file system must support POSIX locks.
+    Args:
+        path (str): database file path
+        lease (float, optional): lease duration in seconds. Defaults to 600.
+        max_attempts (int, optional): claims of an identifier before it is given up. Defaults to 3.
+        node (str, optional): name of this node. Defaults to host, pid and a random suffix.
+    """
+    # SQLite limits the number of host parameters per statement
+    QUERY_BATCH = 900
+
+    def __init__(self, path: str, lease: float = 600.0, max_attempts: int = 3, node: str = None) -> None:
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.node = node or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._lock = threading.RLock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # transactions are explicit, claims take the write lock up front (BEGIN IMMEDIATE)
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS work ("
+            "yt_id TEXT PRIMARY KEY, status TEXT NOT NULL, node TEXT, expires REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, reason TEXT, updated REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS work_status ON work (status, expires)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Return unfinished claims of this node to the queue and close the database."""
+        self.release()
+        self.conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def add(self, yt_ids: Iterable[str], batch_size: int = 10000):
+        """Add youtube identifiers, ignoring known ones, so every node may add the same list.
+        Returns:
+            int: newly added identifiers
+        """
+        added, batch = 0, []
+        for yt_id in yt_ids:
+            batch.append((yt_id, time.time()))
+            if len(batch) == batch_size:
+                added += self._add(batch)
+                batch = []
+        if batch:
+            added += self._add(batch)
+        return added
+
+    def _add(self, rows: List[Tuple[str, float]]):
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO work (yt_id, status, updated) VALUES (?, 'pending', ?)", rows)
+            return conn.total_changes - before
+
+    def claim(self, n: int) -> List[str]:
+        """Claim up to n pending identifiers or identifiers with expired leases, in insertion order.
+        Returns:
+            List[str]: claimed youtube identifiers, empty once the queue is drained
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("UPDATE work SET status = 'failed', reason = 'lease_expired', updated = ? "
+                         "WHERE status = 'leased' AND expires < ? AND attempts >= ?", (now, now, self.max_attempts))
+            yt_ids = [row[0] for row in conn.execute(
+                "SELECT yt_id FROM work WHERE status = 'pending' OR (status = 'leased' AND expires < ?) "
+                "ORDER BY rowid LIMIT ?", (now, n))]
+            conn.executemany("UPDATE work SET status = 'leased', node = ?, expires = ?, attempts = attempts + 1, "
+                             "updated = ? WHERE yt_id = ?",
+                             [(self.node, now + self.lease, now, yt_id) for yt_id in yt_ids])
+        return yt_ids
+
+    def renew(self):
+        """Extend the leases this node holds.
+        Returns:
+            int: renewed leases
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            return conn.execute("UPDATE work SET expires = ? WHERE status = 'leased' AND node = ?",
+                                (now + self.lease, self.node)).rowcount
+
+    @contextmanager
+    def heartbeat(self, interval: float = None):
+        """Renew this node's leases every interval seconds (default: a third of the lease) while
+        the context is active."""
+        interval = interval or self.lease / 3
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.renew()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, yt_id: str, success: bool, reason: str = None):
+        """Record the outcome of a claimed identifier ("done" or "failed" with reason)."""
+        with self._transaction() as conn:
+            conn.execute("UPDATE work SET status = ?, reason = ?, expires = NULL, updated = ? WHERE yt_id = ?",
+                         ("done" if success else "failed", reason, time.time(), yt_id))
+
+    def release(self):
+        """Return the unfinished claims of this node to the queue (eg. on a clean shutdown)."""
+        with self._transaction() as conn:
+            return conn.execute("UPDATE work SET status = 'pending', node = NULL, expires = NULL, "
+                                "attempts = MAX(0, attempts - 1) WHERE status = 'leased' AND node = ?",
+                                (self.node,)).rowcount
+
+    def next_expiry(self):
+        """Earliest expiry of a lease, None if no identifier is leased."""
+        with self._lock:
+            return self.conn.execute("SELECT MIN(expires) FROM work WHERE status = 'leased'").fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of identifiers per status (pending, leased, done, failed)."""
+        with self._lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM work GROUP BY status").fetchall())
+
+
+def claim_batches(work_queue: WorkQueue, batches: Iterable[List[str]], batch_size: int,
+                  poll: float = None) -> Iterator[List[str]]:
+    """Claim batches from a work queue until no identifier is pending or leased, adding the
+    batches of the list in between (nodes add the same identifiers idempotently). Once nothing
+    is left to claim, this waits for the leases of other nodes: they either complete, or expire
+    (eg. of a crashed node) and are taken over.
+    Args:
+        work_queue (WorkQueue): shared work queue
+        batches (Iterable[List[str]]): youtube identifiers to add
+        batch_size (int): identifiers claimed at once
+        poll (float, optional): longest wait for leases in seconds. Defaults to a third of the lease.
+    Yields:
+        List[str]: claimed youtube identifiers, to be completed before the next batch is claimed
+    """
+    batches = iter(batches)
+    poll = poll or work_queue.lease / 3
+    while True:
+        batch = next(batches, None)
+        if batch is not None:
+            work_queue.add(batch)
+        claimed = work_queue.claim(batch_size)
+        if claimed:
+            yield claimed
+        elif batch is None:
+            expires = work_queue.next_expiry()
+            if expires is None:
+                return
+            time.sleep(min(max(expires - time.time(), 0.0) + 0.1, poll))
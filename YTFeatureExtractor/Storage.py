@@ -0,0 +1,365 @@
+import functools
+import importlib.util
+import logging
+import os
+import tempfile
+from typing import Callable, Dict, NamedTuple, Optional
+import numpy as np
+
+# axis along which features grow with track length, defaults to the last axis
+TIME_AXES = {"cqt_ch": 0}
+
+CODECS = ["none", "lzf", "gzip", "blosc_lz4"]
+QUANTIZATIONS = [None, "float16", "uint8"]
+
+
+def time_axis(feat_key: str, ndim: int):
+    return TIME_AXES.get(feat_key, -1) % max(1, ndim)
+
+
+class StoragePolicy(NamedTuple):
+    """How a feature dataset is stored.
+    codec is one of CODECS (blosc_lz4 needs hdf5plugin and falls back to lzf), level the
+    codec level (gzip 0-9, blosc 0-9), chunk_frames the chunk length along the time axis
+    (chunks span the full feature axis, so time ranges can be read partially) and quantize
+    one of QUANTIZATIONS; uint8 stores min/max scaling in the dataset attributes."""
+    codec: str = "gzip"
+    level: Optional[int] = None
+    chunk_frames: Optional[int] = 256
+    quantize: Optional[str] = None
+
+
+# default matches the original output: gzip at default level, full precision
+DEFAULT_POLICY = StoragePolicy()
+
+
+def parse_policy(spec: str, base: StoragePolicy = DEFAULT_POLICY):
+    """Parse a policy like "gzip:4", "lzf+float16", "blosc_lz4:5+uint8/512" (codec[:level][+quantize][/chunk_frames]).
+    Args:
+        spec (str): policy specification
+        base (StoragePolicy, optional): policy providing unspecified fields. Defaults to DEFAULT_POLICY.
+    Returns:
+        StoragePolicy: parsed policy
+    """
+    chunk_frames = base.chunk_frames
+    if "/" in spec:
+        spec, chunk = spec.split("/", 1)
+        chunk_frames = int(chunk) if chunk else None
+    quantize = None
+    if "+" in spec:
+        spec, quantize = spec.split("+", 1)
+    level = None
+    if ":" in spec:
+        spec, level = spec.split(":", 1)
+        level = int(level)
+    codec = spec or base.codec
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec}, expected one of {CODECS}")
+    if quantize not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantize}, expected one of {QUANTIZATIONS}")
+    return StoragePolicy(codec, level, chunk_frames, quantize)
+
+
+def format_policy(policy: StoragePolicy, chunks: bool = False):
+    """Inverse of parse_policy, eg. "gzip:4+float16" (with "/chunk_frames" if chunks)."""
+    spec = policy.codec
+    if policy.level is not None:
+        spec += f":{policy.level}"
+    if policy.quantize:
+        spec += f"+{policy.quantize}"
+    if chunks:
+        spec += f"/{policy.chunk_frames or ''}"
+    return spec
+
+
+def parse_policies(spec: str):
+    """Parse comma separated policies, either feat_key=policy or a bare default policy.
+    Args:
+        spec (str): eg. "lzf,cqt_ch=gzip:4+float16"
+    Returns:
+        Dict[str, StoragePolicy]: policies by feature key, None for the default
+    """
+    policies = {}
+    for part in filter(None, (part.strip() for part in (spec or "").split(","))):
+        feat_key, _, policy = part.rpartition("=")
+        policies[feat_key or None] = parse_policy(policy)
+    return policies
+
+
+def set_storage_policies(spec: str):
+    """Configure storage policies for this process and the workers it spawns (see parse_policies)."""
+    if spec:
+        parse_policies(spec)
+        os.environ["YTFE_STORAGE_POLICY"] = spec
+
+
+def get_storage_policy(feat_key: str):
+    """Storage policy of a feature key as configured by YTFE_STORAGE_POLICY.
+    Returns:
+        StoragePolicy: policy
+    """
+    policies = parse_policies(os.environ.get("YTFE_STORAGE_POLICY"))
+    return available_policy(policies.get(feat_key, policies.get(None, DEFAULT_POLICY)))
+
+
+def available_policy(policy: StoragePolicy):
+    """The policy actually applied: blosc_lz4 falls back to lzf without hdf5plugin, so datasets
+    record (see Helper.feature_attrs) and use the codec they are written with.
+    Returns:
+        StoragePolicy: policy
+    """
+    if policy.codec == "blosc_lz4" and not _has_hdf5plugin():
+        return policy._replace(codec="lzf", level=None)
+    return policy
+
+
+@functools.lru_cache(maxsize=None)
+def _has_hdf5plugin():
+    if importlib.util.find_spec("hdf5plugin") is None:
+        logging.warning("hdf5plugin not installed, using lzf instead of blosc_lz4")
+        return False
+    return True
+
+
+def dataset_kwargs(policy: StoragePolicy, shape: tuple, axis: int):
+    """h5py create_dataset arguments (compression and chunks) for a policy.
+    Args:
+        policy (StoragePolicy): storage policy
+        shape (tuple): dataset shape
+        axis (int): time axis
+    Returns:
+        Dict: keyword arguments for create_dataset
+    """
+    kwargs = {}
+    policy = available_policy(policy)
+    if policy.codec == "gzip":
+        kwargs["compression"] = "gzip"
+        if policy.level is not None:
+            kwargs["compression_opts"] = policy.level
+    elif policy.codec == "lzf":
+        kwargs["compression"] = "lzf"
+    elif policy.codec == "blosc_lz4":
+        import hdf5plugin
+        kwargs.update(hdf5plugin.Blosc(cname="lz4", clevel=5 if policy.level is None else policy.level,
+                                       shuffle=hdf5plugin.Blosc.SHUFFLE))
+    if policy.chunk_frames and len(shape) > 0:
+        chunks = [max(1, size) for size in shape]
+        chunks[axis] = max(1, min(policy.chunk_frames, shape[axis] or policy.chunk_frames))
+        kwargs["chunks"] = tuple(chunks)
+    elif kwargs:
+        kwargs["chunks"] = True
+    return kwargs
+
+
+def encode(data: np.array, policy: StoragePolicy, low: float = None, high: float = None):
+    """Quantize a feature according to the policy.
+    Args:
+        data (np.array): feature
+        policy (StoragePolicy): storage policy
+        low (float, optional): uint8 range minimum, for blocks of a larger feature. Defaults to the data minimum.
+        high (float, optional): uint8 range maximum. Defaults to the data maximum.
+    Returns:
+        Tuple[np.array, Dict]: stored array and dataset attributes needed to decode it
+    """
+    data = np.asarray(data)
+    if policy.quantize == "float16":
+        return data.astype(np.float16), {"quantize": "float16", "dtype": str(data.dtype)}
+    if policy.quantize == "uint8":
+        if low is None:
+            low = float(np.min(data)) if data.size else 0.0
+        if high is None:
+            high = float(np.max(data)) if data.size else 0.0
+        scale = (high - low) / 255 or 1.0
+        quantized = np.round((data - low) / scale).astype(np.uint8)
+        return quantized, {"quantize": "uint8", "scale": scale, "offset": low, "dtype": str(data.dtype)}
+    return data, {}
+
+
+def decode(data: np.array, attrs: Dict):
+    """Undo the quantization of a stored feature.
+    Args:
+        data (np.array): stored array
+        attrs (Dict): dataset attributes
+    Returns:
+        np.array: feature
+    """
+    quantize = attrs.get("quantize")
+    if quantize == "uint8":
+        return (data.astype(attrs.get("dtype", "float32")) * attrs["scale"] + attrs["offset"])
+    if quantize == "float16":
+        return data.astype(attrs.get("dtype", "float32"))
+    return data
+
+
+def write_feature(file_out, feat_key: str, feature: np.array, policy: StoragePolicy = None, attrs: Dict = None):
+    """Write a feature dataset according to its storage policy.
+    Args:
+        file_out (h5py.File): output file (or TrackView)
+        feat_key (str): feature type key
+        feature (np.array): feature
+        policy (StoragePolicy, optional): storage policy. Defaults to the configured one.
+        attrs (Dict, optional): further dataset attributes (eg. extractor version). Defaults to None.
+    """
+    policy = policy or get_storage_policy(feat_key)
+    data, codec_attrs = encode(feature, policy)
+    kwargs = dataset_kwargs(policy, data.shape, time_axis(feat_key, data.ndim))
+    dataset = file_out.create_dataset(feat_key, data=data, **kwargs)
+    for name, value in {**(attrs or {}), **codec_attrs}.items():
+        dataset.attrs[name] = value
+    return dataset
+
+
+def read_feature(file_in, feat_key: str):
+    """Read and decode a feature dataset written by write_feature.
+    Args:
+        file_in (h5py.File): feature file
+        feat_key (str): feature type key
+    Returns:
+        np.array: feature
+    """
+    dataset = file_in[feat_key]
+    return decode(dataset[()], dict(dataset.attrs))
+
+
+class FeatureWriter(object):
+    """Writes a feature block by block along its time axis into a resizable dataset (or the
+    shard of a TrackView), so features of long tracks are never held in memory as a whole.
+    Blocks go to a temporary dataset that is renamed on close, so an interrupted write never
+    looks like a finished feature. If the stored values depend on the whole feature (a
+    transform such as normalization by the global maximum, or uint8 quantization), blocks
+    are kept in a scratch file first and transformed and encoded block by block on close.
+    Use as context manager: the feature is discarded if the block raises.
+    Args:
+        file_out (h5py.File): output file (or TrackView)
+        feat_key (str): feature type key
+        policy (StoragePolicy, optional): storage policy. Defaults to the configured one.
+        transform (Callable, optional): maps (block, low, high), with the global minimum and maximum
+            of the written blocks, to the stored block. Defaults to None.
+        copy_frames (int, optional): frames per block when copying from the scratch file. Defaults to 4096.
+        attrs (Dict, optional): further dataset attributes (eg. extractor version). Defaults to None.
+    """
+    def __init__(self, file_out, feat_key: str, policy: StoragePolicy = None, transform: Callable = None,
+                 copy_frames: int = 4096, attrs: Dict = None) -> None:
+        self.file_out = file_out
+        self.feat_key = feat_key
+        self.policy = policy or get_storage_policy(feat_key)
+        self.transform = transform
+        self.copy_frames = copy_frames
+        self.attrs = dict(attrs or {})
+        self.low, self.high = np.inf, -np.inf
+        self._partial = f"_partial_{feat_key}"
+        self._dataset = None
+        self._attrs = {}
+        self._scratch = None
+        self._scratch_path = None
+        if not hasattr(file_out, "append") and self._partial in file_out:
+            # left over by an interrupted run
+            del file_out[self._partial]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def _deferred(self):
+        return self.transform is not None or self.policy.quantize == "uint8"
+
+    def append(self, block: np.array):
+        """Append a block of frames (in the orientation of the feature)."""
+        block = np.asarray(block)
+        if block.size == 0:
+            return
+        self.low = min(self.low, float(np.min(block)))
+        self.high = max(self.high, float(np.max(block)))
+        if self._deferred():
+            if self._scratch is None:
+                import h5py
+                fd, self._scratch_path = tempfile.mkstemp(suffix=".h5", prefix="ytfe_")
+                os.close(fd)
+                self._scratch = h5py.File(self._scratch_path, "w")
+            self._append(self._scratch, "raw", block, {})
+        else:
+            data, self._attrs = encode(block, self.policy)
+            self._write(data)
+
+    def close(self):
+        """Finish the feature: encode deferred blocks and publish the dataset under feat_key."""
+        if self._scratch is not None:
+            try:
+                raw = self._scratch["raw"]
+                axis = time_axis(self.feat_key, raw.ndim)
+                low, high = self.low, self.high
+                if self.transform is not None and self.policy.quantize == "uint8":
+                    # the uint8 range is the one of the transformed feature
+                    low, high = np.inf, -np.inf
+                    for block in self._raw_blocks(raw, axis):
+                        block = self.transform(block, self.low, self.high)
+                        low, high = min(low, float(np.min(block))), max(high, float(np.max(block)))
+                for block in self._raw_blocks(raw, axis):
+                    if self.transform is not None:
+                        block = self.transform(block, self.low, self.high)
+                    data, self._attrs = encode(block, self.policy, low, high)
+                    self._write(data)
+            finally:
+                self._close_scratch()
+        attrs = {**self.attrs, **self._attrs}
+        if hasattr(self.file_out, "append"):
+            self.file_out.set_attrs(self.feat_key, attrs)
+        elif self._dataset is not None:
+            for name, value in attrs.items():
+                self._dataset.attrs[name] = value
+            self.file_out.move(self._partial, self.feat_key)
+
+    def discard(self):
+        """Drop everything written so far."""
+        self._close_scratch()
+        if hasattr(self.file_out, "append"):
+            self.file_out.discard(self.feat_key)
+        elif self._partial in self.file_out:
+            del self.file_out[self._partial]
+
+    def _raw_blocks(self, raw, axis: int):
+        for start in range(0, raw.shape[axis], self.copy_frames):
+            index = [slice(None)] * raw.ndim
+            index[axis] = slice(start, start + self.copy_frames)
+            yield raw[tuple(index)]
+
+    def _write(self, data: np.array):
+        if hasattr(self.file_out, "append"):
+            self.file_out.append(self.feat_key, data)
+        else:
+            self._dataset = self._append(self.file_out, self._partial, data, dataset_kwargs(
+                self.policy, data.shape, time_axis(self.feat_key, data.ndim)))
+
+    def _append(self, file, name: str, data: np.array, kwargs: Dict):
+        axis = time_axis(self.feat_key, data.ndim)
+        if name not in file:
+            shape = list(data.shape)
+            shape[axis] = 0
+            maxshape = list(data.shape)
+            maxshape[axis] = None
+            kwargs = dict(kwargs)
+            kwargs.setdefault("chunks", True)
+            file.create_dataset(name, shape=tuple(shape), maxshape=tuple(maxshape), dtype=data.dtype, **kwargs)
+        dataset = file[name]
+        offset = dataset.shape[axis]
+        dataset.resize(offset + data.shape[axis], axis=axis)
+        index = [slice(None)] * data.ndim
+        index[axis] = slice(offset, offset + data.shape[axis])
+        dataset[tuple(index)] = data
+        return dataset
+
+    def _close_scratch(self):
+        if self._scratch is not None:
+            self._scratch.close()
+            self._scratch = None
+        if self._scratch_path is not None:
+            try:
+                os.remove(self._scratch_path)
+            except OSError:
+                pass
+            self._scratch_path = None
@@ -0,0 +1,392 @@
+import fcntl
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from multiprocessing.util import Finalize
+from typing import Dict, Iterable
+import numpy as np
+from YTFeatureExtractor.Storage import dataset_kwargs, decode, get_storage_policy, time_axis
+
+
+class ShardedStore(object):
+    """Feature store appending all tracks into a bounded number of HDF5 shard files, instead
+    of one small .h5 file per video. Each feature key is one resizable dataset per shard in
+    which tracks are concatenated along the time axis; an SQLite index maps
+    (yt_id, feat_key) to shard, dataset, offset and length.
+    Every writing process claims one shard via a lock file and keeps it for its lifetime, so
+    each shard has a single writer and parallel workers never contend. Shards are meant to be
+    read once writing has finished. Codec and chunking of a shard dataset follow the storage
+    policy of its feature key; quantization attributes are kept per track in the index.
+    Args:
+        root (str): store directory
+        num_shards (int, optional): maximum number of shards (and concurrent writers). Defaults to 64.
+    """
+    def __init__(self, root: str, num_shards: int = 64) -> None:
+        self.root = root
+        self.num_shards = num_shards
+        self._shard = None
+        self._shard_file = None
+        self._lock_file = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        os.makedirs(root, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, "index.sqlite"), timeout=120, check_same_thread=False)
+        # rollback journal, the store may sit on shared storage (WAL needs shared memory, see Sharding.WorkQueue)
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS features (yt_id TEXT NOT NULL, feat_key TEXT NOT NULL, "
+            "shard INTEGER NOT NULL, dataset TEXT NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL, "
+            "attrs TEXT, PRIMARY KEY (yt_id, feat_key))")
+        self.conn.commit()
+
+    def shard_path(self, shard: int):
+        return os.path.join(self.root, f"shard_{shard:04d}.h5")
+
+    def _claim_shard(self):
+        # take the first shard no other process is writing to
+        for shard in range(self.num_shards):
+            lock_file = open(self.shard_path(shard) + ".lock", "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                continue
+            import h5py
+            self._lock_file = lock_file
+            self._shard = shard
+            self._shard_file = h5py.File(self.shard_path(shard), "a")
+            return
+        raise RuntimeError(f"All {self.num_shards} shards in {self.root} are in use")
+
+    def sync(self):
+        """Flush the claimed shard and fsync it."""
+        with self._lock:
+            if self._shard_file is not None:
+                self._shard_file.flush()
+                fd = os.open(self.shard_path(self._shard), os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+    def close(self):
+        """Close the claimed shard and release it for other writers."""
+        with self._lock:
+            if self._shard_file is not None:
+                self._shard_file.close()
+                self._lock_file.close()
+                self._shard_file = self._lock_file = self._shard = None
+            self.conn.close()
+
+    def keys(self, yt_id: str):
+        """Feature keys stored for yt_id."""
+        with self._lock:
+            return [row[0] for row in self.conn.execute("SELECT feat_key FROM features WHERE yt_id = ?", (yt_id,))]
+
+    def attrs(self, yt_id: str, feat_key: str):
+        """Dataset attributes of a stored feature."""
+        with self._lock:
+            row = self.conn.execute("SELECT attrs FROM features WHERE yt_id = ? AND feat_key = ?",
+                                    (yt_id, feat_key)).fetchone()
+        if row is None:
+            raise KeyError(feat_key)
+        return json.loads(row[0] or "{}")
+
+    def delete(self, yt_id: str, feat_key: str):
+        """Remove a feature from the index. HDF5 does not reclaim space in place, the shard data
+        is left unreferenced (like that of replaced features) until compact rewrites the shard."""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM features WHERE yt_id = ? AND feat_key = ?", (yt_id, feat_key))
+
+    def compact(self):
+        """Rewrite shards holding unreferenced data (deleted or replaced features, blocks of
+        crashed writers) into new shard files with only the indexed features, and remove
+        shards without any. Shards claimed by a writer are skipped. Compacted shards are
+        numbered from num_shards on, so writers never append to them. Run it while the store
+        is not read: a reader may find a shard file gone.
+        Returns:
+            int: bytes reclaimed
+        """
+        import h5py
+        shards = sorted(int(match.group(1)) for match in map(re.compile(r"shard_(\d+)\.h5$").match,
+                                                               os.listdir(self.root)) if match)
+        next_shard = max([self.num_shards - 1] + shards) + 1
+        reclaimed = 0
+        for shard in shards:
+            if shard == self._shard:
+                continue
+            path = self.shard_path(shard)
+            lock_file = open(path + ".lock", "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                continue
+            try:
+                with self._lock:
+                    rows = self.conn.execute("SELECT yt_id, feat_key, dataset, offset, length FROM features "
+                                             "WHERE shard = ? ORDER BY dataset, offset", (shard,)).fetchall()
+                size = os.path.getsize(path)
+                with h5py.File(path, "r") as src:
+                    lengths = {name: src[name].shape[time_axis(name, src[name].ndim)] for name in src}
+                if rows and sum(row[4] for row in rows) == sum(lengths.values()):
+                    continue
+                if rows:
+                    new_path = self.shard_path(next_shard)
+                    updates = self._copy_rows(shard, next_shard, rows)
+                    # new shard first, then the index, then the old shard: a crash leaves an unreferenced shard
+                    with self._lock, self.conn:
+                        self.conn.executemany("UPDATE features SET shard = ?, offset = ? "
+                                              "WHERE yt_id = ? AND feat_key = ? AND shard = ?", updates)
+                    reclaimed -= os.path.getsize(new_path)
+                    next_shard += 1
+                os.remove(path)
+                reclaimed += size
+            finally:
+                lock_file.close()
+        return reclaimed
+
+    def _copy_rows(self, shard: int, new_shard: int, rows):
+        # copy the indexed ranges of shard into the new shard, returns the index updates
+        import h5py
+        updates = []
+        new_path = self.shard_path(new_shard)
+        with h5py.File(self.shard_path(shard), "r") as src, h5py.File(new_path, "w") as dst:
+            for name in sorted(set(row[2] for row in rows)):
+                entries = [row for row in rows if row[2] == name]
+                source = src[name]
+                axis = time_axis(name, source.ndim)
+                shape = list(source.shape)
+                shape[axis] = sum(length for *_, length in entries)
+                target = dst.create_dataset_like(name, source, shape=tuple(shape))
+                position = 0
+                for yt_id, feat_key, _, offset, length in entries:
+                    source_index = [slice(None)] * source.ndim
+                    source_index[axis] = slice(offset, offset + length)
+                    target_index = [slice(None)] * source.ndim
+                    target_index[axis] = slice(position, position + length)
+                    target[tuple(target_index)] = source[tuple(source_index)]
+                    updates.append((new_shard, position, yt_id, feat_key, shard))
+                    position += length
+        fd = os.open(new_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return updates
+
+    def write(self, yt_id: str, features: Dict[str, np.array], attrs: Dict[str, Dict] = None):
+        """Append the features of one track to this process' shard and index them.
+        Args:
+            yt_id (str): youtube identifier
+            features (Dict[str, np.array]): feature arrays by feature key
+            attrs (Dict[str, Dict], optional): dataset attributes by feature key. Defaults to None.
+        """
+        attrs = attrs or {}
+        if not features:
+            return
+        with self._lock:
+            rows = []
+            for feat_key, data in features.items():
+                data = np.asarray(data)
+                offset = self._append(feat_key, data, yt_id)
+                rows.append((yt_id, feat_key, self._shard, feat_key, offset, data.shape[time_axis(feat_key, data.ndim)],
+                             json.dumps(attrs.get(feat_key, {}))))
+            self._index(rows)
+
+    def append(self, feat_key: str, data: np.array):
+        """Append a block of a feature to this process' shard without indexing it (see index).
+        Returns:
+            int: offset of the block along the time axis
+        """
+        with self._lock:
+            return self._append(feat_key, np.asarray(data))
+
+    def index(self, yt_id: str, feat_key: str, offset: int, length: int, attrs: Dict = None):
+        """Index a feature appended block by block to this process' shard."""
+        with self._lock:
+            self._index([(yt_id, feat_key, self._shard, feat_key, offset, length, json.dumps(attrs or {}))])
+
+    def _append(self, feat_key: str, data: np.array, yt_id: str = None):
+        if self._shard_file is None:
+            self._claim_shard()
+        axis = time_axis(feat_key, data.ndim)
+        if feat_key not in self._shard_file:
+            shape = list(data.shape)
+            shape[axis] = 0
+            maxshape = list(data.shape)
+            maxshape[axis] = None
+            kwargs = dataset_kwargs(get_storage_policy(feat_key), tuple(shape), axis)
+            kwargs.setdefault("chunks", True)
+            self._shard_file.create_dataset(feat_key, shape=tuple(shape), maxshape=tuple(maxshape),
+                                            dtype=data.dtype, **kwargs)
+        dataset = self._shard_file[feat_key]
+        if np.delete(dataset.shape, axis).tolist() != np.delete(data.shape, axis).tolist():
+            raise ValueError(f"{feat_key} of {yt_id} has shape {data.shape}, shard has {dataset.shape}")
+        offset = dataset.shape[axis]
+        length = data.shape[axis]
+        dataset.resize(offset + length, axis=axis)
+        index = [slice(None)] * data.ndim
+        index[axis] = slice(offset, offset + length)
+        dataset[tuple(index)] = data
+        return offset
+
+    def _index(self, rows):
+        # data first, then the index: a crash leaves unreferenced data, never a dangling entry
+        self._shard_file.flush()
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def read(self, yt_ids: Iterable[str], feat_key: str):
+        """Fetch a feature for a batch of videos, opening each shard once.
+        Args:
+            yt_ids (Iterable[str]): youtube identifiers
+            feat_key (str): feature type key
+        Returns:
+            Dict[str, np.array]: features by youtube identifier (missing ones are left out)
+        """
+        yt_ids = list(yt_ids)
+        locations = defaultdict(list)
+        with self._lock:
+            for i in range(0, len(yt_ids), 900):
+                batch = yt_ids[i:i + 900]
+                for yt_id, shard, dataset, offset, length, attrs in self.conn.execute(
+                        f"SELECT yt_id, shard, dataset, offset, length, attrs FROM features WHERE feat_key = ? "
+                        f"AND yt_id IN ({','.join('?' * len(batch))})", [feat_key] + batch):
+                    locations[shard].append((yt_id, dataset, offset, length, attrs))
+        import h5py
+        features = {}
+        for shard, entries in locations.items():
+            with h5py.File(self.shard_path(shard), "r") as f:
+                for yt_id, dataset, offset, length, attrs in entries:
+                    data = f[dataset]
+                    index = [slice(None)] * data.ndim
+                    index[time_axis(feat_key, data.ndim)] = slice(offset, offset + length)
+                    features[yt_id] = decode(data[tuple(index)], json.loads(attrs or "{}"))
+        return features
+
+    def track(self, yt_id: str):
+        """h5py.File-like view on one track, for extract_features."""
+        return TrackView(self, yt_id)
+
+
+class TrackView(object):
+    """Collects the features of one track and writes them to the store on close.
+    Supports the subset of the h5py.File interface used by extract_features.
+    Args:
+        store (ShardedStore): feature store
+        yt_id (str): youtube identifier
+    """
+    def __init__(self, store: ShardedStore, yt_id: str) -> None:
+        self.store = store
+        self.yt_id = yt_id
+        self._stored = set(store.keys(yt_id))
+        self._features = {}
+        self._attrs = {}
+        # features appended block by block (see FeatureWriter): [offset, length] and attributes
+        self._appended = {}
+        self._appended_attrs = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.close()
+
+    def keys(self):
+        return list(self._stored) + list(self._features)
+
+    def __contains__(self, feat_key: str):
+        return feat_key in self._stored or feat_key in self._features
+
+    def __getitem__(self, feat_key: str):
+        # only the attributes are available, read data with ShardedStore.read
+        if feat_key in self._features:
+            return _PendingDataset(self._attrs[feat_key])
+        if feat_key in self._stored:
+            return _PendingDataset(self.store.attrs(self.yt_id, feat_key))
+        raise KeyError(feat_key)
+
+    def __delitem__(self, feat_key: str):
+        if feat_key in self._features:
+            del self._features[feat_key]
+            del self._attrs[feat_key]
+        else:
+            self.store.delete(self.yt_id, feat_key)
+            self._stored.discard(feat_key)
+
+    def create_dataset(self, name: str, data: np.array = None, **kwargs):
+        # codec and chunks are fixed per shard dataset, only data and attributes are kept
+        self._features[name] = data
+        self._attrs[name] = {}
+        return _PendingDataset(self._attrs[name])
+
+    def append(self, feat_key: str, data: np.array):
+        offset = self.store.append(feat_key, data)
+        length = np.shape(data)[time_axis(feat_key, np.ndim(data))]
+        if feat_key not in self._appended:
+            self._appended[feat_key] = [offset, 0]
+        start, written = self._appended[feat_key]
+        if offset != start + written:
+            raise RuntimeError(f"Blocks of {feat_key} for {self.yt_id} are not contiguous in the shard")
+        self._appended[feat_key][1] += length
+
+    def set_attrs(self, feat_key: str, attrs: Dict):
+        self._appended_attrs[feat_key] = attrs
+
+    def discard(self, feat_key: str):
+        # appended blocks stay in the shard unreferenced (see ShardedStore.compact)
+        self._appended.pop(feat_key, None)
+        self._appended_attrs.pop(feat_key, None)
+
+    def close(self):
+        self.store.write(self.yt_id, self._features, self._attrs)
+        self._stored.update(self._features)
+        for feat_key, (offset, length) in self._appended.items():
+            self.store.index(self.yt_id, feat_key, offset, length, self._appended_attrs.get(feat_key))
+            self._stored.add(feat_key)
+        self._features = {}
+        self._attrs = {}
+        self._appended = {}
+        self._appended_attrs = {}
+
+
+class _PendingDataset(object):
+    def __init__(self, attrs: Dict) -> None:
+        self.attrs = attrs
+
+
+_store = None
+
+
+def set_feature_store(root: str, num_shards: int = None):
+    """Configure the sharded feature store for this process and the workers it spawns.
+    Args:
+        root (str): store directory, None keeps the environment configuration
+        num_shards (int, optional): maximum number of shards. Defaults to 64.
+    """
+    if root:
+        os.environ["YTFE_FEATURE_STORE"] = root
+        os.environ.pop("YTFE_FEATURE_STORE_SHARDS", None)
+        if num_shards:
+            os.environ["YTFE_FEATURE_STORE_SHARDS"] = str(num_shards)
+
+
+def get_feature_store():
+    """ShardedStore configured by YTFE_FEATURE_STORE and YTFE_FEATURE_STORE_SHARDS, opened once per process.
+    Returns:
+        ShardedStore: store or None
+    """
+    global _store
+    root = os.environ.get("YTFE_FEATURE_STORE")
+    if not root:
+        return None
+    # a store inherited through fork shares the parent's connection and shard, open a new one
+    if _store is None or _store.root != root or _store._pid != os.getpid():
+        _store = ShardedStore(root, int(os.environ.get("YTFE_FEATURE_STORE_SHARDS", 64)))
+        # close the shard when a pool worker exits
+        Finalize(_store, _store.close, exitpriority=10)
+    return _store
@@ -0,0 +1,224 @@
+import logging
+import librosa
+import numpy as np
+from typing import Callable, List
+from YTFeatureExtractor.Audio import StreamedAudio
+from YTFeatureExtractor.Helper import dataset_attrs, downsampling, feature_attrs, pending_features
+from YTFeatureExtractor.Metrics import stage
+from YTFeatureExtractor.Precision import cast
+from YTFeatureExtractor.PyCQT import PyCqt
+from YTFeatureExtractor.SBBC import SBBC, get_melodia_workers
+from YTFeatureExtractor.Storage import FeatureWriter, write_feature
+
+# seconds of audio processed at once, bounds the peak memory independently of the track length
+STREAM_BLOCK_SECONDS = 120
+
+# frames of context on each side of a block, beyond the reach of the features' windows
+# (CQT filters up to ~0.5s, 43 frame CENS smoothing, STFT and onset lag)
+CQT_CONTEXT = 128
+STFT_CONTEXT = 8
+
+
+def frame_blocks(y: np.array, hop: int, n_frames: int, block_frames: int, context: int, func: Callable):
+    """Apply a frame-wise feature to overlapping segments of a (memory-mapped) signal.
+    func maps a segment starting at a multiple of hop to frames along the last axis, frame j
+    at segment sample j * hop. Each block of block_frames frames is computed from a segment
+    extended by context frames on both sides, so its frames equal the ones of the whole signal
+    as long as the feature does not look further than context frames.
+    Args:
+        y (np.array): signal
+        hop (int): hop size in samples
+        n_frames (int): number of frames of the whole signal
+        block_frames (int): frames per block
+        context (int): context frames
+        func (Callable): frame-wise feature
+    Yields:
+        np.array: frames of consecutive blocks
+    """
+    for start in range(0, n_frames, block_frames):
+        stop = min(start + block_frames, n_frames)
+        first = max(0, start - context)
+        segment = np.asarray(y[first * hop:min(len(y), (stop + context) * hop)])
+        yield func(segment)[..., start - first:stop - first]
+
+
+class TuningEstimate(object):
+    """Block-wise librosa.estimate_tuning in memory independent of the track length. Pitch
+    residuals are counted in a joint histogram with the log magnitude of their peak, since
+    the median magnitude threshold is only known once all blocks are seen. When the bin
+    holding the median leaves the peak of the residual histogram undecided, refine() narrows
+    the magnitude range to that bin for another pass over the blocks. After MAX_PASSES passes
+    a bin is narrower than the float32 spacing of magnitudes, so the result equals
+    estimate_tuning on the whole spectrogram.
+    Args:
+        sr (int): sampling rate
+        bins_per_octave (int, optional): bins per octave. Defaults to 12.
+        resolution (float, optional): tuning resolution in bins. Defaults to 0.01.
+    """
+    # log2 magnitude range of the first pass, and bins per pass
+    MAG_RANGE = (-48.0, 16.0)
+    MAG_BINS = 4096
+    MAX_PASSES = 3
+
+    def __init__(self, sr: int, bins_per_octave: int = 12, resolution: float = 0.01) -> None:
+        self.sr = sr
+        self.bins_per_octave = bins_per_octave
+        self.residual_edges = np.linspace(-0.5, 0.5, int(np.ceil(1.0 / resolution)) + 1)
+        self.counts = np.zeros((self.MAG_BINS, len(self.residual_edges) - 1), dtype=np.int64)
+        # peaks counted by the first pass, below and above (per residual) the refined bin
+        self.total = 0
+        self.below = 0
+        self.above = np.zeros(len(self.residual_edges) - 1, dtype=np.int64)
+        # magnitude bin selected by each previous pass
+        self.path = []
+
+    def add(self, S: np.array):
+        """Count the pitches of a block of STFT magnitudes."""
+        pitch, mag = librosa.piptrack(S=S, sr=self.sr)
+        mask = pitch > 0
+        residual = np.mod(self.bins_per_octave * librosa.hz_to_octs(pitch[mask]), 1.0)
+        residual[residual >= 0.5] -= 1.0
+        mag = np.log2(np.maximum(mag[mask].astype(np.float64), 2.0 ** self.MAG_RANGE[0]))
+        if not self.path:
+            self.total += len(mag)
+        low, width = self.MAG_RANGE[0], self.MAG_RANGE[1] - self.MAG_RANGE[0]
+        inside = np.ones(len(mag), dtype=bool)
+        for selected in self.path + [None]:
+            width /= self.MAG_BINS
+            index = np.clip(np.floor((mag - low) / width), 0, self.MAG_BINS - 1).astype(np.int64)
+            if selected is None:
+                break
+            inside &= index == selected
+            low += selected * width
+        residual_bin = np.clip(np.searchsorted(self.residual_edges, residual[inside], side="right") - 1,
+                               0, len(self.residual_edges) - 2)
+        np.add.at(self.counts, (index[inside], residual_bin), 1)
+
+    def _median_bin(self):
+        # np.median splits an even count between two values: the threshold keeps the peaks
+        # from rank total // 2 (ascending magnitudes) on
+        return int(np.searchsorted(np.cumsum(self.counts.sum(axis=1)), self.total // 2 - self.below, side="right"))
+
+    def refine(self):
+        """Whether another pass over the blocks is needed: then the magnitude range is narrowed
+        to the bin of the median and the counts are reset for the next pass."""
+        if not self.total or len(self.path) + 1 >= self.MAX_PASSES:
+            return False
+        median = self._median_bin()
+        lower = self.above + self.counts[median + 1:].sum(axis=0)
+        upper = lower + self.counts[median]
+        peak = np.argmax(upper)
+        # the first maximum stays at peak whichever part of the median bin passes the threshold
+        if np.all(lower[peak] > upper[:peak]) and np.all(lower[peak] >= upper[peak + 1:]):
+            return False
+        self.above = lower
+        self.below += int(self.counts[:median].sum())
+        self.path.append(median)
+        self.counts[:] = 0
+        return True
+
+    def estimate(self):
+        """Tuning deviation in fractions of a bin."""
+        if not self.total:
+            return 0.0
+        counts = self.above + self.counts[self._median_bin():].sum(axis=0)
+        return float(self.residual_edges[np.argmax(counts)])
+
+
+def extract_features_streaming(audio: StreamedAudio, feat_keys: List[str], file_out, force: bool = False,
+                               block_seconds: float = STREAM_BLOCK_SECONDS):
+    """Extract features of a long track block by block, writing them incrementally, so the peak
+    memory does not grow with the track length. Outputs match extract_features up to float
+    rounding, except for segmented melody estimation (melodia). Global statistics (the mel
+    spectrogram maximum for onset_env, the tuning for cens) are gathered in a first pass, and
+    up to two more for an undecided tuning (see TuningEstimate). Normalizations by a
+    feature's own maximum (cqt_ch) are applied by FeatureWriter when the feature is complete.
+    Args:
+        audio (StreamedAudio): memory-mapped audio
+        feat_keys (List[str]): feature type keys (eg. cqt_20, cqt_ch,...)
+        file_out (h5py.File): output file
+        force (bool, optional): Whether to force re-extraction. Defaults to False.
+        block_seconds (float, optional): audio per block. Defaults to STREAM_BLOCK_SECONDS.
+    Returns:
+        List[str]: feature type keys that failed
+    """
+    pending, failed = pending_features(feat_keys, file_out, force)
+    y, sr = audio.load()
+    hop = 512
+    n_frames = 1 + len(y) // hop
+    # multiple of the cqt_20 downsampling
+    block_frames = max(20, int(block_seconds * sr / hop) // 20 * 20)
+    mel_max, tuning = __global_stats(y, sr, hop, n_frames, block_frames, pending)
+    for feat_key in pending:
+        try:
+            # blocks are written as they are computed, the stage covers both
+            with stage("feature", feat_key=feat_key, streamed=True):
+                if feat_key == "melodia":
+                    extractor = SBBC(melodia_algo=feat_key, sr=sr, workers=get_melodia_workers(), segmented=True)
+                    write_feature(file_out, feat_key, cast(extractor(y)), attrs=dataset_attrs(feat_key))
+                elif feat_key == "cqt_ch":
+                    __stream_cqt_ch(audio.get(16000), file_out, block_seconds)
+                else:
+                    funcs = {
+                        "cqt_20": (CQT_CONTEXT, lambda segment: np.abs(librosa.cqt(y=segment, sr=sr))),
+                        "cens": (CQT_CONTEXT, lambda segment: librosa.feature.chroma_cens(
+                            C=np.abs(librosa.cqt(y=segment, sr=sr, hop_length=hop, n_bins=7 * 36,
+                                                 bins_per_octave=36, tuning=tuning)), sr=sr, hop_length=hop)),
+                        "onset_env": (STFT_CONTEXT, lambda segment: librosa.onset.onset_strength(
+                            S=__mel_db(segment, sr, hop, mel_max), sr=sr)),
+                    }
+                    context, func = funcs[feat_key]
+                    with FeatureWriter(file_out, feat_key, attrs=feature_attrs(feat_key)) as writer:
+                        for block in frame_blocks(y, hop, n_frames, block_frames, context, func):
+                            writer.append(cast(downsampling(block) if feat_key == "cqt_20" else block))
+        except Exception as e:
+            logging.error(f"Exception {e} for {feat_key}")
+            failed.append(feat_key)
+        print(f"Extracted {feat_key} feature")
+    return failed
+
+
+def __global_stats(y: np.array, sr: int, hop: int, n_frames: int, block_frames: int, feat_keys: List[str]):
+    # maximum mel power (top_db clipping of onset_env) and tuning (cens) of the whole track
+    if "onset_env" not in feat_keys and "cens" not in feat_keys:
+        return None, 0.0
+    mel_max = 0.0
+    tuning = TuningEstimate(sr, bins_per_octave=36)
+    stft_mag = lambda segment: np.abs(librosa.stft(y=segment, n_fft=2048, hop_length=hop))
+    for S in frame_blocks(y, hop, n_frames, block_frames, STFT_CONTEXT, stft_mag):
+        if "onset_env" in feat_keys:
+            mel_max = max(mel_max, float(np.max(librosa.feature.melspectrogram(S=S ** 2, sr=sr))))
+        if "cens" in feat_keys:
+            tuning.add(S)
+    while "cens" in feat_keys and tuning.refine():
+        for S in frame_blocks(y, hop, n_frames, block_frames, STFT_CONTEXT, stft_mag):
+            tuning.add(S)
+    return mel_max, tuning.estimate()
+
+
+def __mel_db(segment: np.array, sr: int, hop: int, mel_max: float, top_db: float = 80.0):
+    # librosa.power_to_db with the top_db floor relative to the maximum of the whole track
+    S = np.abs(librosa.stft(y=segment, n_fft=2048, hop_length=hop))
+    mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=S ** 2, sr=sr), top_db=None)
+    return np.maximum(mel_db, 10.0 * np.log10(max(1e-10, mel_max)) - top_db)
+
+
+def __stream_cqt_ch(y: np.array, file_out, block_seconds: float, sr: int = 16_000, hop_size: float = 0.04):
+    # extract_cqt_ch block by block: peak normalization first, reference level on close
+    peak = max(float(np.max(np.abs(y[i:i + 2 ** 20]))) for i in range(0, max(1, len(y)), 2 ** 20)) if len(y) else 0.0
+    py_cqt = PyCqt(sample_rate=sr, hop_size=hop_size)
+    time_resolution = int(1 / hop_size)
+    step = round(sr / time_resolution)
+    context = int(np.ceil(py_cqt._kernel.shape[1] / step)) + 1
+
+    def func(segment):
+        segment = segment / max(0.001, peak) * 0.999
+        cqt = py_cqt._compute_cqt_spec(segment, sr, time_resolution, py_cqt._kernel, block_size=py_cqt._block_size,
+                                       split_kernel=py_cqt._split)
+        return 20 * np.log10(cqt + 1e-9)
+
+    block_frames = max(1, int(block_seconds * time_resolution))
+    with FeatureWriter(file_out, "cqt_ch", transform=lambda block, low, high: block - high,
+                       attrs=feature_attrs("cqt_ch")) as writer:
+        for block in frame_blocks(y, step, len(y) // step, block_frames, context, func):
+            writer.append(cast(block.T))
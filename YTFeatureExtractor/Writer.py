@@ -0,0 +1,306 @@
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+from typing import Callable, Dict, List, Optional
+
+FSYNC_POLICIES = ["none", "file", "batch"]
+
+# jobs the writer takes from the queue at once, grouped per output file
+WRITE_BATCH = 32
+
+
+def set_async_writer(queue_size: int = None, fsync: str = None):
+    """Configure the feature output for this process and the workers it spawns.
+    Args:
+        queue_size (int, optional): tracks waiting for the writer process; enables the
+            asynchronous writer (see AsyncWriter). None keeps the environment configuration.
+        fsync (str, optional): "none" (leave flushing to the OS), "file" (fsync every output
+            file once written) or "batch" (fsync the files of a writer batch together).
+            None keeps the environment configuration.
+    """
+    if queue_size:
+        os.environ["YTFE_WRITER_QUEUE"] = str(int(queue_size))
+    if fsync:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync}, expected one of {FSYNC_POLICIES}")
+        os.environ["YTFE_FSYNC"] = fsync
+
+
+def get_writer_queue():
+    """Queue size of the asynchronous writer configured by YTFE_WRITER_QUEUE, None for inline writes."""
+    queue_size = os.environ.get("YTFE_WRITER_QUEUE")
+    return int(queue_size) if queue_size and int(queue_size) > 0 else None
+
+
+def get_fsync():
+    """fsync policy configured by YTFE_FSYNC, "none" if not set."""
+    return os.environ.get("YTFE_FSYNC") or "none"
+
+
+def sync_output(output_file: str):
+    """fsync the output of a track: its h5 file, or the claimed shard of the feature store."""
+    if os.environ.get("YTFE_FEATURE_STORE"):
+        from YTFeatureExtractor.Store import get_feature_store
+        get_feature_store().sync()
+        return
+    fd = os.open(output_file, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriterHandle(object):
+    """Worker side of an AsyncWriter: hands the features of a track to the writer process.
+    Passed to the pool initializer (see Executor.init_worker).
+    """
+    def __init__(self, jobs: multiprocessing.Queue) -> None:
+        self.jobs = jobs
+        self._count = 0
+        self._submitted = None
+
+    def submit(self, yt_id: str, output_file: str, features: Dict, attrs: Dict[str, Dict], failed: List[str] = ()):
+        """Queue the features of a track, blocking while the queue is full.
+        Args:
+            yt_id (str): youtube identifier
+            output_file (str): output file path (h5)
+            features (Dict[str, np.array]): features by feature key, replacing existing datasets
+            attrs (Dict[str, Dict]): dataset attributes by feature key (see Helper.dataset_attrs)
+            failed (List[str], optional): feature keys of the track that failed to compute, reported
+                with the acknowledgement. Defaults to ().
+        """
+        self._count += 1
+        job = f"{os.getpid()}-{self._count}"
+        self.jobs.put((job, yt_id, output_file, features, attrs, list(failed)))
+        self._submitted = job
+
+    def take(self):
+        """Id of the job submitted since the last call, None if there was none."""
+        job, self._submitted = self._submitted, None
+        return job
+
+
+_handle = None
+
+
+def worker_jobs(pid: int):
+    """write_job of a task whose worker died: the job that worker submitted last, if any (see AsyncWriter)."""
+    return f"{pid}-*"
+
+
+def set_writer_handle(handle: WriterHandle):
+    """Route the feature writes of this process to an AsyncWriter (None for inline writes)."""
+    global _handle
+    _handle = handle
+
+
+def get_writer_handle() -> Optional[WriterHandle]:
+    return _handle
+
+
+def _write_job(file_out, features: Dict, attrs: Dict[str, Dict]):
+    from YTFeatureExtractor.Metrics import stage
+    from YTFeatureExtractor.Storage import write_feature
+    failed = []
+    for feat_key, feature in features.items():
+        try:
+            if feat_key in file_out.keys():
+                del file_out[feat_key]
+            with stage("write", feat_key=feat_key):
+                write_feature(file_out, feat_key, feature, attrs=attrs.get(feat_key))
+        except Exception as e:
+            logging.error(f"Exception {e} for {feat_key}", exc_info=e)
+            failed.append(feat_key)
+    return failed
+
+
+def _writer_main(jobs: multiprocessing.Queue, acks: multiprocessing.Queue, fsync: str, parent: int):
+    # Ctrl-C reaches the whole process group; the writer keeps draining until the parent says stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from YTFeatureExtractor.Helper import open_output
+    stopping = False
+    while not stopping:
+        try:
+            batch = [jobs.get(timeout=1.0)]
+        except queue.Empty:
+            if os.getppid() != parent:
+                break
+            continue
+        while len(batch) < WRITE_BATCH:
+            try:
+                batch.append(jobs.get_nowait())
+            except queue.Empty:
+                break
+        if None in batch:
+            stopping = True
+            batch = [job for job in batch if job is not None]
+        # markers of dead workers (see AsyncWriter.when_written) are acknowledged after the batch
+        markers = [job for job in batch if job[3] is None]
+        outcomes, written = [], []
+        # in output path order, each track written with one open of its file
+        for job, yt_id, output_file, features, attrs, failed in sorted((job for job in batch if job[3] is not None),
+                                                                       key=lambda job: job[2]):
+            try:
+                with open_output(output_file, yt_id) as file_out:
+                    failed = failed + _write_job(file_out, features, attrs)
+                if fsync == "file":
+                    sync_output(output_file)
+                written.append(output_file)
+                message = f"feature_error: Features {', '.join(failed)} failed for {yt_id}" if failed else ""
+                outcomes.append((job, "feature_error" if failed else None, message, failed))
+            except Exception as e:
+                logging.error(f"HDF file error {yt_id}: {e}", exc_info=e)
+                outcomes.append((job, "hdf_error", f"hdf_error: HDF file error {yt_id}: {e}", []))
+        if fsync == "batch":
+            for output_file in dict.fromkeys(written):
+                try:
+                    sync_output(output_file)
+                except OSError as e:
+                    logging.error(f"fsync failed for {output_file}: {e}")
+        # acknowledged only once written (and synced, depending on the policy)
+        for outcome in outcomes:
+            acks.put(outcome)
+        for marker in markers:
+            acks.put((marker[0], None, "", []))
+    acks.put(None)
+
+
+class AsyncWriter(object):
+    """Output stage decoupled from feature compute: workers hand the features of a track to a
+    dedicated writer process through a bounded queue (see WriterHandle), which compresses and
+    writes them, one open per output file for the jobs it takes at once, and fsyncs per policy.
+    A TaskResult is released (see when_written) only once its writes are acknowledged, with
+    write failures merged into it (hdf_error, or feature_error for single datasets). So results
+    and manifest records never claim features that are not written (and synced with fsync
+    "file" or "batch"). On exit queued jobs are drained first, Ctrl-C included. If the run is
+    killed, unacknowledged tracks are recomputed by the next run; a file killed while being
+    written may be unreadable, as with inline writes. Should the writer process die, pending
+    and later results fail with hdf_error. A worker killed (or dying) after handing over its
+    features leaves a job no result claims: its failed result names the worker (see
+    worker_jobs), and is reconciled with the acknowledgement of that job once the writer has
+    taken every job queued before the failure.
+    Args:
+        queue_size (int): tracks waiting for the writer before workers block
+        fsync (str, optional): fsync policy (see set_async_writer). Defaults to "none".
+    """
+    def __init__(self, queue_size: int, fsync: str = "none") -> None:
+        self.queue_size = queue_size
+        self.fsync = fsync
+        # spawn context queues use named semaphores, so workers started by any method can take the handle
+        context = multiprocessing.get_context("spawn")
+        self._jobs = context.Queue(max(1, queue_size))
+        self._acks = context.Queue()
+        self.handle = WriterHandle(self._jobs)
+        self._process = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._outcomes = {}
+        self._waiting = {}
+        self._dead = False
+
+    def __enter__(self):
+        self._process = multiprocessing.Process(target=_writer_main, name="ytfe-writer", daemon=True,
+                                                args=(self._jobs, self._acks, self.fsync, os.getpid()))
+        self._process.start()
+        self._reader = threading.Thread(target=self._read_acks, daemon=True)
+        self._reader.start()
+        return self
+
+    def __exit__(self, *args):
+        if self._process.is_alive():
+            self._jobs.put(None)
+        self._reader.join()
+        self._process.join()
+
+    def _read_acks(self):
+        while True:
+            try:
+                outcome = self._acks.get(timeout=1.0)
+            except queue.Empty:
+                if self._process.is_alive():
+                    continue
+                self._writer_died()
+                return
+            if outcome is None:
+                return
+            with self._lock:
+                waiting = self._waiting.pop(outcome[0], None)
+                if waiting is None:
+                    self._outcomes[outcome[0]] = outcome
+                elif outcome[0].endswith("-*"):
+                    # every job the dead worker queued is acknowledged by now, unclaimed
+                    prefix = outcome[0][:-1]
+                    orphan = next((job for job in self._outcomes if job.startswith(prefix)), None)
+                    outcome = self._outcomes.pop(orphan) if orphan is not None else None
+            if waiting is not None:
+                result, callback = waiting
+                if outcome is not None and outcome[0] != result.write_job:
+                    logging.warning(f"{result.yt_id}: features handed over before the worker failed were written")
+                    result = result._replace(success=True, reason=None, message="", write_job=outcome[0])
+                callback(self._merge(result, outcome) if outcome is not None else result)
+
+    def _writer_died(self):
+        logging.error(f"Writer process died with exit code {self._process.exitcode}")
+        with self._lock:
+            self._dead = True
+            waiting, self._waiting = self._waiting, {}
+        for job, (result, callback) in waiting.items():
+            callback(self._merge(result, self._lost(job, result)))
+
+    @staticmethod
+    def _lost(job: str, result):
+        return job, "hdf_error", f"hdf_error: Writer process died before writing {result.yt_id}", []
+
+    def when_written(self, result, callback: Callable):
+        """Call callback with the result once its writes are acknowledged (at once if there are none).
+        A result failed by the death of its worker (see worker_jobs) succeeds if the worker had
+        handed over its features and they are written."""
+        if result.write_job is None:
+            callback(result)
+            return
+        with self._lock:
+            outcome = self._outcomes.pop(result.write_job, None)
+            if outcome is None and self._dead:
+                outcome = self._lost(result.write_job, result)
+            elif outcome is None:
+                self._waiting[result.write_job] = (result, callback)
+        if outcome is not None:
+            callback(self._merge(result, outcome))
+        elif result.write_job.endswith("-*"):
+            # acknowledged once the writer took the jobs queued before it, see _read_acks
+            self._jobs.put((result.write_job, result.yt_id, result.output_path, None, None, []))
+
+    def merge(self, results):
+        """Yield results once their writes are acknowledged."""
+        done = queue.Queue()
+        outstanding = 0
+        for result in results:
+            outstanding += 1
+            self.when_written(result, done.put)
+            while not done.empty():
+                outstanding -= 1
+                yield done.get()
+        for _ in range(outstanding):
+            yield done.get()
+
+    @staticmethod
+    def _merge(result, outcome):
+        _, reason, message, failed = outcome
+        if reason is None or not result.success and result.reason != "feature_error":
+            return result
+        if reason == "feature_error":
+            failed_keys = tuple(dict.fromkeys(tuple(result.failed_keys) + tuple(failed)))
+            message = f"feature_error: Features {', '.join(failed_keys)} failed for {result.yt_id}"
+        else:
+            failed_keys = ()
+        logging.error(f"{result.yt_id} failed ({reason}): {message}")
+        return result._replace(success=False, reason=reason, message=message, failed_keys=failed_keys)
+
+
+def start_writer():
+    """AsyncWriter as configured by set_async_writer, None for inline writes."""
+    queue_size = get_writer_queue()
+    return AsyncWriter(queue_size, get_fsync()) if queue_size else None
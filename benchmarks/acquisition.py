@@ -0,0 +1,119 @@
+"""Compare the two acquisition paths offline, with LocalDownloader standing in for yt-dlp:
+native (copy the opus/m4a stream, decode it) against mp3 (copy, transcode to 192 kbps mp3
+like FFmpegExtractAudio, decode the mp3). Reports seconds per stage and file sizes as JSON.
+Without --source, synthetic tracks are encoded as Ogg Opus first.
+
+    python benchmarks/acquisition.py --durations 60 300
+    python benchmarks/acquisition.py --source DIR_WITH_NATIVE_AUDIO
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from YTFeatureExtractor.Audio import AUDIO_EXTENSIONS, AudioProvider, find_audio  # noqa: E402
+from YTFeatureExtractor.Download import LocalDownloader  # noqa: E402
+
+
+def synthetic_sources(directory: str, durations):
+    """Write a stereo tone and noise mix per duration as 48 kHz Ogg Opus (what YouTube serves)."""
+    rng = np.random.default_rng(0)
+    for duration in durations:
+        t = np.arange(int(duration * 48000)) / 48000
+        y = 0.3 * np.sin(2 * np.pi * 220 * t * (1 + 0.01 * np.sin(2 * np.pi * 0.5 * t)))
+        y += 0.05 * rng.standard_normal(len(t))
+        sf.write(os.path.join(directory, f"synth{int(duration):06d}.opus"), np.stack([y, y], axis=1), 48000,
+                 format="OGG", subtype="OPUS")
+
+
+def transcode_mp3(path: str, outpath: str):
+    """192 kbps mp3 like yt-dlp's FFmpegExtractAudio, with libsndfile's encoder if ffmpeg is missing."""
+    if shutil.which("ffmpeg"):
+        subprocess.run(["ffmpeg", "-v", "error", "-y", "-i", path, "-vn", "-b:a", "192k", outpath], check=True)
+        return "ffmpeg"
+    y, sr = sf.read(path, dtype="float32")
+    sf.write(outpath, y, sr, format="MP3", subtype="MPEG_LAYER_III")
+    return "libsndfile"
+
+
+def timed(func):
+    start = time.perf_counter()
+    value = func()
+    return time.perf_counter() - start, value
+
+
+def run(source: str, yt_id: str, directory: str):
+    downloader = LocalDownloader(source)
+    record = {"yt_id": yt_id}
+    # native: the stand-in copies the stream in its own container, extraction decodes it directly
+    native = os.path.join(directory, "native", f"{yt_id}.mp3")
+    record["native_fetch"], _ = timed(lambda: downloader(yt_id, native))
+    native = find_audio(native)
+    record["native_decode"], (y, _) = timed(lambda: AudioProvider(native, sr=22050).load())
+    record["native_bytes"] = os.path.getsize(native)
+    record["native_extension"] = os.path.splitext(native)[1]
+    # mp3: the same copy, transcoded before extraction decodes it again
+    stream = os.path.join(directory, "stream", f"{yt_id}.mp3")
+    mp3 = os.path.join(directory, "mp3", f"{yt_id}.mp3")
+    os.makedirs(os.path.dirname(mp3), exist_ok=True)
+    record["mp3_fetch"], _ = timed(lambda: downloader(yt_id, stream))
+    record["mp3_transcode"], record["encoder"] = timed(lambda: transcode_mp3(find_audio(stream), mp3))
+    record["mp3_decode"], _ = timed(lambda: AudioProvider(mp3, sr=22050).load())
+    record["mp3_bytes"] = os.path.getsize(mp3)
+    record["duration"] = len(y) / 22050
+    record["native_total"] = record["native_fetch"] + record["native_decode"]
+    record["mp3_total"] = record["mp3_fetch"] + record["mp3_transcode"] + record["mp3_decode"]
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', type=str, default=None, help='Directory with native audio (<yt_id>.opus etc.).')
+    parser.add_argument('--durations', nargs='+', type=float, default=[60, 300],
+                        help='Durations of synthetic tracks in seconds without --source.')
+    parser.add_argument('--output', type=str, default=None, help='Write results as JSON to this file.')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="ytfe_acquisition_")
+    try:
+        source = args.source
+        if source is None:
+            source = os.path.join(directory, "source")
+            os.makedirs(source)
+            synthetic_sources(source, args.durations)
+        yt_ids = sorted(os.path.splitext(name)[0] for name in os.listdir(source)
+                        if os.path.splitext(name)[1] in AUDIO_EXTENSIONS)
+        # imports and resampler setup are paid outside the measurement
+        if yt_ids:
+            AudioProvider(find_audio(os.path.join(source, yt_ids[0] + ".mp3")), sr=22050).load()
+        results = []
+        for yt_id in yt_ids:
+            try:
+                record = run(source, yt_id, directory)
+                print(f"{yt_id} {record['duration']:7.1f}s native {record['native_total']:7.3f}s "
+                      f"({record['native_extension']}, {record['native_bytes']} bytes) "
+                      f"mp3 {record['mp3_total']:7.3f}s ({record['mp3_bytes']} bytes, {record['encoder']})",
+                      file=sys.stderr)
+            except Exception as e:
+                record = {"yt_id": yt_id, "error": str(e)}
+                print(f"{yt_id} error: {e}", file=sys.stderr)
+            results.append(record)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    report = json.dumps({"results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
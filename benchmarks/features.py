@@ -0,0 +1,213 @@
+"""Benchmark feature extraction on synthetic audio (tones, noise, chirps) at several durations:
+wall time, CPU time, peak RSS and bytes written per feature key, and the full process_file
+path (stub download, decoding, all keys). Results are written as JSON; --compare flags
+regressions against a saved baseline and exits with status 1.
+
+    python benchmarks/features.py --output baseline.json
+    python benchmarks/features.py --compare baseline.json --threshold 0.15
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import h5py
+import librosa
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from YTFeatureExtractor.Admission import peak_rss, reset_peak_rss  # noqa: E402
+from YTFeatureExtractor.Audio import AudioProvider  # noqa: E402
+from YTFeatureExtractor.Helper import FEAT_KEYS, extract_features, process_file  # noqa: E402
+from YTFeatureExtractor.Precision import get_precision  # noqa: E402
+
+SIGNALS = ["tone", "noise", "chirp"]
+
+# metrics compared against the baseline, and the absolute change below which they count as noise
+METRICS = {"wall": 0.05, "cpu": 0.05, "peak_rss": 16 * 1024 ** 2, "bytes": 1024}
+
+
+def synthetic_audio(signal: str, duration: float, sr: int = 22050, seed: int = 0):
+    """Harmonic tones with vibrato and note changes, pink-ish noise or a logarithmic chirp."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sr)) / sr
+    if signal == "tone":
+        notes = 220 * 2 ** (rng.integers(0, 24, max(1, int(duration))) / 12)
+        f0 = np.repeat(notes, len(t) // len(notes) + 1)[:len(t)] * (1 + 0.003 * np.sin(2 * np.pi * 5 * t))
+        phase = 2 * np.pi * np.cumsum(f0) / sr
+        y = sum(0.3 / k * np.sin(k * phase) for k in range(1, 6))
+    elif signal == "noise":
+        y = np.cumsum(rng.standard_normal(len(t))) * 0.002
+        y = y - np.convolve(y, np.ones(256) / 256, mode="same") + 0.05 * rng.standard_normal(len(t))
+    elif signal == "chirp":
+        y = 0.5 * librosa.chirp(fmin=40, fmax=8000, sr=sr, duration=duration, linear=False)[:len(t)]
+    else:
+        raise ValueError(f"Unknown signal {signal}, expected one of {SIGNALS}")
+    return (y / max(1e-9, np.max(np.abs(y))) * 0.9).astype(np.float32)
+
+
+def measure(func, repeat: int):
+    """Median wall and CPU seconds of func over repeat runs, and the peak RSS it adds."""
+    walls, cpus, peaks = [], [], []
+    for _ in range(repeat):
+        rss = reset_peak_rss()
+        wall, cpu = time.perf_counter(), time.process_time()
+        func()
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+        peaks.append(peak_rss() - (rss or 0))
+    return {"wall": statistics.median(walls), "cpu": statistics.median(cpus), "peak_rss": max(peaks)}
+
+
+def bench_feature(y: np.array, feat_key: str, directory: str, repeat: int):
+    path = os.path.join(directory, f"{feat_key}.h5")
+
+    def run():
+        with h5py.File(path, "w") as f:
+            if extract_features(AudioProvider(sr=22050, y=y), [feat_key], f, force=True):
+                raise RuntimeError(f"{feat_key} failed")
+
+    result = measure(run, repeat)
+    result["bytes"] = os.path.getsize(path)
+    return result
+
+
+def bench_process_file(y: np.array, feat_keys, directory: str, repeat: int):
+    # the stub downloader writes the synthetic track, decoding reads it like a downloaded mp3
+    def downloader(yt_id, outpath):
+        os.makedirs(os.path.dirname(outpath), exist_ok=True)
+        sf.write(outpath, y, 22050, format="WAV")
+
+    input_file = os.path.join(directory, "audio", "synthetic.mp3")
+    output_file = os.path.join(directory, "features", "synthetic.h5")
+
+    def run():
+        for path in (input_file, output_file):
+            if os.path.exists(path):
+                os.remove(path)
+        if not process_file(input_file, output_file, feat_keys, downloader=downloader):
+            raise RuntimeError("process_file failed")
+
+    result = measure(run, repeat)
+    result["bytes"] = os.path.getsize(output_file)
+    return result
+
+
+def run_target(signal: str, duration: float, target: str, feat_keys, directory: str, repeat: int):
+    """Benchmark a feature key or "process_file" in a fresh process, so its peak RSS is not hidden
+    by memory that earlier measurements freed but the allocator kept."""
+    # imports, CQT kernels and caches are built outside the measurement
+    warm_up = synthetic_audio("tone", 2.0)
+    for feat_key in (feat_keys if target == "process_file" else [target]):
+        try:
+            bench_feature(warm_up, feat_key, directory, 1)
+        except Exception:
+            pass
+    y = synthetic_audio(signal, duration)
+    if target == "process_file":
+        return bench_process_file(y, feat_keys, directory, repeat)
+    return bench_feature(y, target, directory, repeat)
+
+
+def run_benchmarks(signals, durations, feat_keys, repeat: int):
+    results = []
+    directory = tempfile.mkdtemp(prefix="ytfe_bench_")
+    context = multiprocessing.get_context("fork")
+    try:
+        for signal in signals:
+            for duration in durations:
+                for target in list(feat_keys) + ["process_file"]:
+                    record = {"signal": signal, "duration": duration, "target": target}
+                    try:
+                        with ProcessPoolExecutor(1, mp_context=context) as pool:
+                            record.update(pool.submit(run_target, signal, duration, target, feat_keys, directory,
+                                                      repeat).result())
+                        record["realtime"] = duration / record["wall"] if record["wall"] else None
+                    except Exception as e:
+                        record["error"] = str(e)
+                    results.append(record)
+                    print(_format(record), file=sys.stderr)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, threshold: float):
+    """Flag metrics that grew by more than threshold (relative) and the noise floor (absolute)."""
+    reference = {(r["signal"], r["duration"], r["target"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        base = reference.get((r["signal"], r["duration"], r["target"]))
+        if base is None:
+            continue
+        if "error" in r and "error" not in base:
+            regressions.append({**_key(r), "metric": "error", "baseline": None, "value": r["error"]})
+            continue
+        for metric, floor in METRICS.items():
+            if metric not in r or metric not in base:
+                continue
+            if r[metric] > base[metric] * (1 + threshold) and r[metric] - base[metric] > floor:
+                regressions.append({**_key(r), "metric": metric, "baseline": base[metric], "value": r[metric],
+                                    "change": r[metric] / base[metric] - 1 if base[metric] else None})
+    return regressions
+
+
+def _key(r):
+    return {"signal": r["signal"], "duration": r["duration"], "target": r["target"]}
+
+
+def _format(r):
+    name = f"{r['signal']:>6} {r['duration']:>6.0f}s {r['target']:>12}"
+    if "error" in r:
+        return f"{name} error: {r['error']}"
+    return (f"{name} wall {r['wall']:8.3f}s cpu {r['cpu']:8.3f}s rss {r['peak_rss'] / 1024 ** 2:8.1f} MB "
+            f"bytes {r['bytes']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--signals', nargs='+', default=SIGNALS, choices=SIGNALS, help='Synthetic signals.')
+    parser.add_argument('--durations', nargs='+', type=float, default=[30, 120, 600], help='Durations in seconds.')
+    parser.add_argument('--feat_keys', nargs='+', default=FEAT_KEYS, help='Feature keys to benchmark.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement (median wall and CPU time).')
+    parser.add_argument('--output', type=str, default=None, help='Write results as JSON to this file.')
+    parser.add_argument('--compare', type=str, default=None, help='Baseline JSON to check for regressions.')
+    parser.add_argument('--threshold', type=float, default=0.15, help='Relative growth counted as regression.')
+    args = parser.parse_args()
+
+    report = {
+        "meta": {"python": platform.python_version(), "numpy": np.__version__, "librosa": librosa.__version__,
+                 "platform": platform.platform(), "cpus": os.cpu_count(), "precision": get_precision(),
+                 "repeat": args.repeat, "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": None,
+    }
+    # progress of the extractors goes to stderr, stdout is reserved for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        report["results"] = run_benchmarks(args.signals, args.durations, args.feat_keys, args.repeat)
+    ok = True
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report["regressions"] = compare(report["results"], baseline, args.threshold)
+        for r in report["regressions"]:
+            print(f"REGRESSION {r['signal']} {r['duration']:.0f}s {r['target']} {r['metric']}: "
+                  f"{r['baseline']} -> {r['value']}", file=sys.stderr)
+        ok = not report["regressions"]
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Measure import time in fresh interpreters: the package modules and CLI scripts, and the
+warm-up of each feature key (the modules its extractor imports lazily). Heavy libraries
+loaded by a plain import are reported; --budget and --lazy turn regressions into exit status 1.
+
+    python benchmarks/imports.py --repeat 5 --budget 0.5 --lazy
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["YTFeatureExtractor.Helper", "YTFeatureExtractor.Executor", "YTFeatureExtractor.Pipeline",
+           "extract_single", "extract_list", "extract_dir"]
+
+# libraries that a plain import of MODULES must not load (see --lazy)
+HEAVY = ["essentia", "yt_dlp", "h5py", "scipy.fft", "scipy.sparse", "soundfile", "soxr", "pandas", "numba"]
+
+SNIPPET = """
+import json
+import sys
+import time
+start = time.perf_counter()
+{code}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(code: str, repeat: int):
+    """Median seconds of code in fresh interpreters and the heavy modules it loaded."""
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", SNIPPET.format(code=code, heavy=HEAVY)], cwd=ROOT,
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            return {"error": out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "failed"}
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {"seconds": statistics.median(run["seconds"] for run in runs), "heavy": runs[-1]["heavy"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3, help='Interpreters per measurement.')
+    parser.add_argument('--feat_keys', nargs='*', default=None, help='Feature keys to warm up (default: all).')
+    parser.add_argument('--budget', type=float, default=None, help='Maximum seconds to import any of MODULES.')
+    parser.add_argument('--lazy', action='store_true', help='Fail if a plain import loads a HEAVY module.')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from YTFeatureExtractor.Helper import FEAT_KEYS
+    results = []
+    for module in MODULES:
+        results.append(dict(target=module, **measure(f"import {module}", args.repeat)))
+    for feat_key in args.feat_keys or FEAT_KEYS:
+        code = f"from YTFeatureExtractor.Helper import import_requirements\nimport_requirements([{feat_key!r}])"
+        results.append(dict(target=f"warm-up {feat_key}", **measure(code, args.repeat)))
+
+    ok = True
+    for r in results:
+        if r["target"] in MODULES and "seconds" in r:
+            r["ok"] = (args.budget is None or r["seconds"] <= args.budget) and not (args.lazy and r["heavy"])
+            ok = ok and r["ok"]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            if "error" in r:
+                print(f"{r['target']:>30} error: {r['error']}")
+            else:
+                flag = "" if r.get("ok", True) else "  FAILED"
+                print(f"{r['target']:>30} {r['seconds'] * 1000:8.1f} ms  heavy: {', '.join(r['heavy']) or '-'}{flag}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Accuracy guardrail of the float32 precision: extract every feature key in float64 (the
+reference) and float32 and check the deviation against the tolerances of Precision.TOLERANCES.
+Exits with status 1 if a tolerance is exceeded. tests/test_precision.py asserts the same bounds.
+
+    python benchmarks/precision.py                      # synthetic 60 s track
+    python benchmarks/precision.py song1.mp3 song2.mp3 --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import h5py
+import librosa
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from YTFeatureExtractor.Audio import AudioProvider  # noqa: E402
+from YTFeatureExtractor.Helper import FEAT_KEYS, extract_features  # noqa: E402
+from YTFeatureExtractor.Precision import TOLERANCES, deviation, set_precision  # noqa: E402
+from YTFeatureExtractor.Storage import read_feature  # noqa: E402
+
+def synthetic_track(duration: float, sr: int = 22050, seed: int = 0):
+    """Detuned random melody with amplitude modulation and noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sr)) / sr
+    notes = 440 * 2 ** (rng.integers(-12, 12, max(1, int(duration * 2))) / 12 + 0.1 / 12)
+    freqs = np.repeat(notes, len(t) // len(notes) + 1)[:len(t)]
+    y = 0.3 * np.sin(2 * np.pi * np.cumsum(freqs) / sr) + 0.05 * rng.standard_normal(len(t))
+    return (y * (1 + np.sin(2 * np.pi * 0.5 * t)) / 2).astype(np.float32)
+
+
+def extract(y: np.array, sr: int, feat_keys, precision: str):
+    set_precision(precision)
+    start = time.perf_counter()
+    with h5py.File(f"{precision}.h5", "w", driver="core", backing_store=False) as f:
+        failed = extract_features(AudioProvider(sr=sr, y=y), feat_keys, f)
+        features = {feat_key: read_feature(f, feat_key) for feat_key in feat_keys if feat_key not in failed}
+    return features, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='Audio files (default: a synthetic track).')
+    parser.add_argument('--duration', type=float, default=60, help='Synthetic track length in seconds.')
+    parser.add_argument('--feat_keys', nargs='+', default=FEAT_KEYS, help='Feature keys to check.')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+    args = parser.parse_args()
+
+    tracks = [(path, librosa.load(path, sr=22050)[0]) for path in args.files] or \
+        [("synthetic", synthetic_track(args.duration))]
+    # build kernels and warm up caches so both precisions are timed alike
+    for precision in ("float64", "float32"):
+        extract(tracks[0][1][:22050 * 5], 22050, args.feat_keys, precision)
+    results = []
+    for name, y in tracks:
+        reference, reference_time = extract(y, 22050, args.feat_keys, "float64")
+        features, time_32 = extract(y, 22050, args.feat_keys, "float32")
+        for feat_key in args.feat_keys:
+            if feat_key not in reference or feat_key not in features:
+                results.append({"track": name, "feat_key": feat_key, "deviation": None, "ok": False})
+                continue
+            error = deviation(reference[feat_key], features[feat_key])
+            results.append({"track": name, "feat_key": feat_key, "deviation": error,
+                            "tolerance": TOLERANCES.get(feat_key), "dtype": str(features[feat_key].dtype),
+                            "nbytes_64": int(reference[feat_key].nbytes), "nbytes_32": int(features[feat_key].nbytes),
+                            "ok": error <= TOLERANCES.get(feat_key, 0.0)})
+        results.append({"track": name, "time_64": reference_time, "time_32": time_32})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            if "feat_key" in r:
+                print(f"{r['track']:>20} {r['feat_key']:>10} deviation {r['deviation']!s:>24} "
+                      f"tolerance {r.get('tolerance')!s:>8} {'ok' if r['ok'] else 'FAILED'}")
+            else:
+                print(f"{r['track']:>20} extraction {r['time_64']:.2f}s (float64) {r['time_32']:.2f}s (float32)")
+    sys.exit(0 if all(r["ok"] for r in results if "ok" in r) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Compare storage policies on synthetic features: write time, read time and size.
+
+    python benchmarks/storage.py --duration 600 --policies none lzf gzip gzip:9 lzf+float16 gzip+uint8
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import h5py
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from YTFeatureExtractor.Storage import parse_policy, read_feature, time_axis, write_feature  # noqa: E402
+
+DEFAULT_POLICIES = ["none", "lzf", "gzip:1", "gzip", "gzip:9", "blosc_lz4", "lzf+float16", "gzip+float16",
+                    "gzip+uint8"]
+
+
+def synthetic_features(duration: float, seed: int = 0):
+    """Smooth random features with the shapes and dtypes the extractors produce for duration seconds."""
+    rng = np.random.default_rng(seed)
+
+    def smooth(shape, axis, dtype=np.float64):
+        data = np.cumsum(rng.standard_normal(shape), axis=axis)
+        return (data / np.sqrt(shape[axis])).astype(dtype)
+
+    frames = int(duration * 22050 / 512)
+    return {
+        "cqt_ch": smooth((int(duration / 0.04), 96), 0) * 10 - 60,
+        "cqt_20": np.abs(smooth((84, frames // 20), 1)),
+        "cens": np.abs(smooth((12, frames), 1)),
+        "onset_env": np.abs(smooth((frames,), 0, np.float32)),
+        "melodia": np.clip(smooth((12, frames // 2), 1, np.float32), 0, 1),
+    }
+
+
+def benchmark(features, spec: str, directory: str):
+    policy = parse_policy(spec)
+    path = os.path.join(directory, spec.replace(":", "_").replace("+", "_").replace("/", "_") + ".h5")
+    start = time.perf_counter()
+    with h5py.File(path, "w") as f:
+        for feat_key, feature in features.items():
+            write_feature(f, feat_key, feature, policy)
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    error = 0.0
+    with h5py.File(path, "r") as f:
+        for feat_key, feature in features.items():
+            decoded = read_feature(f, feat_key)
+            error = max(error, float(np.max(np.abs(decoded - feature)) / (np.max(np.abs(feature)) or 1)))
+    read_time = time.perf_counter() - start
+
+    # partial read of 100 frames from the middle of every feature
+    start = time.perf_counter()
+    with h5py.File(path, "r") as f:
+        for feat_key in features:
+            dataset = f[feat_key]
+            axis = time_axis(feat_key, dataset.ndim)
+            index = [slice(None)] * dataset.ndim
+            middle = dataset.shape[axis] // 2
+            index[axis] = slice(middle, middle + 100)
+            dataset[tuple(index)]
+    partial_time = time.perf_counter() - start
+
+    return {"policy": spec, "write_s": write_time, "read_s": read_time, "partial_read_s": partial_time,
+            "bytes": os.path.getsize(path), "max_rel_error": error}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark storage policies on synthetic features.')
+    parser.add_argument('--duration', type=float, default=600, help='Synthetic track duration in seconds.')
+    parser.add_argument('--policies', nargs="+", default=DEFAULT_POLICIES, help='Policies to compare.')
+    parser.add_argument('--json', type=str, default=None, help='Write results to this JSON file.')
+    args = parser.parse_args()
+
+    features = synthetic_features(args.duration)
+    raw = sum(feature.nbytes for feature in features.values())
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for spec in args.policies:
+            results.append(benchmark(features, spec, directory))
+
+    print(f"raw size {raw / 1e6:.2f} MB")
+    print(f"{'policy':<16}{'write s':>10}{'read s':>10}{'partial s':>11}{'MB':>9}{'ratio':>8}{'max err':>10}")
+    for r in results:
+        print(f"{r['policy']:<16}{r['write_s']:>10.4f}{r['read_s']:>10.4f}{r['partial_read_s']:>11.5f}"
+              f"{r['bytes'] / 1e6:>9.2f}{raw / r['bytes']:>8.2f}{r['max_rel_error']:>10.2e}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,63 @@
 import os
+from itertools import islice
 from tqdm import tqdm
 import argparse
 import numpy as np
-from multiprocessing import Pool, cpu_count
-from YTFeatureExtractor.Helper import process_file, FEAT_KEYS
+from YTFeatureExtractor.Helper import FEAT_KEYS
+from YTFeatureExtractor.Metrics import set_metrics, start_reporter
+from YTFeatureExtractor.Admission import set_memory_budget
+from YTFeatureExtractor.Audio import AUDIO_EXTENSIONS, find_audio, set_pcm_cache, set_streaming
+from YTFeatureExtractor.Precision import PRECISIONS, set_precision
+from YTFeatureExtractor.SBBC import set_melodia_workers
+from YTFeatureExtractor.Store import set_feature_store
+from YTFeatureExtractor.Storage import set_storage_policies
+from YTFeatureExtractor.Executor import Task, add_executor_args, summarize
+from YTFeatureExtractor.Scheduler import MakespanReport, run_scheduled
+from YTFeatureExtractor.Writer import set_async_writer
 
 
 def main():
     args = parse_args()
+    set_pcm_cache(args.pcm_cache, args.pcm_cache_size * 1024 ** 3 if args.pcm_cache_size else None)
+    set_melodia_workers(args.melodia_workers)
+    set_streaming(args.stream_longer_than)
+    set_precision(args.precision)
+    set_memory_budget(args.memory_budget)
+    set_feature_store(args.store, args.store_shards)
+    set_storage_policies(args.storage_policy)
+    set_metrics(args.metrics)
+    set_async_writer(args.async_writer, args.fsync)
     input_dir = args.input
     parallel = args.parallel
     feat_keys = FEAT_KEYS
 
-    input_paths = []
-    output_paths = []
+    # the directory is walked lazily and scheduled in batches, so work starts after the first one
+    tasks = iter_tasks(input_dir, feat_keys)
+    with start_reporter(args.metrics_interval):
+        for i, batch in enumerate(iter(lambda: list(islice(tasks, args.batch_size)), [])):
+            report = MakespanReport()
+            results = run_scheduled(batch, workers=args.workers if parallel else 1, schedule=args.schedule,
+                                    pack=args.pack, chunksize=args.chunksize, report=report,
+                                    maxtasksperchild=args.maxtasksperchild, timeout=args.timeout,
+                                    feat_keys=feat_keys)
+            print(summarize(tqdm(results, total=len(batch)), args.results, append=i > 0))
+            print(report)
+
+
+def iter_tasks(input_dir: str, feat_keys):
     for root, dirs, files in os.walk(input_dir):
         for name in files:
-            if name.endswith(".mp3"):
-                input_paths.append(os.path.join(root, name))
-                output_paths.append(to_output_path(root, name))
-    if parallel:
-        with Pool(cpu_count()) as p:
-            list(tqdm(p.imap(process_file, input_paths, output_paths, feat_keys), total=len(input_paths)))
-    else:
-        for input_path, output_path in input_paths, output_paths:
-            process_file(input_path, output_path, feat_keys)
+            base, extension = os.path.splitext(name)
+            path = os.path.join(root, name)
+            # one task per track if it exists in several containers, for the file find_audio picks
+            if extension in AUDIO_EXTENSIONS and find_audio(os.path.join(root, base + ".mp3")) == path:
+                yield Task(path, to_output_path(root, name), feat_keys)
 
 
 def to_output_path(root: str, name: str):
     root_out = os.path.dirname(root)
     root_out = os.path.join(root_out, 'audio_features')
-    name_out = name.replace(".mp3", ".h5")
+    name_out = os.path.splitext(name)[0] + ".h5"
     return os.path.join(root_out, name_out)
 
 def parse_args():
@@ -39,6 +66,25 @@ def parse_args():
                     help='Path with mp3s.')
     parser.add_argument('--parallel', action="store_true", 
                         help='Use multiple cores for extraction and downloads.')
+    parser.add_argument('--batch_size', type=int, default=10000,
+                        help='Tracks scheduled at once.')
+    parser.add_argument('--store', type=str, default=None,
+                        help='Write features into a sharded store in this directory instead of one h5 per video.')
+    parser.add_argument('--store_shards', type=int, default=None,
+                        help='Maximum number of shard files (and parallel writers) of the store.')
+    parser.add_argument('--storage_policy', type=str, default=None,
+                        help='Dataset codecs, eg. "lzf,cqt_ch=gzip:4+float16" (codec[:level][+quantize][/chunk_frames]).')
+    parser.add_argument('--melodia_workers', type=int, default=None,
+                        help='Processes estimating the melody of long tracks in overlapping segments.')
+    parser.add_argument('--stream_longer_than', type=float, default=None,
+                        help='Decode and extract tracks longer than this many seconds in blocks with bounded memory.')
+    parser.add_argument('--precision', type=str, default=None, choices=list(PRECISIONS),
+                        help='Numeric precision of kernels, spectrograms and stored features (default: float64).')
+    parser.add_argument('--pcm_cache', type=str, default=None,
+                        help='Directory to cache decoded audio in, reruns skip mp3 decoding.')
+    parser.add_argument('--pcm_cache_size', type=float, default=None,
+                        help='Size limit of the decoded audio cache in GB.')
+    add_executor_args(parser)
     args = parser.parse_args()
     return args
     
@@ -1,25 +1,136 @@
 import argparse
 import os
-import pandas as pd
 from tqdm import tqdm
-from multiprocessing import Pool, cpu_count
-from YTFeatureExtractor.Helper import process_file, FEAT_KEYS
-from typing import List
+from YTFeatureExtractor.Helper import FEAT_KEYS, feature_version
+from YTFeatureExtractor.Executor import Task, add_executor_args, summarize
+from YTFeatureExtractor.Admission import set_memory_budget
+from YTFeatureExtractor.Audio import set_pcm_cache, set_streaming
+from YTFeatureExtractor.Precision import PRECISIONS, set_precision
+from YTFeatureExtractor.SBBC import set_melodia_workers
+from YTFeatureExtractor.Store import set_feature_store
+from YTFeatureExtractor.Storage import set_storage_policies
+from YTFeatureExtractor.Download import download, LocalDownloader, set_audio_format
+from YTFeatureExtractor.IdList import iter_id_batches, unique_id_batches
+from YTFeatureExtractor.Manifest import Manifest
+from YTFeatureExtractor.Metrics import set_metrics, start_reporter
+from YTFeatureExtractor.Pipeline import run_pipeline
+from YTFeatureExtractor.Scheduler import MakespanReport, run_scheduled
+from YTFeatureExtractor.Sharding import WorkQueue, claim_batches, parse_shard, select_shard
+from YTFeatureExtractor.Writer import set_async_writer
+from typing import List, Tuple
 
 
 def main():
     args = parse_args()
+    set_pcm_cache(args.pcm_cache, args.pcm_cache_size * 1024 ** 3 if args.pcm_cache_size else None)
+    set_melodia_workers(args.melodia_workers)
+    set_streaming(args.stream_longer_than)
+    set_precision(args.precision)
+    set_memory_budget(args.memory_budget)
+    set_feature_store(args.store, args.store_shards)
+    set_storage_policies(args.storage_policy)
+    set_metrics(args.metrics)
+    set_async_writer(args.async_writer, args.fsync)
+    set_audio_format(args.audio_format)
     listfile = args.listfile
     parallel = args.parallel
     input_dir = args.input
     force = args.force
     feat_keys = FEAT_KEYS
 
-    yt_ids = get_yt_ids(listfile, delimiter=args.delimiter)
+    # the list is read, deduplicated and processed in batches, so work starts after the first one
+    batches = unique_id_batches(iter_id_batches(listfile, delimiter=args.delimiter, batch_size=args.list_batch))
+    if args.shard:
+        index, count = parse_shard(args.shard)
+        batches = (batch for batch in (select_shard(batch, index, count) for batch in batches) if batch)
+        print(f"Shard {index}/{count}")
 
-    extract(input_dir, yt_ids, feat_keys, parallel, force)
+    manifest = Manifest(args.manifest) if args.manifest else None
+    feat_versions = {feat_key: feature_version(feat_key) for feat_key in feat_keys}
+    work_queue = None
 
-def extract(input_dir: str, yt_ids: List[str], feat_keys: List[str], parallel: bool, force: bool):
+    def record(result):
+        if manifest is not None:
+            manifest.record_result(result.yt_id, result, feat_versions)
+        if work_queue is not None:
+            work_queue.complete(result.yt_id, result.success, result.reason)
+
+    def run(yt_ids, append=False):
+        plan = plan_work(yt_ids, feat_keys, manifest, force, args.retry_failed)
+        print(f"{len(plan)} of {len(yt_ids)} videos outstanding")
+        if work_queue is not None:
+            planned = {yt_id for yt_id, _ in plan}
+            for yt_id in yt_ids:
+                if yt_id not in planned:
+                    work_queue.complete(yt_id, True)
+        downloader = LocalDownloader(args.local_source) if args.local_source else download
+        if args.pipeline:
+            results = extract_pipeline(input_dir, yt_ids, feat_keys, force, downloader,
+                                       args.download_workers, args.extract_workers, args.queue_size,
+                                       plan=plan, callback=record, timeout=args.timeout,
+                                       maxtasksperchild=args.maxtasksperchild)
+            print(summarize(results, args.results, append))
+        else:
+            report = MakespanReport()
+            results = extract(input_dir, yt_ids, feat_keys, parallel, force, workers=args.workers,
+                              chunksize=args.chunksize, maxtasksperchild=args.maxtasksperchild, timeout=args.timeout,
+                              plan=plan, schedule=args.schedule, pack=args.pack, report=report,
+                              downloader=downloader)
+            print(summarize((record(result) or result for result in tqdm(results, total=len(plan))), args.results,
+                            append))
+            print(report)
+
+    try:
+        with start_reporter(args.metrics_interval):
+            if args.claim:
+                # work stealing: claim batches from the shared queue until it is drained
+                work_queue = WorkQueue(args.claim, lease=args.lease)
+                try:
+                    print(f"Claiming from {args.claim} as {work_queue.node}")
+                    runs = 0
+                    for claimed in claim_batches(work_queue, batches, args.claim_batch):
+                        with work_queue.heartbeat():
+                            run(claimed, append=runs > 0)
+                        if manifest is not None:
+                            manifest.flush()
+                        runs += 1
+                    print(f"Work queue: {work_queue.counts()}")
+                finally:
+                    work_queue.close()
+            else:
+                for i, batch in enumerate(batches):
+                    run(batch, append=i > 0)
+    finally:
+        # results recorded so far are kept if the run fails or is interrupted
+        if manifest is not None:
+            manifest.close()
+
+def plan_work(yt_ids: List[str], feat_keys: List[str], manifest: Manifest = None, force: bool = False,
+              retry_failed: bool = False):
+    """Get the feature keys still to extract per video, skipping work the manifest records as done.
+    Args:
+        yt_ids (List[str]): list of youtube identifiers
+        feat_keys (List[str]): list of feature keys (eg. cqt_20, cqt_ch, ...)
+        manifest (Manifest, optional): job manifest. Defaults to None (all work outstanding).
+        force (bool, optional): plan all work regardless of the manifest. Defaults to False.
+        retry_failed (bool, optional): retry videos that failed permanently (eg. unavailable). Defaults to False.
+    Returns:
+        List[Tuple[str, List[str]]]: youtube identifier and outstanding feature keys
+    """
+    if manifest is None or force:
+        return [(yt_id, list(feat_keys)) for yt_id in yt_ids]
+    feat_versions = {feat_key: feature_version(feat_key) for feat_key in feat_keys}
+    return list(manifest.outstanding(yt_ids, feat_versions, retry_failed))
+
+def make_tasks(input_dir: str, plan: List[Tuple[str, List[str]]], force: bool, downloader=download):
+    for yt_id, keys in plan:
+        input_path = get_path(input_dir, yt_id)
+        yield Task(input_path, to_output_path(input_path), keys, force, downloader)
+
+def extract(input_dir: str, yt_ids: List[str], feat_keys: List[str], parallel: bool, force: bool,
+            workers: int = None, chunksize: int = 1, maxtasksperchild: int = None, timeout: float = None,
+            plan: List[Tuple[str, List[str]]] = None, schedule: str = "input", pack: bool = False,
+            report: MakespanReport = None, downloader=download):
     """Extract features for videos represented by list of youtube identifiers
     Args:
         input_dir (str): _description_
@@ -27,34 +138,67 @@ def extract(input_dir: str, yt_ids: List[str], feat_keys: List[str], parallel: b
         feat_keys (List[str]): list of feature keys (eg. cqt_20, cqt_ch, ...)
         parallel (bool): whether to use parallelization
         force (bool): whether to force new download and extraction, even if features are on disk
+        workers (int, optional): worker processes if parallel. Defaults to cpu_count().
+        chunksize (int, optional): tasks handed to a worker at once. Defaults to 1.
+        maxtasksperchild (int, optional): tasks after which a worker is replaced. Defaults to None.
+        timeout (float, optional): time limit per video in seconds. Defaults to None.
+        plan (List[Tuple[str, List[str]]], optional): feature keys per video (see plan_work),
+            overrides yt_ids and feat_keys. Defaults to None.
+        schedule (str, optional): task order, "input" or "longest" first. Defaults to "input".
+        pack (bool, optional): send tasks in chunks of about equal estimated cost. Defaults to False.
+        report (MakespanReport, optional): filled with the estimated and actual makespan. Defaults to None.
+        downloader (Callable, optional): download function (yt_id, outpath). Defaults to download.
+    Returns:
+        Iterator[TaskResult]: per-video results in completion order
     """
+    plan = plan if plan is not None else plan_work(yt_ids, feat_keys)
+    tasks = list(make_tasks(input_dir, plan, force, downloader))
+    return run_scheduled(tasks, workers=workers if parallel else 1, schedule=schedule, pack=pack,
+                         chunksize=chunksize, report=report, maxtasksperchild=maxtasksperchild, timeout=timeout,
+                         feat_keys=feat_keys)
 
-    input_paths = [get_path(input_dir, yt_id) for yt_id in yt_ids]
-    output_paths = [to_output_path(input_path) for input_path in input_paths]
-
-    if parallel:
-        with Pool(cpu_count()) as p:
-            list(tqdm(p.imap(process_file, input_paths, output_paths, feat_keys, force), total=len(input_paths)))
-    else:
-        for (input_path, output_path) in zip(input_paths, output_paths):
-            process_file(input_path, output_path, feat_keys, force)
+def extract_pipeline(input_dir: str, yt_ids: List[str], feat_keys: List[str], force: bool,
+                     downloader=download, download_workers: int = 4, extract_workers: int = None,
+                     queue_size: int = 16, plan: List[Tuple[str, List[str]]] = None, callback=None,
+                     timeout: float = None, maxtasksperchild: int = None):
+    """Extract features with separate download and extraction stages.
+    Args:
+        input_dir (str): directory with mp3s
+        yt_ids (List[str]): list of youtube identifiers
+        feat_keys (List[str]): list of feature keys (eg. cqt_20, cqt_ch, ...)
+        force (bool): whether to force new download and extraction, even if features are on disk
+        downloader (Callable, optional): download function (yt_id, outpath). Defaults to download.
+        download_workers (int, optional): concurrent downloads. Defaults to 4.
+        extract_workers (int, optional): extraction processes. Defaults to cpu_count().
+        queue_size (int, optional): downloaded files waiting for extraction. Defaults to 16.
+        plan (List[Tuple[str, List[str]]], optional): feature keys per video (see plan_work),
+            overrides yt_ids and feat_keys. Defaults to None.
+        callback (Callable, optional): called with each TaskResult. Defaults to None.
+        timeout (float, optional): time limit per video in seconds. Defaults to None.
+        maxtasksperchild (int, optional): tasks after which a worker is replaced. Defaults to None.
+    Returns:
+        List[TaskResult]: per-video results in completion order
+    """
+    plan = plan if plan is not None else plan_work(yt_ids, feat_keys)
+    with tqdm(total=len(plan)) as progress:
+        def finish(result):
+            progress.update()
+            if callback is not None:
+                callback(result)
+        return run_pipeline(make_tasks(input_dir, plan, force, downloader), download_workers, extract_workers,
+                            queue_size, callback=finish, feat_keys=feat_keys, timeout=timeout,
+                            maxtasksperchild=maxtasksperchild)
 
 def get_yt_ids(input_path: str, delimiter: str):
-    """Get list of youtube identifiers for given file path.
+    """Get list of youtube identifiers for given file path (see IdList.iter_id_batches to stream them).
     Args:
-        input_path (str): _description_
-
+        input_path (str): list file (.csv and .parquet with a yt_id column, else text with one ID per line)
+        delimiter (str): delimiter of csv files
     Returns:
-        List[str]: youtube identifiers
+        List[str]: unique youtube identifiers in file order
     """
-    df = pd.read_csv(input_path, delimiter=delimiter)
-    if input_path.endswith(".csv"):
-        yt_ids = df["yt_id"]
-    elif input_path.endswith(".parquet"):
-        yt_ids = pd.read_parquet(input_path)["yt_id"]
-    else:
-        yt_ids = parse_textfile(input_path)
-    return list(set(yt_ids))
+    return [yt_id for batch in unique_id_batches(iter_id_batches(input_path, delimiter=delimiter))
+            for yt_id in batch]
 
 def get_path(base_dir: str, yt_id: str, extension: str = ".mp3"):
     return os.path.join(base_dir, yt_id[:2], yt_id + extension)
@@ -72,9 +216,7 @@ def to_output_path(input_path: str):
     return os.sep.join((dirlist))
 
 def parse_textfile(input_path: str):
-    with open(input_path, "r") as txt_file:
-        lines = txt_file.readlines()
-    return lines
+    return [yt_id for batch in iter_id_batches(input_path) for yt_id in batch]
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Audio feature extractor from mp3 dir.')
@@ -82,12 +224,56 @@ def parse_args():
                         help="Filepath to a list of YouTube IDs to extract from.")
     parser.add_argument('--delimiter', type=str, 
                         help="Delimiter in listfile.", default=";")
+    parser.add_argument('--list_batch', type=int, default=10000,
+                        help='Videos read from the listfile and scheduled at once.')
     parser.add_argument('-i', '--input', type=str, default='/data/audio_data/',
                     help='Path with mp3s.')
     parser.add_argument('--parallel', action="store_true", 
                         help='Use multiple cores for extraction and downloads.')
     parser.add_argument('--force', action="store_true", 
                     help='Force new feature extraction even if file exists.')
+    parser.add_argument('--pipeline', action="store_true",
+                        help='Run downloads and extraction as separate concurrent stages.')
+    parser.add_argument('--download_workers', type=int, default=4,
+                        help='Concurrent downloads in pipeline mode.')
+    parser.add_argument('--extract_workers', type=int, default=None,
+                        help='Extraction processes in pipeline mode (default: all cores).')
+    parser.add_argument('--queue_size', type=int, default=16,
+                        help='Downloaded files waiting for extraction in pipeline mode.')
+    parser.add_argument('--local_source', type=str, default=None,
+                        help='Copy audio from this directory instead of downloading it.')
+    parser.add_argument('--audio_format', type=str, default=None, choices=['mp3', 'native'],
+                        help='Store downloads as 192 kbps mp3 (default) or untranscoded in their native '
+                             'container (opus, m4a).')
+    parser.add_argument('--manifest', type=str, default=None,
+                        help='SQLite job manifest to skip finished work and record outcomes in.')
+    parser.add_argument('--retry_failed', action="store_true",
+                        help='Retry videos the manifest records as unavailable.')
+    parser.add_argument('--shard', type=str, default=None,
+                        help='Process only shard i/N (0 <= i < N) of the list, hashed on the YouTube ID.')
+    parser.add_argument('--claim', type=str, default=None,
+                        help='Claim batches of videos from this SQLite work queue on shared storage (work stealing).')
+    parser.add_argument('--claim_batch', type=int, default=64,
+                        help='Videos claimed at once with --claim.')
+    parser.add_argument('--lease', type=float, default=600,
+                        help='Seconds after which the claims of a node that stopped renewing them expire.')
+    parser.add_argument('--store', type=str, default=None,
+                        help='Write features into a sharded store in this directory instead of one h5 per video.')
+    parser.add_argument('--store_shards', type=int, default=None,
+                        help='Maximum number of shard files (and parallel writers) of the store.')
+    parser.add_argument('--storage_policy', type=str, default=None,
+                        help='Dataset codecs, eg. "lzf,cqt_ch=gzip:4+float16" (codec[:level][+quantize][/chunk_frames]).')
+    parser.add_argument('--melodia_workers', type=int, default=None,
+                        help='Processes estimating the melody of long tracks in overlapping segments.')
+    parser.add_argument('--stream_longer_than', type=float, default=None,
+                        help='Decode and extract tracks longer than this many seconds in blocks with bounded memory.')
+    parser.add_argument('--precision', type=str, default=None, choices=list(PRECISIONS),
+                        help='Numeric precision of kernels, spectrograms and stored features (default: float64).')
+    parser.add_argument('--pcm_cache', type=str, default=None,
+                        help='Directory to cache decoded audio in, reruns skip mp3 decoding.')
+    parser.add_argument('--pcm_cache_size', type=float, default=None,
+                        help='Size limit of the decoded audio cache in GB.')
+    add_executor_args(parser)
     args = parser.parse_args()
     return args
     
@@ -1,29 +1,43 @@
 import argparse
 import os
-import pandas as pd
 from tqdm import tqdm
-from multiprocessing import Pool, cpu_count
-from YTFeatureExtractor.Helper import process_file, FEAT_KEYS
+from YTFeatureExtractor.Helper import FEAT_KEYS
+from YTFeatureExtractor.Executor import Task, run_task, summarize
+from YTFeatureExtractor.Audio import set_pcm_cache, set_streaming
+from YTFeatureExtractor.Download import set_audio_format
+from YTFeatureExtractor.Precision import PRECISIONS, set_precision
+from YTFeatureExtractor.SBBC import set_melodia_workers
+from YTFeatureExtractor.Store import set_feature_store
+from YTFeatureExtractor.Storage import set_storage_policies
 from extract_list import get_path, to_output_path
 
 
 def main():
     
     args = parse_args()
+    set_pcm_cache(args.pcm_cache, args.pcm_cache_size * 1024 ** 3 if args.pcm_cache_size else None)
+    set_melodia_workers(args.melodia_workers)
+    set_streaming(args.stream_longer_than)
+    set_precision(args.precision)
+    set_feature_store(args.store, args.store_shards)
+    set_storage_policies(args.storage_policy)
+    set_audio_format(args.audio_format)
     yt_id = args.youtube_id
     input_dir = args.input
     force = args.force
     feat_keys = FEAT_KEYS
 
-    extract(input_dir, yt_id, feat_keys, force)
+    result = extract(input_dir, yt_id, feat_keys, force, args.timeout)
+    summarize([result], args.results)
+    print(result)
 
 
-def extract(input_dir, yt_id, feat_keys, force):
+def extract(input_dir, yt_id, feat_keys, force, timeout=None):
 
     input_path = get_path(input_dir, yt_id)
     output_path = to_output_path(input_path)
 
-    process_file(input_path, output_path, feat_keys, force)
+    return run_task(Task(input_path, output_path, feat_keys, force), timeout)
 
 
 def parse_args():
@@ -34,6 +48,29 @@ def parse_args():
                     help='Path with mp3s.')
     parser.add_argument('--force', action="store_true", 
                     help='Force new feature extraction even if file exists.')
+    parser.add_argument('--audio_format', type=str, default=None, choices=['mp3', 'native'],
+                        help='Store downloads as 192 kbps mp3 (default) or untranscoded in their native '
+                             'container (opus, m4a).')
+    parser.add_argument('--store', type=str, default=None,
+                        help='Write features into a sharded store in this directory instead of one h5 per video.')
+    parser.add_argument('--store_shards', type=int, default=None,
+                        help='Maximum number of shard files (and parallel writers) of the store.')
+    parser.add_argument('--storage_policy', type=str, default=None,
+                        help='Dataset codecs, eg. "lzf,cqt_ch=gzip:4+float16" (codec[:level][+quantize][/chunk_frames]).')
+    parser.add_argument('--melodia_workers', type=int, default=None,
+                        help='Processes estimating the melody of long tracks in overlapping segments.')
+    parser.add_argument('--stream_longer_than', type=float, default=None,
+                        help='Decode and extract tracks longer than this many seconds in blocks with bounded memory.')
+    parser.add_argument('--precision', type=str, default=None, choices=list(PRECISIONS),
+                        help='Numeric precision of kernels, spectrograms and stored features (default: float64).')
+    parser.add_argument('--pcm_cache', type=str, default=None,
+                        help='Directory to cache decoded audio in, reruns skip mp3 decoding.')
+    parser.add_argument('--pcm_cache_size', type=float, default=None,
+                        help='Size limit of the decoded audio cache in GB.')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Time limit in seconds.')
+    parser.add_argument('--results', type=str, default=None,
+                        help='Write the result as JSON lines to this file.')
     args = parser.parse_args()
     return args
 
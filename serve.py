@@ -0,0 +1,47 @@
+import argparse
+import logging
+from YTFeatureExtractor.Helper import FEAT_KEYS
+from YTFeatureExtractor.Precision import PRECISIONS, set_precision
+from YTFeatureExtractor.SBBC import set_melodia_workers
+from YTFeatureExtractor.Service import ExtractionService, make_server
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    set_melodia_workers(args.melodia_workers)
+    set_precision(args.precision)
+
+    service = ExtractionService(args.feat_keys, workers=args.workers)
+    server = make_server(service, args.host, args.port, args.socket)
+    logging.info(f"Serving {', '.join(service.feat_keys)} on {args.socket or f'{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Extraction service keeping workers and kernels warm.')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='Port to listen on.')
+    parser.add_argument('--socket', type=str, default=None,
+                        help='Listen on this Unix socket instead of host and port.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Warm worker processes, 0 extracts in the request threads.')
+    parser.add_argument('--feat_keys', nargs='+', default=FEAT_KEYS, choices=FEAT_KEYS,
+                        help='Feature keys to warm up and extract by default.')
+    parser.add_argument('--melodia_workers', type=int, default=None,
+                        help='Processes estimating the melody of long tracks in overlapping segments.')
+    parser.add_argument('--precision', type=str, default=None, choices=list(PRECISIONS),
+                        help='Numeric precision of kernels, spectrograms and features (default: float64).')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
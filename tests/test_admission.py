@@ -0,0 +1,32 @@
+from YTFeatureExtractor import Admission
+from YTFeatureExtractor.Admission import AdmissionController
+from YTFeatureExtractor.Executor import Task, TaskResult
+
+
+def test_durations_are_probed_outside_the_lock(monkeypatch):
+    controller = AdmissionController(budget=10 ** 12, workers=2)
+    probed = {}
+
+    def probe(path):
+        # owned by this thread if the controller is probing while holding its lock
+        probed[path] = controller._lock._is_owned()
+        return None if path.endswith("new.mp3") else 60.0
+
+    monkeypatch.setattr(Admission, "_probe_duration", probe)
+    task, chunk = Task("a.mp3", "a.h5", ["cens"]), [Task("b.mp3", "b.h5", ["cens"]), Task("new.mp3", "c.h5", [])]
+    assert controller.try_acquire(task)
+    controller.acquire(chunk)
+    assert probed == {"a.mp3": False, "b.mp3": False, "new.mp3": False}
+    assert controller._durations == {"a.mp3": 60.0, "b.mp3": 60.0, "new.mp3": None}
+
+    # the task downloaded the file: probed again on release
+    def probe_downloaded(path):
+        probed[path] = controller._lock._is_owned()
+        return 120.0
+
+    monkeypatch.setattr(Admission, "_probe_duration", probe_downloaded)
+    result = TaskResult("new.mp3", "c.h5", True, None, "", {}, (), (), {"pid": 1, "rss": 10 ** 8, "peak": 2 * 10 ** 8})
+    controller.release(chunk, [result])
+    assert probed["new.mp3"] is False
+    assert controller._durations["new.mp3"] == 120.0
+    assert list(controller._in_flight) == [id(task)]
@@ -0,0 +1,46 @@
+import h5py
+import librosa
+import numpy as np
+import soundfile
+from YTFeatureExtractor.Audio import AudioProvider
+from YTFeatureExtractor.Helper import extract_file
+
+SR = 22050
+FEATURES = ["cqt_20", "cqt_ch", "cens", "onset_env"]
+
+
+def test_each_track_is_decoded_once(tmp_path, monkeypatch):
+    monkeypatch.delenv("YTFE_FEATURE_STORE", raising=False)
+    monkeypatch.delenv("YTFE_PCM_CACHE_DIR", raising=False)
+    monkeypatch.delenv("YTFE_STREAM_SECONDS", raising=False)
+    monkeypatch.delenv("YTFE_WRITER_QUEUE", raising=False)
+    rng = np.random.default_rng(0)
+    soundfile.write(str(tmp_path / "vid00000abc.wav"), 0.1 * rng.standard_normal(5 * SR), SR)
+    calls = {"load": 0, "resample": 0}
+    load, resample = librosa.load, librosa.resample
+
+    def counted(name, func):
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(librosa, "load", counted("load", load))
+    monkeypatch.setattr(librosa, "resample", counted("resample", resample))
+    output_file = str(tmp_path / "vid00000abc.h5")
+    assert extract_file(str(tmp_path / "vid00000abc.mp3"), output_file, FEATURES, strict=True)
+    # one decode for all features, one resample to 16 kHz for cqt_ch
+    assert calls == {"load": 1, "resample": 1}
+    with h5py.File(output_file, "r") as file_out:
+        assert sorted(file_out) == sorted(FEATURES)
+
+
+def test_resampled_signals_are_cached_per_rate():
+    y = np.random.default_rng(0).standard_normal(SR).astype(np.float32)
+    audio = AudioProvider(sr=SR, y=y)
+    assert audio.get() is y
+    y_16k = audio.get(16000)
+    assert len(y_16k) == 16000 and audio.get(16000) is y_16k
+    assert audio.get(8000, cache=False) is not audio.get(8000, cache=False)
+    audio.release()
+    assert audio.get(16000) is not y_16k and audio.load()[0] is y
@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+from benchmarks import features
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESULT = {"signal": "tone", "duration": 30.0, "target": "cens", "wall": 1.0, "cpu": 1.0,
+          "peak_rss": 100 * 1024 ** 2, "bytes": 10 ** 6}
+
+
+def test_compare_flags_growth_above_threshold_and_noise_floor():
+    baseline = {"results": [RESULT, dict(RESULT, target="onset_env"), dict(RESULT, target="cqt_20")]}
+    results = [
+        # wall +20%: regression; cpu +10%: within the threshold
+        dict(RESULT, wall=1.2, cpu=1.1),
+        # +100% but below the absolute noise floor
+        dict(RESULT, target="onset_env", bytes=10 ** 6 + 512, wall=1.04),
+        dict(RESULT, target="cqt_20", error="cqt_20 failed"),
+        # not in the baseline
+        dict(RESULT, target="melodia", wall=10.0),
+    ]
+    regressions = features.compare(results, baseline, threshold=0.15)
+    assert [(r["target"], r["metric"]) for r in regressions] == [("cens", "wall"), ("cqt_20", "error")]
+    assert abs(regressions[0]["change"] - 0.2) < 1e-9
+
+
+def test_compare_exits_with_status_1_on_regressions(tmp_path):
+    command = [sys.executable, "benchmarks/features.py", "--signals", "tone", "--durations", "1",
+               "--feat_keys", "onset_env", "--repeat", "1"]
+    subprocess.run(command + ["--output", str(tmp_path / "baseline.json")], check=True, capture_output=True, cwd=ROOT)
+    report = json.loads((tmp_path / "baseline.json").read_text())
+    assert [r["target"] for r in report["results"]] == ["onset_env", "process_file"]
+    assert all("error" not in r for r in report["results"])
+    # a baseline writing half the bytes: the current run is a regression
+    for r in report["results"]:
+        r["bytes"] = r["bytes"] // 2 - 1024
+    (tmp_path / "baseline.json").write_text(json.dumps(report))
+    run = subprocess.run(command + ["--compare", str(tmp_path / "baseline.json"), "--output",
+                                    str(tmp_path / "current.json")], capture_output=True, text=True, cwd=ROOT)
+    assert run.returncode == 1
+    assert "REGRESSION tone 1s onset_env bytes" in run.stderr
@@ -0,0 +1,35 @@
+import numpy as np
+import soundfile
+from YTFeatureExtractor.Audio import AudioProvider, find_audio
+from YTFeatureExtractor.Download import LocalDownloader
+from YTFeatureExtractor.Helper import fetch_file
+
+SR = 22050
+
+
+def test_local_downloader_keeps_the_native_container(tmp_path):
+    # sharded source layout: <yt_id[:2]>/<yt_id>.flac
+    (tmp_path / "source" / "vi").mkdir(parents=True)
+    y = (0.1 * np.sin(np.arange(SR) / 10)).astype(np.float32)
+    soundfile.write(str(tmp_path / "source" / "vi" / "vid00000abc.flac"), y, SR)
+    input_file = str(tmp_path / "audio" / "vid00000abc.mp3")
+    assert find_audio(input_file) is None
+
+    downloads = []
+    downloader = LocalDownloader(str(tmp_path / "source"))
+    assert fetch_file(input_file, downloader=lambda *args: downloads.append(args) or downloader(*args))
+    audio_path = str(tmp_path / "audio" / "vid00000abc.flac")
+    assert find_audio(input_file) == audio_path
+    assert downloads == [("vid00000abc", input_file)]
+    # found under its own extension, nothing is downloaded again
+    assert fetch_file(input_file, downloader=lambda *args: downloads.append(args))
+    assert len(downloads) == 1
+
+    loaded, sr = AudioProvider(audio_path, sr=SR).load()
+    assert sr == SR and len(loaded) == len(y)
+
+
+def test_local_downloader_misses_unknown_ids(tmp_path):
+    (tmp_path / "source").mkdir()
+    assert not LocalDownloader(str(tmp_path / "source"))("vid00001abc", str(tmp_path / "vid00001abc.mp3"))
+    assert not fetch_file(str(tmp_path / "vid00001abc.mp3"), downloader=LocalDownloader(str(tmp_path / "source")))
@@ -0,0 +1,62 @@
+import os
+import signal
+import time
+from YTFeatureExtractor import Executor
+from YTFeatureExtractor.Executor import Task, run_tasks
+
+
+def stall_in_native_code(yt_id: str, output_path: str):
+    # SIGALRM stays pending like during a long native call
+    signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGALRM])
+    time.sleep(60)
+
+
+def stall_in_python(yt_id: str, output_path: str):
+    time.sleep(60)
+
+
+def crash(yt_id: str, output_path: str):
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def unavailable(yt_id: str, output_path: str):
+    pass
+
+
+def tasks(tmp_path, downloaders):
+    return [Task(str(tmp_path / f"vid{i:05d}abc.mp3"), str(tmp_path / f"vid{i:05d}abc.h5"), ["onset_env"],
+                 downloader=downloader) for i, downloader in enumerate(downloaders)]
+
+
+def outcomes(results):
+    return {os.path.basename(result.input_path): result.reason for result in results}
+
+
+def test_stuck_workers_are_killed_and_replaced(tmp_path, monkeypatch):
+    monkeypatch.setattr(Executor, "KILL_GRACE", 0.5)
+    downloaders = [stall_in_native_code, unavailable, stall_in_python, crash, unavailable, stall_in_native_code,
+                   unavailable]
+    start = time.time()
+    results = list(run_tasks(tasks(tmp_path, downloaders), workers=2, timeout=1, feat_keys=[]))
+    assert time.time() - start < 30
+    assert outcomes(results) == {"vid00000abc.mp3": "timeout", "vid00001abc.mp3": "unavailable",
+                                 "vid00002abc.mp3": "timeout", "vid00003abc.mp3": "exception",
+                                 "vid00004abc.mp3": "unavailable", "vid00005abc.mp3": "timeout",
+                                 "vid00006abc.mp3": "unavailable"}
+    killed = [result for result in results if result.input_path.endswith(("00000abc.mp3", "00005abc.mp3"))]
+    assert all("killed" in result.message for result in killed)
+    # the soft limit ends a stall in Python code without replacing the worker
+    assert "killed" not in next(result for result in results if result.input_path.endswith("00002abc.mp3")).message
+
+
+def test_rest_of_a_chunk_runs_after_a_kill(tmp_path, monkeypatch):
+    monkeypatch.setattr(Executor, "KILL_GRACE", 0.5)
+    chunk = tasks(tmp_path, [unavailable, stall_in_native_code, unavailable, crash, unavailable])
+    results = list(run_tasks([chunk], workers=2, timeout=1, feat_keys=[], packed=True))
+    assert [result.reason for result in results] == ["unavailable", "timeout", "unavailable", "exception",
+                                                     "unavailable"]
+
+
+def test_maxtasksperchild_replaces_workers(tmp_path):
+    results = list(run_tasks(tasks(tmp_path, [unavailable] * 6), workers=2, maxtasksperchild=1, feat_keys=[]))
+    assert len({result.memory["pid"] for result in results}) == 6
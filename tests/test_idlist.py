@@ -0,0 +1,14 @@
+import numpy as np
+from YTFeatureExtractor.IdList import SeenIds, unique_id_batches
+
+
+def test_seen_ids_keep_first_occurrences_in_order():
+    rng = np.random.default_rng(0)
+    yt_ids = [f"vid{i:05d}abc" for i in rng.integers(0, 3000, 10000)]
+    batches = [yt_ids[i:i + 700] for i in range(0, len(yt_ids), 700)]
+    seen = SeenIds(buffer_size=256)
+    deduplicated = [yt_id for batch in unique_id_batches(batches, seen) for yt_id in batch]
+    assert deduplicated == list(dict.fromkeys(yt_ids))
+    assert len(seen) == len(deduplicated)
+    # 8 bytes per identifier in the merged segments
+    assert sum(segment.nbytes for segment in seen._segments) + 8 * len(seen._buffer) == 8 * len(seen)
@@ -0,0 +1,130 @@
+import json
+import multiprocessing
+from concurrent.futures import Future
+import numpy as np
+from YTFeatureExtractor import SBBC as sbbc_module
+from YTFeatureExtractor.Helper import dataset_attrs, feature_attrs
+from YTFeatureExtractor.SBBC import SBBC, last_segmentation, parallel_workers
+
+SR = 22050
+HOP = 512
+
+
+def single_pass(n_samples: int, seed: int = 0):
+    """Contour like PredominantPitchMelodia's: held notes (Hz) with unvoiced gaps (0)."""
+    rng = np.random.default_rng(seed)
+    n_frames = 1 + n_samples // HOP
+    notes = np.repeat(110 * 2 ** (rng.integers(0, 24, n_frames // 20 + 1) / 12), 20)[:n_frames]
+    return np.where(rng.random(n_frames // 20 + 1).repeat(20)[:n_frames] < 0.2, 0, notes).astype(np.float32)
+
+
+def segment_contours(reference: np.array, segments, edge_frames: int, seed: int = 1):
+    # the tracker lacks context at segment edges inside the track: replace the frames there
+    rng = np.random.default_rng(seed)
+    contours = []
+    for i, (start, stop) in enumerate(segments):
+        contour = reference[start // HOP:start // HOP + 1 + (stop - start) // HOP].copy()
+        if i > 0:
+            contour[:edge_frames] = rng.uniform(80, 800, edge_frames)
+        if i < len(segments) - 1:
+            contour[-edge_frames:] = rng.uniform(80, 800, edge_frames)
+        contours.append(contour)
+    return contours
+
+
+def test_stitch_matches_single_pass():
+    sbbc = SBBC(melodia_algo=None, sr=SR, hop_size=HOP, segment_seconds=30, overlap_seconds=6, segmented=True)
+    n_samples = 200 * SR + 123
+    reference = single_pass(n_samples)
+    segments = sbbc._segments(n_samples)
+    assert len(segments) > 2
+    # edges reach a fifth into the overlap, the cut is within its central half
+    edge_frames = int(6 * SR / HOP) // 5
+    stitched = SBBC._stitch(segment_contours(reference, segments, edge_frames),
+                            [start // HOP for start, _ in segments])
+    np.testing.assert_array_equal(stitched, reference)
+
+
+def test_stitch_cuts_where_segments_agree():
+    previous = np.array([100, 100, 100, 200, 300, 300, 300, 300], dtype=np.float32)
+    following = np.array([400, 400, 300, 250, 250, 250], dtype=np.float32)
+    # overlap of 6 frames from frame 2, agreeing only at frame 4 (next to the middle, frame 5)
+    stitched = SBBC._stitch([previous, following], [0, 2])
+    np.testing.assert_array_equal(stitched, [100, 100, 100, 200, 300, 250, 250, 250])
+    # no agreement: cut at the middle
+    stitched = SBBC._stitch([previous, following + 1000], [0, 2])
+    np.testing.assert_array_equal(stitched, [100, 100, 100, 200, 300, 1250, 1250, 1250])
+
+
+def _in_pool_worker(workers: int):
+    return parallel_workers(workers)
+
+
+def test_parallel_workers_fall_back_in_pool_workers():
+    assert parallel_workers(4) == 4
+    with multiprocessing.get_context("fork").Pool(1) as pool:
+        assert pool.apply(_in_pool_worker, (4,)) == 1
+
+
+def test_melodia_params_do_not_depend_on_the_configuration(monkeypatch):
+    monkeypatch.setenv("YTFE_MELODIA_WORKERS", "1")
+    monkeypatch.delenv("YTFE_STREAM_SECONDS", raising=False)
+    attrs = feature_attrs("melodia")
+    monkeypatch.setenv("YTFE_MELODIA_WORKERS", "4")
+    monkeypatch.setenv("YTFE_STREAM_SECONDS", "1800")
+    assert feature_attrs("melodia") == attrs
+
+
+def test_segmentation_is_recorded_per_track(monkeypatch):
+    monkeypatch.setattr(sbbc_module, "_estimate_segment",
+                        lambda algo, sr, hop, audio: single_pass(len(audio)))
+    sbbc = SBBC(melodia_algo=None, sr=SR, hop_size=HOP, segment_seconds=30, overlap_seconds=6, segmented=True)
+    sbbc._estimate_melody(np.zeros(100 * SR, dtype=np.float32))
+    assert json.loads(last_segmentation()) == {"stitched": True, "segments": 4, "segment_seconds": 30,
+                                               "overlap_seconds": 6}
+    attrs = dataset_attrs("melodia")
+    assert attrs["segmentation"] == last_segmentation()
+    # the segmentation is not part of the attributes compared for staleness
+    assert {name: attrs[name] for name in feature_attrs("melodia")} == feature_attrs("melodia")
+
+
+class CountingFuture(Future):
+    def __init__(self, pool, value):
+        super().__init__()
+        self.pool = pool
+        self.set_result(value)
+
+    def result(self, timeout=None):
+        self.pool.in_flight -= 1
+        return super().result(timeout)
+
+
+class CountingPool(object):
+    def __init__(self):
+        self.in_flight = 0
+        self.most = 0
+
+    def submit(self, func, *args):
+        self.in_flight += 1
+        self.most = max(self.most, self.in_flight)
+        return CountingFuture(self, func(*args))
+
+
+def test_segments_are_submitted_through_a_bounded_window(monkeypatch):
+    pool = CountingPool()
+    monkeypatch.setattr(sbbc_module, "_segment_pool", lambda workers: pool)
+    monkeypatch.setattr(sbbc_module, "_estimate_segment", lambda algo, sr, hop, audio: len(audio))
+    sbbc = SBBC(melodia_algo=None, sr=SR, hop_size=HOP, segment_seconds=10, overlap_seconds=2)
+    segments = sbbc._segments(200 * SR)
+    contours = sbbc_module._map_segments("melodia", SR, HOP, np.zeros(200 * SR, dtype=np.float32), segments, 3)
+    assert contours == [stop - start for start, stop in segments]
+    assert len(segments) > 20 and pool.most == 3
+
+
+def test_segment_pool_is_reused_across_tracks(monkeypatch):
+    monkeypatch.setattr(sbbc_module, "_POOL", None)
+    pool = sbbc_module._segment_pool(2)
+    try:
+        assert sbbc_module._segment_pool(2) is pool
+    finally:
+        pool.shutdown()
@@ -0,0 +1,72 @@
+import json
+import os
+import pytest
+from YTFeatureExtractor import Metrics
+from YTFeatureExtractor.Metrics import MetricsReporter, emit, set_metrics, stage
+
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    monkeypatch.delenv("YTFE_METRICS_DIR", raising=False)
+    set_metrics(str(tmp_path))
+    yield str(tmp_path)
+    monkeypatch.setattr(Metrics, "_sink", None)
+
+
+def test_stages_and_tracks_are_aggregated(directory):
+    # events of an earlier run in the same directory
+    with open(os.path.join(directory, "events-1.jsonl"), "w") as f:
+        f.write(json.dumps({"event": "stage", "stage": "decode", "seconds": 100.0, "ok": True, "time": 0.0}) + "\n")
+    reporter = MetricsReporter(directory)
+    for _ in range(3):
+        with stage("decode", yt_id="vid00000abc"):
+            pass
+    with stage("feature", feat_key="cens"):
+        pass
+    with pytest.raises(ValueError):
+        with stage("feature", feat_key="cens"):
+            raise ValueError()
+    emit("track", success=True, reason="")
+    emit("track", success=False, reason="download")
+
+    s = reporter.report()
+    assert s["stages"][("decode", "")]["count"] == 3
+    assert s["stages"][("decode", "")]["seconds"] < 100.0
+    assert s["stages"][("feature", "cens")]["count"] == 2
+    assert s["stages"][("feature", "cens")]["failed"] == 1
+    assert s["tracks"] == {"success": 1, "failure": 1}
+    assert s["failures"] == {"download": 1}
+
+    with open(os.path.join(directory, "metrics.prom")) as f:
+        prom = f.read()
+    assert 'ytfe_stage_seconds_count{stage="decode"} 3\n' in prom
+    assert 'ytfe_stage_seconds_count{stage="feature",feat_key="cens"} 2\n' in prom
+    assert 'ytfe_stage_failures_total{stage="feature",feat_key="cens"} 1\n' in prom
+    assert 'ytfe_tracks_total{status="failure"} 1\n' in prom
+    assert 'ytfe_failures_total{reason="download"} 1\n' in prom
+
+    # events are read once
+    assert reporter.report()["stages"][("decode", "")]["count"] == 3
+
+
+def test_partially_written_lines_are_read_again(directory):
+    reporter = MetricsReporter(directory)
+    line = json.dumps({"event": "track", "success": True, "reason": "", "time": reporter.start + 1})
+    path = os.path.join(directory, "events-1.jsonl")
+    with open(path, "w") as f:
+        f.write(line[:10])
+    reporter.collect()
+    assert reporter.summary()["tracks"] == {}
+    with open(path, "a") as f:
+        f.write(line[10:] + "\n")
+    reporter.collect()
+    assert reporter.summary()["tracks"] == {"success": 1}
+
+
+def test_stage_is_a_no_op_without_a_directory(tmp_path, monkeypatch):
+    monkeypatch.delenv("YTFE_METRICS_DIR", raising=False)
+    with stage("decode"):
+        pass
+    emit("track", success=True, reason="")
+    assert stage("decode") is Metrics._NULL_STAGE
+    assert os.listdir(tmp_path) == []
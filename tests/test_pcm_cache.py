@@ -0,0 +1,31 @@
+import os
+import numpy as np
+from YTFeatureExtractor import Audio
+from YTFeatureExtractor.Audio import PCMCache, get_pcm_cache, set_pcm_cache
+
+
+def test_get_pcm_cache_is_shared_per_configuration(tmp_path, monkeypatch):
+    monkeypatch.delenv("YTFE_PCM_CACHE_DIR", raising=False)
+    monkeypatch.delenv("YTFE_PCM_CACHE_MAX_BYTES", raising=False)
+    assert get_pcm_cache() is None
+    set_pcm_cache(str(tmp_path), 10 ** 6)
+    cache = get_pcm_cache()
+    assert get_pcm_cache() is cache
+    set_pcm_cache(str(tmp_path), 2 * 10 ** 6)
+    assert get_pcm_cache() is not cache and get_pcm_cache().max_bytes == 2 * 10 ** 6
+
+
+def test_size_is_counted_once(tmp_path, monkeypatch):
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(Audio.os, "walk", lambda top: walks.append(top) or walk(top))
+    # tracks of 420 bytes, a tenth of the limit is written every 10 tracks
+    cache = PCMCache(str(tmp_path), max_bytes=42000)
+    for i in range(20):
+        cache.put(f"vid{i:05d}abc", np.zeros(100, dtype=np.float32), 22050)
+    assert walks == [str(tmp_path)] * 2
+    # over the limit: the least recently used tracks go
+    cache.max_bytes = 420 * 15
+    cache.put("vid00020abc", np.zeros(100, dtype=np.float32), 22050)
+    assert len(walks) == 3
+    assert [cache.get(f"vid{i:05d}abc", 22050) is None for i in range(21)] == [True] * 6 + [False] * 15
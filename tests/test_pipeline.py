@@ -0,0 +1,61 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import numpy as np
+import pytest
+import soundfile
+from YTFeatureExtractor.Download import LocalDownloader
+from YTFeatureExtractor.Executor import Task
+from YTFeatureExtractor.Pipeline import run_pipeline
+
+SR = 22050
+
+
+@pytest.fixture
+def tasks(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    rng = np.random.default_rng(0)
+    tasks = []
+    for i in range(8):
+        yt_id = f"vid{i:05d}abc"
+        soundfile.write(str(source / f"{yt_id}.wav"), 0.1 * rng.standard_normal(20 * SR), SR)
+        tasks.append(Task(str(tmp_path / f"{yt_id}.mp3"), str(tmp_path / "out" / f"{yt_id}.h5"), ["onset_env"],
+                          downloader=LocalDownloader(str(source))))
+    return tasks
+
+
+def kill_a_worker():
+    os.kill(multiprocessing.active_children()[0].pid, signal.SIGKILL)
+
+
+def test_pipeline_survives_a_killed_worker(tasks):
+    killed = []
+
+    def callback(result):
+        if not killed:
+            killed.append(kill_a_worker())
+
+    start = time.time()
+    results = run_pipeline(tasks, download_workers=2, extract_workers=2, queue_size=2, callback=callback,
+                           feat_keys=["onset_env"])
+    assert time.time() - start < 120
+    assert sorted(result.input_path for result in results) == sorted(task.input_path for task in tasks)
+    # the track of the killed worker fails, the others are extracted by the remaining and new workers
+    assert all(result.success or result.reason == "exception" for result in results)
+    assert sum(result.success for result in results) >= len(tasks) - 1
+    assert all("fetch" in result.timings and "extract" in result.timings for result in results if result.success)
+
+
+def test_pipeline_stops_downloads_when_it_fails(tasks):
+    def callback(result):
+        raise RuntimeError("callback failed")
+
+    with pytest.raises(RuntimeError):
+        run_pipeline(tasks, download_workers=2, extract_workers=1, queue_size=1, callback=callback,
+                     feat_keys=["onset_env"])
+    assert not [thread for thread in threading.enumerate() if thread is not threading.main_thread()
+                and not thread.daemon]
+    assert multiprocessing.active_children() == []
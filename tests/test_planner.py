@@ -0,0 +1,77 @@
+import librosa
+import numpy as np
+import pytest
+from YTFeatureExtractor import Helper
+from YTFeatureExtractor.Audio import AudioProvider
+from YTFeatureExtractor.Helper import NODES, compute_features, extract_cqt_20, extract_cqt_ch
+from YTFeatureExtractor.Planner import FeaturePlan, Node
+
+SR = 22050
+FEATURES = ["cqt_20", "cqt_ch", "cens", "onset_env"]
+
+
+@pytest.fixture(scope="module")
+def y():
+    rng = np.random.default_rng(0)
+    t = np.arange(10 * SR) / SR
+    notes = np.repeat(440 * 2 ** (rng.integers(-12, 12, 20) / 12), len(t) // 20 + 1)[:len(t)]
+    return (0.3 * np.sin(2 * np.pi * np.cumsum(notes) / SR) + 0.05 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def baseline(y: np.array, feat_key: str):
+    """Per-feature extraction, each from the waveform (as before planning)."""
+    if feat_key == "cqt_20":
+        return extract_cqt_20(y)
+    elif feat_key == "cqt_ch":
+        return extract_cqt_ch(librosa.resample(y, orig_sr=SR, target_sr=16000))
+    elif feat_key == "cens":
+        return librosa.feature.chroma_cens(y=y, sr=SR, hop_length=512)
+    elif feat_key == "onset_env":
+        return librosa.onset.onset_strength(y=y, sr=SR)
+
+
+def test_planned_features_match_per_feature_extraction(y, monkeypatch):
+    monkeypatch.setenv("YTFE_PRECISION", "float64")
+    features = {feat_key: feature for feat_key, feature, error in compute_features(AudioProvider(sr=SR, y=y), FEATURES)
+                if error is None}
+    assert list(features) == FEATURES
+    for feat_key in FEATURES:
+        np.testing.assert_allclose(features[feat_key], baseline(y, feat_key), rtol=1e-6, atol=1e-6, err_msg=feat_key)
+
+
+def test_intermediates_are_computed_once(y, monkeypatch):
+    calls = {}
+
+    def counted(node):
+        def func(*args):
+            calls[node.name] = calls.get(node.name, 0) + 1
+            return node.func(*args)
+        return Node(node.name, node.deps, func, node.requires)
+
+    monkeypatch.setattr(Helper, "NODES", {name: counted(node) for name, node in NODES.items()})
+    plan = FeaturePlan(FEATURES, Helper.NODES)
+    # the STFT magnitude feeds both the chroma tuning (cens) and the mel spectrogram (onset_env)
+    assert {"y_16k", "stft_mag", "tuning_36", "cqt_mag", "cqt_chroma", "mel_db"} <= set(plan.intermediates())
+    results = list(compute_features(AudioProvider(sr=SR, y=y), FEATURES))
+    assert [error for _, _, error in results] == [None] * len(FEATURES)
+    assert calls == {name: 1 for name in plan.order if name in NODES}
+
+
+def test_intermediates_are_released_after_their_last_consumer():
+    released = []
+
+    class Value(object):
+        def __init__(self, name):
+            self.name = name
+
+        def __del__(self):
+            released.append(self.name)
+
+    nodes = {
+        "shared": Node("shared", ["x"], lambda x: Value("shared")),
+        "a": Node("a", ["shared"], lambda shared: 1),
+        "b": Node("b", ["shared"], lambda shared: 2),
+    }
+    results = FeaturePlan(["a", "b"], nodes).run(x=0)
+    assert next(results) == ("a", 1, None) and released == []
+    assert next(results) == ("b", 2, None) and released == ["shared"]
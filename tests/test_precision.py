@@ -0,0 +1,69 @@
+import importlib.util
+import h5py
+import numpy as np
+import pytest
+from YTFeatureExtractor.Audio import AudioProvider
+from YTFeatureExtractor.Helper import FEAT_KEYS, extract_features
+from YTFeatureExtractor.Precision import TOLERANCES, cast, deviation
+from YTFeatureExtractor.Storage import read_feature
+
+SR = 22050
+# melodia needs essentia
+FEATURES = [feat_key for feat_key in FEAT_KEYS if feat_key != "melodia" or importlib.util.find_spec("essentia")]
+
+
+def synthetic_track(duration: float, seed: int = 0):
+    """Detuned random melody with amplitude modulation and noise (as benchmarks/precision.py)."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * SR)) / SR
+    notes = 440 * 2 ** (rng.integers(-12, 12, max(1, int(duration * 2))) / 12 + 0.1 / 12)
+    freqs = np.repeat(notes, len(t) // len(notes) + 1)[:len(t)]
+    y = 0.3 * np.sin(2 * np.pi * np.cumsum(freqs) / SR) + 0.05 * rng.standard_normal(len(t))
+    return (y * (1 + np.sin(2 * np.pi * 0.5 * t)) / 2).astype(np.float32)
+
+
+def extract(y: np.array, precision: str, monkeypatch):
+    monkeypatch.setenv("YTFE_PRECISION", precision)
+    with h5py.File(f"{precision}.h5", "w", driver="core", backing_store=False) as f:
+        failed = extract_features(AudioProvider(sr=SR, y=y), FEATURES, f)
+        assert failed == []
+        return {feat_key: read_feature(f, feat_key) for feat_key in FEATURES}
+
+
+@pytest.fixture(scope="module")
+def features():
+    y = synthetic_track(20)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        return extract(y, "float64", monkeypatch), extract(y, "float32", monkeypatch)
+
+
+@pytest.mark.parametrize("feat_key", FEATURES)
+def test_float32_within_tolerance(features, feat_key):
+    reference, feature = features[0][feat_key], features[1][feat_key]
+    assert feature.shape == reference.shape
+    assert deviation(reference, feature) <= TOLERANCES[feat_key]
+
+
+@pytest.mark.parametrize("feat_key", FEATURES)
+def test_float32_stored_in_float32(features, feat_key):
+    assert features[1][feat_key].dtype.itemsize <= 4
+
+
+def test_cqt_ch_deviation_is_bounded(features):
+    # PyCqt kernels and spectrograms follow the precision, so float32 changes cqt_ch, within its bound
+    error = deviation(features[0]["cqt_ch"], features[1]["cqt_ch"])
+    assert 0 < error <= TOLERANCES["cqt_ch"]
+
+
+def test_cast():
+    assert cast(np.ones(3), "float64").dtype == np.float64
+    assert cast(np.ones(3), "float32").dtype == np.float32
+    assert cast(np.ones(3, dtype=np.complex128), "float32").dtype == np.complex64
+    assert cast(np.ones(3, dtype=np.int64), "float32").dtype == np.int64
+
+
+def test_deviation():
+    reference = np.array([0.0, 1.0, 2.0])
+    assert deviation(reference, reference.astype(np.float32)) == 0.0
+    assert deviation(reference, reference + [0.0, 0.02, 0.0]) == pytest.approx(0.01)
+    assert deviation(reference, reference[:2]) == np.inf
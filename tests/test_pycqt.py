@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from YTFeatureExtractor import PyCQT
+from YTFeatureExtractor.PyCQT import PyCqt, get_cqt_kernel, get_split_kernel
+
+SR = 16000
+TIME_RESOLUTION = 25
+
+
+def per_frame_spec(audio_signal, kernel):
+    """The original loop: one complex FFT and one kernel product per frame."""
+    step_length = round(SR / TIME_RESOLUTION)
+    number_times = int(np.floor(len(audio_signal) / step_length))
+    number_frequencies, fft_length = np.shape(kernel)
+    audio_signal = np.pad(audio_signal, (int(np.ceil((fft_length - step_length) / 2)),
+                                         int(np.floor((fft_length - step_length) / 2))), "constant")
+    cqt_spectrogram = np.zeros((number_frequencies, number_times))
+    for j in range(number_times):
+        frame = audio_signal[j * step_length:j * step_length + fft_length]
+        cqt_spectrogram[:, j] = np.absolute(kernel @ np.fft.fft(frame))
+    return cqt_spectrogram
+
+
+def signal(n_samples: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_samples) / SR
+    return 0.5 * np.sin(2 * np.pi * 220 * t * (1 + t)) + 0.1 * rng.standard_normal(n_samples)
+
+
+@pytest.mark.parametrize("n_samples", [300, 640, 5 * SR + 17])
+def test_batched_spectrogram_matches_per_frame_loop(n_samples):
+    kernel = get_cqt_kernel(SR, dtype=np.complex128)
+    y = signal(n_samples)
+    reference = per_frame_spec(y, kernel)
+    # blocks smaller than the number of frames, and the last block partial
+    spectrogram = PyCqt._compute_cqt_spec(y, SR, TIME_RESOLUTION, kernel, block_size=7)
+    assert spectrogram.shape == reference.shape == (kernel.shape[0], n_samples // 640)
+    np.testing.assert_allclose(spectrogram, reference, rtol=0, atol=1e-9 * max(1.0, reference.max(initial=0)))
+    split = get_split_kernel(SR, dtype=np.complex128)
+    np.testing.assert_array_equal(
+        PyCqt._compute_cqt_spec(y, SR, TIME_RESOLUTION, kernel, block_size=7, split_kernel=split), spectrogram)
+
+
+def test_split_kernel_is_cached_with_the_kernel(monkeypatch):
+    PyCQT.clear_kernel_cache()
+    splits = []
+    split_kernel = PyCqt._split_kernel
+    monkeypatch.setattr(PyCqt, "_split_kernel", staticmethod(lambda kernel: splits.append(1) or split_kernel(kernel)))
+    py_cqt = PyCqt(sample_rate=SR, hop_size=0.04, dtype="float64")
+    y = signal(2 * SR)
+    first = py_cqt.compute_cqt(y)
+    np.testing.assert_array_equal(PyCqt(sample_rate=SR, hop_size=0.04, dtype="float64").compute_cqt(y), first)
+    assert len(splits) == 1
+
+
+def test_kernels_are_built_once_per_process_and_shared_on_disk(tmp_path, monkeypatch):
+    PyCQT.clear_kernel_cache()
+    builds = []
+    compute_kernel = PyCqt._compute_cqt_kernel
+    monkeypatch.setattr(PyCqt, "_compute_cqt_kernel",
+                        staticmethod(lambda *key: builds.append(key) or compute_kernel(*key)))
+    kernel = get_cqt_kernel(SR, cache_dir=str(tmp_path), dtype=np.complex128)
+    assert get_cqt_kernel(SR, cache_dir=str(tmp_path), dtype=np.complex128) is kernel
+    assert len(builds) == 1
+    # another process (here: after clearing the memo) maps the persisted kernel read-only instead of building it
+    PyCQT.clear_kernel_cache()
+    loaded = get_cqt_kernel(SR, cache_dir=str(tmp_path), dtype=np.complex128)
+    assert len(builds) == 1 and not loaded.data.flags.writeable
+    assert (loaded != kernel).nnz == 0
+    # cast on use, built and persisted in complex128 only
+    assert get_cqt_kernel(SR, cache_dir=str(tmp_path), dtype=np.complex64).dtype == np.complex64
+    assert len(builds) == 1
+
+
+def test_kernel_cache_is_bounded(monkeypatch):
+    PyCQT.clear_kernel_cache()
+    monkeypatch.setattr(PyCQT, "KERNEL_CACHE_SIZE", 2)
+    first = get_cqt_kernel(SR, min_freq=32)
+    get_cqt_kernel(SR, min_freq=64)
+    get_cqt_kernel(SR, min_freq=128)
+    assert len(PyCQT._kernel_cache) == 2
+    assert get_cqt_kernel(SR, min_freq=32) is not first
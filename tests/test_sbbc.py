@@ -0,0 +1,93 @@
+from collections import Counter
+from math import log2
+import numpy as np
+import pytest
+from YTFeatureExtractor.SBBC import SBBC
+
+
+def reference_descriptor(melody):
+    # loop implementation SBBC._compute_descriptor replaced, kept as the reference. Under numpy 1.x
+    # (requirements.txt) song[i] / 55 promotes a float32 element to float64; numpy 2 divides in float32
+    melody = np.asarray(melody, dtype=np.float64)
+
+    def to_cents(song):
+        cents = []
+        for i, f in enumerate(song):
+            if song[i] > 0:
+                cents.append(1200 * log2(song[i] / 55))
+            else:
+                cents.append(0)
+        return np.array(cents)
+
+    def to_semitones(cents):
+        semitones = []
+        for i, f in enumerate(cents):
+            semitones.append(cents[i] // 100)
+        return np.array(semitones)
+
+    def map_into_single_octave(semitones):
+        mapped = []
+        min_n = 1
+        max_n = 12
+        min_d = np.min(semitones[np.nonzero(semitones)])
+        max_d = max(semitones)
+        for i, f in enumerate(semitones):
+            if semitones[i] > 0:
+                mapped.append(((semitones[i] - min_d) * (max_n - min_n)) // (max_d - min_d) + min_n)
+            else:
+                mapped.append(0)
+        return np.array(mapped)
+
+    def get_histogram(pitch_class, hop_size=2):
+        limitator = 0
+        histogram = []
+        while limitator < len(pitch_class):
+            frame = []
+            ini = limitator
+            fin = ini + hop_size - 1
+            if fin > len(pitch_class) - 1:
+                fin = len(pitch_class) - 1
+            counter = Counter(pitch_class[ini:fin])
+            for i in range(12):
+                frame.append(counter[i + 1])
+            for x in range(len(frame)):
+                if frame[x] == 0:
+                    continue
+                num = frame[x] - min(frame)
+                denom = max(frame) - min(frame)
+                frame[x] = num / denom
+            histogram.append(frame)
+            limitator += hop_size
+        return np.array(histogram, dtype=np.single)
+
+    cents = to_cents(melody)
+    semitones = to_semitones(cents)
+    mapped = map_into_single_octave(semitones)
+    chroma = get_histogram(mapped)
+    return chroma.T
+
+
+def melody(n_frames: int, voiced: float, seed: int):
+    """Pitch contour like PredominantPitchMelodia's: float32 Hz, 0 for unvoiced frames."""
+    rng = np.random.default_rng(seed)
+    pitch = 55 * 2 ** rng.uniform(0.5, 5, n_frames)
+    return np.where(rng.random(n_frames) < voiced, pitch, 0).astype(np.float32)
+
+
+@pytest.mark.parametrize("n_frames", [2, 3, 100, 1001, 5000])
+@pytest.mark.parametrize("voiced", [0.3, 0.9, 1.0])
+def test_descriptor_matches_reference(n_frames, voiced):
+    pitch = melody(n_frames, voiced, seed=n_frames)
+    if not np.any(pitch > 55):
+        pytest.skip("reference needs a voiced frame above A1")
+    expected = reference_descriptor(pitch)
+    actual = SBBC._compute_descriptor(pitch)
+    assert actual.dtype == expected.dtype
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_descriptor_of_held_notes_matches_reference():
+    # long runs of the same note, where whole windows hold a single pitch class
+    notes = 55 * 2 ** (np.arange(24) / 12)
+    pitch = np.repeat(np.concatenate([notes, [0.0], notes[::-1]]), 7).astype(np.float32)
+    np.testing.assert_array_equal(SBBC._compute_descriptor(pitch), reference_descriptor(pitch))
@@ -0,0 +1,30 @@
+import argparse
+from YTFeatureExtractor import Scheduler
+from YTFeatureExtractor.Executor import Task, TaskResult, add_executor_args
+from YTFeatureExtractor.Scheduler import MakespanReport, estimate_makespan, longest_first
+
+
+def test_longest_first_shortens_the_makespan():
+    tasks = [Task(f"{i}.mp3", f"{i}.h5", ["cens"]) for i in range(5)]
+    costs = [1.0, 1.0, 1.0, 1.0, 4.0]
+    assert estimate_makespan(costs, 2) == 6.0
+    assert estimate_makespan(longest_first(tasks, costs)[1], 2) == 4.0
+
+
+def test_makespan_includes_worker_startup(monkeypatch):
+    clock = iter([0.0, 12.0, 13.0, 22.0, 23.0])
+    monkeypatch.setattr(Scheduler.time, "perf_counter", lambda: next(clock))
+    tasks = [Task(f"{i}.mp3", f"{i}.h5", ["cens"]) for i in range(4)]
+    report = MakespanReport()
+    report.plan(tasks, [1.0] * 4, [1.0] * 4, [1.0] * 4, 2, "input")
+    # two workers taking 2s and 3s to start, then 10s per task
+    for i, pid in enumerate([1, 2, 1, 2]):
+        report.observe(TaskResult(f"{i}.mp3", f"{i}.h5", True, None, "", {"total": 10.0}, memory={"pid": pid}))
+    summary = report.summary()
+    assert summary["startup"] == 2.5
+    assert summary["estimated"] == 22.5
+    assert summary["actual"] == 23.0
+
+
+def test_input_order_is_the_default_schedule():
+    assert add_executor_args(argparse.ArgumentParser()).parse_args([]).schedule == "input"
@@ -0,0 +1,46 @@
+import os
+import signal
+import threading
+import numpy as np
+import pytest
+from YTFeatureExtractor.Helper import ExtractionError
+from YTFeatureExtractor.Service import ExtractionService, make_server, request_features
+
+SR = 22050
+PCM = (0.1 * np.sin(np.arange(SR) / 10)).astype("<f4").tobytes()
+
+
+@pytest.fixture
+def address():
+    service = ExtractionService(["onset_env"], workers=0)
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_raw_pcm(address):
+    features, timings = request_features(address, PCM, sr=SR)
+    assert set(features) == {"onset_env"} and "extract" in timings
+
+
+def test_truncated_raw_pcm_is_a_bad_request(address):
+    with pytest.raises(ExtractionError, match="HTTP 400|not a whole number"):
+        request_features(address, PCM[:-1], sr=SR)
+    # the server keeps serving
+    assert "onset_env" in request_features(address, PCM, sr=SR)[0]
+
+
+def test_pool_is_restarted_after_a_worker_died():
+    service = ExtractionService(["onset_env"], workers=1)
+    try:
+        for pid in list(service._pool._processes):
+            os.kill(pid, signal.SIGKILL)
+        with pytest.raises(ExtractionError, match="Worker process died"):
+            service.extract(PCM, sr=SR)
+        assert "onset_env" in service.extract(PCM, sr=SR)[0]
+        assert service.stats()["errors"] == 1
+    finally:
+        service.close()
@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+import signal
+import sqlite3
+from YTFeatureExtractor.Sharding import WorkQueue, claim_batches, select_shard, shard_of
+
+YT_IDS = [f"vid{i:05d}abc" for i in range(40)]
+LEASE = 1.0
+
+
+def _claim_and_hang(path: str, claimed: multiprocessing.Queue):
+    work_queue = WorkQueue(path, lease=LEASE)
+    work_queue.add(YT_IDS)
+    claimed.put(work_queue.claim(8))
+    signal.pause()
+
+
+def _drain(path: str, done: multiprocessing.Queue):
+    with WorkQueue(path, lease=LEASE) as work_queue:
+        for claimed in claim_batches(work_queue, [YT_IDS[i:i + 10] for i in range(0, len(YT_IDS), 10)], 4):
+            for yt_id in claimed:
+                work_queue.complete(yt_id, True)
+                done.put(yt_id)
+    done.put(None)
+
+
+def test_shards_partition_ids():
+    shards = [select_shard(YT_IDS, i, 3) for i in range(3)]
+    assert sorted(sum(shards, [])) == sorted(YT_IDS)
+    assert all(shard_of(yt_id, 3) == i for i, shard in enumerate(shards) for yt_id in shard)
+
+
+def test_claimant_killed_mid_lease_is_taken_over(tmp_path):
+    path = str(tmp_path / "queue.db")
+    ctx = multiprocessing.get_context("fork")
+    claimed = ctx.Queue()
+    crashed = ctx.Process(target=_claim_and_hang, args=(path, claimed))
+    crashed.start()
+    lost = claimed.get(timeout=30)
+    os.kill(crashed.pid, signal.SIGKILL)
+    crashed.join()
+    assert len(lost) == 8
+
+    # the survivors run out of pending work while the dead node's leases are still valid
+    done = ctx.Queue()
+    nodes = [ctx.Process(target=_drain, args=(path, done)) for _ in range(3)]
+    for node in nodes:
+        node.start()
+    processed, finished = [], 0
+    while finished < len(nodes):
+        yt_id = done.get(timeout=60)
+        if yt_id is None:
+            finished += 1
+        else:
+            processed.append(yt_id)
+    for node in nodes:
+        node.join()
+
+    assert sorted(processed) == sorted(YT_IDS)
+    with sqlite3.connect(path) as conn:
+        assert dict(conn.execute("SELECT status, COUNT(*) FROM work GROUP BY status").fetchall()) == {"done": 40}
+        attempts = dict(conn.execute("SELECT yt_id, attempts FROM work").fetchall())
+    assert all(attempts[yt_id] == 2 for yt_id in lost)
+    assert all(attempts[yt_id] == 1 for yt_id in YT_IDS if yt_id not in lost)
+
+
+def test_lease_expired_too_often_is_given_up(tmp_path):
+    work_queue = WorkQueue(str(tmp_path / "queue.db"), lease=0.0, max_attempts=2)
+    work_queue.add(YT_IDS[:2])
+    assert work_queue.claim(2) == YT_IDS[:2]
+    assert work_queue.claim(2) == YT_IDS[:2]
+    assert work_queue.claim(2) == []
+    assert work_queue.counts() == {"failed": 2}
+    assert list(claim_batches(work_queue, [], 2)) == []
+    work_queue.close()
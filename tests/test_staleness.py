@@ -0,0 +1,44 @@
+import h5py
+import numpy as np
+import pytest
+from YTFeatureExtractor import Helper
+from YTFeatureExtractor.Helper import dataset_attrs, is_stale, outstanding_features
+from YTFeatureExtractor.Storage import write_feature
+
+FEAT_KEYS = ["cens", "onset_env"]
+
+
+@pytest.fixture
+def output_file(tmp_path, monkeypatch):
+    monkeypatch.delenv("YTFE_FEATURE_STORE", raising=False)
+    monkeypatch.setenv("YTFE_PRECISION", "float64")
+    output_file = str(tmp_path / "vid00000abc.h5")
+    with h5py.File(output_file, "w") as file_out:
+        for feat_key in FEAT_KEYS:
+            write_feature(file_out, feat_key, np.ones((12, 10)), attrs=dataset_attrs(feat_key))
+    return output_file
+
+
+def test_unchanged_rerun_has_nothing_outstanding(output_file):
+    assert outstanding_features(output_file, "vid00000abc", FEAT_KEYS + ["cqt_20"]) == ["cqt_20"]
+    with h5py.File(output_file, "r") as file_out:
+        assert not any(is_stale(file_out, feat_key) for feat_key in FEAT_KEYS)
+
+
+def test_version_bump_makes_a_feature_stale(output_file, monkeypatch):
+    monkeypatch.setitem(Helper.FEAT_VERSIONS, "cens", "2")
+    assert outstanding_features(output_file, "vid00000abc", FEAT_KEYS) == ["cens"]
+
+
+def test_params_change_makes_a_feature_stale(output_file, monkeypatch):
+    monkeypatch.setitem(Helper.FEAT_PARAMS, "onset_env", dict(Helper.FEAT_PARAMS["onset_env"], n_mels=64))
+    assert outstanding_features(output_file, "vid00000abc", FEAT_KEYS) == ["onset_env"]
+    # precision and codec are part of the params of every feature
+    monkeypatch.setenv("YTFE_PRECISION", "float32")
+    assert outstanding_features(output_file, "vid00000abc", FEAT_KEYS) == FEAT_KEYS
+
+
+def test_features_without_versions_are_stale(output_file):
+    with h5py.File(output_file, "a") as file_out:
+        del file_out["cens"].attrs["version"]
+    assert outstanding_features(output_file, "vid00000abc", FEAT_KEYS) == ["cens"]
@@ -0,0 +1,58 @@
+import json
+import h5py
+import numpy as np
+import pytest
+from YTFeatureExtractor import Storage
+from YTFeatureExtractor.Helper import feature_attrs
+from YTFeatureExtractor.Storage import (StoragePolicy, decode, encode, format_policy, parse_policies, parse_policy,
+                                        read_feature, write_feature)
+
+
+@pytest.mark.parametrize("spec", ["gzip/256", "gzip:4+float16/512", "lzf+uint8/", "none/64", "blosc_lz4:5+uint8/128"])
+def test_policy_round_trip(spec):
+    policy = parse_policy(spec)
+    assert format_policy(policy, chunks=True) == spec
+    assert parse_policy(format_policy(policy, chunks=True)) == policy
+
+
+def test_policy_parsing():
+    assert parse_policy("lzf") == StoragePolicy("lzf", None, 256, None)
+    assert parse_policy("+float16") == StoragePolicy("gzip", None, 256, "float16")
+    assert parse_policies("lzf,cqt_ch=gzip:4+float16") == {None: parse_policy("lzf"),
+                                                          "cqt_ch": StoragePolicy("gzip", 4, 256, "float16")}
+    with pytest.raises(ValueError):
+        parse_policy("zstd")
+    with pytest.raises(ValueError):
+        parse_policy("gzip+int4")
+
+
+def test_quantization_round_trip():
+    data = np.random.default_rng(0).normal(size=(12, 100))
+    quantized, attrs = encode(data, parse_policy("+uint8"))
+    assert quantized.dtype == np.uint8
+    decoded = decode(quantized, attrs)
+    assert decoded.dtype == data.dtype
+    assert np.max(np.abs(decoded - data)) <= attrs["scale"] / 2 + 1e-12
+    quantized, attrs = encode(data, parse_policy("+float16"))
+    np.testing.assert_allclose(decode(quantized, attrs), data, rtol=1e-3, atol=1e-4)
+    # constant features keep a usable scale
+    quantized, attrs = encode(np.full(5, 2.0), parse_policy("+uint8"))
+    np.testing.assert_array_equal(decode(quantized, attrs), np.full(5, 2.0))
+
+
+@pytest.mark.parametrize("spec", ["none", "lzf/16", "gzip:9+float16", "gzip+uint8/"])
+def test_write_read_round_trip(spec):
+    data = np.random.default_rng(0).normal(size=(12, 100))
+    with h5py.File("round_trip.h5", "w", driver="core", backing_store=False) as f:
+        dataset = write_feature(f, "cens", data, parse_policy(spec))
+        assert dataset.compression == {"none": None}.get(parse_policy(spec).codec, parse_policy(spec).codec)
+        encoded, attrs = encode(data, parse_policy(spec))
+        np.testing.assert_array_equal(read_feature(f, "cens"), decode(encoded, attrs))
+
+
+def test_blosc_fallback_records_lzf(monkeypatch):
+    monkeypatch.setattr(Storage, "_has_hdf5plugin", lambda: False)
+    monkeypatch.setenv("YTFE_STORAGE_POLICY", "blosc_lz4:5+float16")
+    assert json.loads(feature_attrs("cens")["params"])["codec"] == "lzf+float16"
+    with h5py.File("fallback.h5", "w", driver="core", backing_store=False) as f:
+        assert write_feature(f, "cens", np.ones((12, 10))).compression == "lzf"
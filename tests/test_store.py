@@ -0,0 +1,50 @@
+import os
+import numpy as np
+from YTFeatureExtractor.Store import ShardedStore
+
+
+def features(seed: int, frames: int):
+    rng = np.random.default_rng(seed)
+    return {"cqt_20": rng.random((20, frames)), "onset_env": rng.random(frames)}
+
+
+def test_compact_reclaims_deleted_and_replaced_features(tmp_path):
+    root = str(tmp_path)
+    writer = ShardedStore(root, num_shards=2)
+    for i in range(4):
+        writer.write(f"vid{i:05d}abc", features(i, 500))
+    writer.delete("vid00001abc", "cqt_20")
+    writer.delete("vid00001abc", "onset_env")
+    writer.write("vid00002abc", features(12, 300))
+    writer.close()
+    size = os.path.getsize(os.path.join(root, "shard_0000.h5"))
+
+    store = ShardedStore(root, num_shards=2)
+    reclaimed = store.compact()
+    assert 0 < reclaimed < size
+    assert not os.path.exists(os.path.join(root, "shard_0000.h5"))
+    assert os.path.exists(os.path.join(root, "shard_0002.h5"))
+    expected = {"vid00000abc": features(0, 500), "vid00002abc": features(12, 300), "vid00003abc": features(3, 500)}
+    for feat_key in ["cqt_20", "onset_env"]:
+        read = store.read([f"vid{i:05d}abc" for i in range(4)], feat_key)
+        assert sorted(read) == sorted(expected)
+        for yt_id, data in read.items():
+            np.testing.assert_array_equal(data, expected[yt_id][feat_key])
+    # nothing left to reclaim
+    assert store.compact() == 0
+    store.close()
+
+
+def test_compact_skips_shards_being_written(tmp_path):
+    root = str(tmp_path)
+    writer = ShardedStore(root)
+    writer.write("vid00000abc", features(0, 100))
+    writer.delete("vid00000abc", "cqt_20")
+    store = ShardedStore(root)
+    assert store.compact() == 0
+    assert os.path.exists(writer.shard_path(0))
+    writer.close()
+    assert store.compact() > 0
+    np.testing.assert_array_equal(store.read(["vid00000abc"], "onset_env")["vid00000abc"],
+                                  features(0, 100)["onset_env"])
+    store.close()
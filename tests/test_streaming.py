@@ -0,0 +1,87 @@
+import tracemalloc
+import h5py
+import librosa
+import numpy as np
+import pytest
+import soundfile
+from YTFeatureExtractor.Audio import AudioProvider, StreamedAudio
+from YTFeatureExtractor.Helper import extract_features
+from YTFeatureExtractor.Storage import read_feature
+from YTFeatureExtractor.Streaming import STFT_CONTEXT, TuningEstimate, extract_features_streaming, frame_blocks
+
+SR = 22050
+HOP = 512
+
+
+def tonal(duration: float, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    n_samples = int(duration * SR)
+    notes = 440 * 2 ** (rng.integers(-12, 12, int(duration * 2)) / 12 + 0.3 / 12)
+    freqs = np.repeat(notes, n_samples // len(notes) + 1)[:n_samples]
+    return (0.3 * np.sin(2 * np.pi * np.cumsum(freqs) / SR) + 0.05 * rng.standard_normal(n_samples)).astype(np.float32)
+
+
+def noise(duration: float, seed: int = 0):
+    return np.random.default_rng(seed).uniform(-0.3, 0.3, int(duration * SR)).astype(np.float32)
+
+
+def chirp(duration: float, seed: int = 0):
+    # flat residual histogram: the peak depends on the peaks right at the median magnitude
+    t = np.arange(int(duration * SR)) / SR
+    return (0.5 * np.sin(2 * np.pi * (100 * t + 3900 / (2 * duration) * t ** 2))).astype(np.float32)
+
+
+def stft_blocks(y: np.array, block_frames: int = 431):
+    stft_mag = lambda segment: np.abs(librosa.stft(y=segment, n_fft=2048, hop_length=HOP))
+    return frame_blocks(y, HOP, 1 + len(y) // HOP, block_frames, STFT_CONTEXT, stft_mag)
+
+
+def streamed_tuning(y: np.array):
+    tuning = TuningEstimate(SR, bins_per_octave=36)
+    for S in stft_blocks(y):
+        tuning.add(S)
+    while tuning.refine():
+        for S in stft_blocks(y):
+            tuning.add(S)
+    return tuning.estimate()
+
+
+@pytest.mark.parametrize("signal", [tonal, noise, chirp])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_streamed_tuning_equals_estimate_tuning(signal, seed):
+    y = signal(60, seed)
+    S = np.abs(librosa.stft(y=y, n_fft=2048, hop_length=HOP))
+    assert streamed_tuning(y) == librosa.estimate_tuning(S=S, sr=SR, bins_per_octave=36)
+
+
+@pytest.mark.parametrize("signal", [tonal, chirp])
+def test_streamed_cens_equals_in_memory(tmp_path, signal):
+    y = signal(60)
+    path = str(tmp_path / "track.wav")
+    soundfile.write(path, y, SR, subtype="FLOAT")
+    audio = StreamedAudio(path, sr=SR)
+    try:
+        with h5py.File(tmp_path / "streamed.h5", "w") as streamed, h5py.File(tmp_path / "memory.h5", "w") as memory:
+            # blocks of 20s: the tuning and the chroma are both gathered over several blocks
+            assert extract_features_streaming(audio, ["cens"], streamed, block_seconds=20) == []
+            assert extract_features(AudioProvider(sr=SR, y=y), ["cens"], memory) == []
+            np.testing.assert_allclose(read_feature(streamed, "cens"), read_feature(memory, "cens"), atol=1e-5)
+    finally:
+        audio.close()
+
+
+def test_tuning_estimate_memory_does_not_grow_with_the_track():
+    block = np.abs(librosa.stft(y=noise(20), n_fft=2048, hop_length=HOP))
+    tuning = TuningEstimate(SR, bins_per_octave=36)
+    tuning.add(block)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for _ in range(20):
+            tuning.add(block)
+        retained = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    # an hour of 3 minute blocks retains nothing beyond the fixed size histogram
+    assert retained < 10 ** 5
+    assert tuning.total == 21 * np.count_nonzero(librosa.piptrack(S=block, sr=SR)[0])
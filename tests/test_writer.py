@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import h5py
+import numpy as np
+import pytest
+from YTFeatureExtractor import Writer
+from YTFeatureExtractor.Executor import TaskResult
+from YTFeatureExtractor.Helper import dataset_attrs
+from YTFeatureExtractor.Storage import read_feature, write_feature
+from YTFeatureExtractor.Writer import AsyncWriter, worker_jobs
+
+
+@pytest.fixture(autouse=True)
+def h5_output(monkeypatch):
+    monkeypatch.delenv("YTFE_FEATURE_STORE", raising=False)
+
+
+def result(output_file: str, write_job: str, success: bool = True, reason: str = None):
+    return TaskResult(output_file.replace(".h5", ".mp3"), output_file, success, reason, "", {},
+                      ("cens", "onset_env"), write_job=write_job)
+
+
+def submit(writer: AsyncWriter, output_file: str, feat_key: str, value: float, failed=()):
+    writer.handle.submit(os.path.basename(output_file)[:-3], output_file, {feat_key: np.full((12, 4), value)},
+                         {feat_key: dataset_attrs(feat_key)}, failed)
+    return writer.handle.take()
+
+
+def written(writer: AsyncWriter, results):
+    results = list(writer.merge(results))
+    assert not writer._outcomes and not writer._waiting
+    return results
+
+
+def test_results_are_released_once_acknowledged(tmp_path):
+    output_file = str(tmp_path / "vid00000abc.h5")
+    with AsyncWriter(2) as writer:
+        job = submit(writer, output_file, "cens", 1.0)
+        failed_job = submit(writer, str(tmp_path / "vid00001abc.h5"), "onset_env", 2.0, failed=["cens"])
+        results = written(writer, [result(output_file, job), result(str(tmp_path / "vid00001abc.h5"), failed_job,
+                                                                     False, "feature_error")])
+    assert results[0].success
+    assert results[1].reason == "feature_error" and results[1].failed_keys == ("cens",)
+    with h5py.File(output_file, "r") as file_out:
+        np.testing.assert_array_equal(read_feature(file_out, "cens"), np.full((12, 4), 1.0))
+
+
+def test_features_are_merged_into_an_existing_file(tmp_path):
+    output_file = str(tmp_path / "vid00000abc.h5")
+    with h5py.File(output_file, "w") as file_out:
+        write_feature(file_out, "cens", np.zeros((12, 4)), attrs=dataset_attrs("cens"))
+        write_feature(file_out, "onset_env", np.zeros(4), attrs=dataset_attrs("onset_env"))
+    with AsyncWriter(2) as writer:
+        assert written(writer, [result(output_file, submit(writer, output_file, "cens", 3.0))])[0].success
+    with h5py.File(output_file, "r") as file_out:
+        np.testing.assert_array_equal(read_feature(file_out, "cens"), np.full((12, 4), 3.0))
+        np.testing.assert_array_equal(read_feature(file_out, "onset_env"), np.zeros(4))
+        assert file_out["cens"].attrs["version"] == dataset_attrs("cens")["version"]
+
+
+@pytest.mark.parametrize("fsync,syncs", [("none", 0), ("file", 4), ("batch", 2)])
+def test_fsync_policies(tmp_path, monkeypatch, fsync, syncs):
+    # the writer process is forked: it logs its syncs to a file
+    log = tmp_path / "syncs.log"
+    monkeypatch.setattr(Writer, "sync_output", lambda output_file: open(log, "a").write(output_file + "\n"))
+    output_files = [str(tmp_path / f"vid0000{i}abc.h5") for i in range(2)]
+    writer = AsyncWriter(8, fsync)
+    # four jobs on two files, queued before the writer starts so it takes them as one batch
+    jobs = [submit(writer, output_files[i % 2], feat_key, 1.0) for i, feat_key in
+            enumerate(["cens", "cens", "onset_env", "onset_env"])]
+    with writer:
+        results = written(writer, [result(output_files[i % 2], job) for i, job in enumerate(jobs)])
+    assert all(result.success for result in results)
+    synced = log.read_text().split() if log.exists() else []
+    assert len(synced) == syncs and set(synced) <= set(output_files)
+
+
+def _submit_and_die(handle: Writer.WriterHandle, output_file: str):
+    handle.submit("vid00000abc", output_file, {"cens": np.ones((12, 4))}, {"cens": dataset_attrs("cens")})
+    # wait for the queue's feeder thread, as a worker killed later in the task would
+    handle.jobs.close()
+    handle.jobs.join_thread()
+    os._exit(1)
+
+
+def test_worker_killed_after_submitting_is_reconciled(tmp_path):
+    output_file = str(tmp_path / "vid00000abc.h5")
+    with AsyncWriter(2) as writer:
+        process = multiprocessing.get_context("fork").Process(target=_submit_and_die, args=(writer.handle, output_file))
+        process.start()
+        process.join()
+        killed = result(output_file, worker_jobs(process.pid), False, "timeout")
+        # a worker that died before submitting anything keeps its failure
+        other = result(str(tmp_path / "vid00001abc.h5"), worker_jobs(process.pid + 10 ** 6), False, "exception")
+        results = written(writer, [killed, other])
+    assert results[0].success and results[0].reason is None
+    assert results[1].reason == "exception"
+    with h5py.File(output_file, "r") as file_out:
+        assert "cens" in file_out